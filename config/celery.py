@@ -11,3 +11,6 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.conf.broker_connection_retry_on_startup = True
 
 app.autodiscover_tasks()
+
+# Метрики задач: время выполнения и ожидания в очереди (см. config.metrics)
+from config import metrics  # noqa: E402,F401
@@ -0,0 +1,149 @@
+import glob
+import hmac
+import ipaddress
+import os
+import time
+
+from celery.signals import before_task_publish, task_prerun, task_postrun
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+# Метрики собираются в памяти процесса. Если задана переменная окружения PROMETHEUS_MULTIPROC_DIR,
+# значения пишутся в файлы этого каталога, и /metrics суммирует метрики всех процессов
+# (воркеров веб-сервера и Celery), которые используют один каталог. Если задана PROMETHEUS_MULTIPROC_ROOT,
+# суммируются метрики всех ее подкаталогов: у каждого контейнера свой каталог (см. docker/metrics-dir.sh),
+# поэтому перезапуск одного контейнера не удаляет файлы процессов других.
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки HTTP-запроса',
+                            ['view', 'method'])
+RESPONSES = Counter('http_responses_total', 'Количество HTTP-ответов', ['view', 'method', 'status'])
+REQUEST_DB_QUERIES = Histogram('http_request_db_queries', 'Количество запросов к базе данных на HTTP-запрос',
+                               ['view', 'method'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000))
+TASK_RUNTIME = Histogram('celery_task_runtime_seconds', 'Время выполнения задачи Celery', ['task', 'state'],
+                         buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800))
+TASK_QUEUE_WAIT = Histogram('celery_task_queue_wait_seconds', 'Время ожидания задачи Celery в очереди', ['task'],
+                            buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800))
+
+# Названия действий обобщенных представлений DRF по HTTP-методу
+METHOD_ACTIONS = {'post': 'create', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+UNRESOLVED_VIEW = '<unresolved>'
+
+# Время начала выполняемых задач: {id задачи: время}
+_task_started = {}
+
+
+def get_view_name(request):
+    """
+    Возвращает название представления для меток метрик: <класс>.<действие> для представлений DRF
+    (CourseViewSet.list, TestResultListCreateAPIView.create), имя маршрута для остальных.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNRESOLVED_VIEW
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(method, method)
+    elif method in ('get', 'head'):
+        action = 'retrieve' if match.kwargs else 'list'
+    else:
+        action = METHOD_ACTIONS.get(method, method)
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """ Записывает время обработки, код ответа и количество запросов к базе данных для каждого HTTP-запроса. """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view = get_view_name(request)
+        REQUEST_LATENCY.labels(view, request.method).observe(elapsed)
+        RESPONSES.labels(view, request.method, response.status_code).inc()
+        REQUEST_DB_QUERIES.labels(view, request.method).observe(query_count)
+        return response
+
+
+class MultiDirectoryCollector:
+    """ Суммирует метрики процессов из всех подкаталогов root (по каталогу PROMETHEUS_MULTIPROC_DIR на контейнер). """
+
+    def __init__(self, root):
+        self.root = root
+
+    def collect(self):
+        files = glob.glob(os.path.join(self.root, '*', '*.db'))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def get_metrics_registry():
+    """ Возвращает реестр, метрики которого отдаются на /metrics. """
+    if os.environ.get('PROMETHEUS_MULTIPROC_ROOT'):
+        registry = CollectorRegistry()
+        registry.register(MultiDirectoryCollector(os.environ['PROMETHEUS_MULTIPROC_ROOT']))
+        return registry
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def is_metrics_access_allowed(request):
+    """ Проверяет доступ к метрикам: по токену METRICS_TOKEN или по адресу клиента из METRICS_ALLOWED_IPS. """
+    token = settings.METRICS_TOKEN
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network.strip(), strict=False)
+               for network in settings.METRICS_ALLOWED_IPS if network.strip())
+
+
+def metrics_view(request):
+    """ Отдает метрики в текстовом формате Prometheus. """
+    if not is_metrics_access_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(get_metrics_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+@before_task_publish.connect
+def remember_publish_time(headers=None, **kwargs):
+    """ Добавляет к сообщению задачи время постановки в очередь. """
+    if headers is not None:
+        headers['published_at'] = time.time()
+
+
+@task_prerun.connect
+def task_started(task_id=None, task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at is not None:
+        TASK_QUEUE_WAIT.labels(task.name).observe(max(time.time() - published_at, 0))
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def task_finished(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.labels(task.name, state or 'UNKNOWN').observe(time.perf_counter() - started)
@@ -0,0 +1,97 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Значения в тексте запроса заменяются на ?, списки IN (...) сворачиваются: запросы одной формы,
+# отличающиеся только параметрами, считаются повторами (типичный признак N+1)
+STRING_LITERAL = re.compile(r"'(?:''|[^'])*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\s*\?\s*,)*\s*\?\s*\)', re.IGNORECASE)
+
+
+def get_query_shape(sql):
+    """ Возвращает форму запроса: текст без значений параметров. """
+    shape = STRING_LITERAL.sub('?', sql.replace('%s', '?'))
+    shape = NUMBER_LITERAL.sub('?', shape)
+    return IN_LIST.sub('IN (...)', shape)
+
+
+class QueryRecorder:
+    """ Обертка выполнения запросов (connection.execute_wrapper): считает запросы, их время и повторы. """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+            self.shapes[get_query_shape(sql)] += 1
+
+    @property
+    def duplicates(self):
+        """ Количество точных повторов (тот же запрос с теми же параметрами). """
+        return sum(count - 1 for count in self.statements.values())
+
+    def get_repeated(self, threshold):
+        """ Возвращает формы запросов, выполненных не меньше threshold раз. """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Для доли запросов SQL_INSTRUMENTATION_SAMPLE_RATE считает запросы к базе данных и их суммарное время,
+    точные повторы и повторы одной формы (N+1). Результат добавляется в заголовок Server-Timing
+    и записывается в журнал одной строкой JSON; запрос с повторами одной формы не реже
+    SQL_REPEATED_QUERY_THRESHOLD раз записывается с уровнем WARNING.
+
+    Остальные запросы не инструментируются, поэтому при небольшой доле накладные расходы незаметны.
+    Запросы, выполняемые при отдаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SQL_INSTRUMENTATION_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = (f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+                                     f'app;dur={total * 1000:.2f}')
+        repeated = recorder.get_repeated(settings.SQL_REPEATED_QUERY_THRESHOLD)
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'event': 'sql',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'duplicates': recorder.duplicates,
+            'repeated': [{'sql': shape[:300], 'count': count} for shape, count in repeated],
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record, ensure_ascii=False))
+        return response
@@ -20,11 +20,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework_simplejwt',
     'drf_yasg',
     'corsheaders',
+    'django_celery_beat',
 
     'users',
     'materials',
@@ -32,6 +34,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первыми, чтобы учитывались время и запросы к базе данных всех остальных middleware
+    'config.metrics.MetricsMiddleware',
+    'config.middleware.SQLInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -132,6 +137,67 @@ CSRF_TRUSTED_ORIGINS = [
 
 CORS_ALLOW_ALL_ORIGINS = False
 
+# Запрещенные слова в названиях материалов и текстах вопросов/ответов (см. materials.validators).
+# Если задан FORBIDDEN_WORDS_FILE, слова читаются из файла (по одному в строке), изменения подхватываются
+# без перезапуска: время изменения файла проверяется не чаще раза в FORBIDDEN_WORDS_CHECK_INTERVAL секунд.
+FORBIDDEN_WORDS = ["казино", "криптовалюта", "крипта", "биржа", "обман", "полиция", "радар"]
+FORBIDDEN_WORDS_FILE = os.getenv('FORBIDDEN_WORDS_FILE')
+FORBIDDEN_WORDS_CHECK_INTERVAL = int(os.getenv('FORBIDDEN_WORDS_CHECK_INTERVAL') or 5)
+
+CACHE_ENABLED = os.getenv('CACHE_ENABLED') == 'True'
+
+if CACHE_ENABLED:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv('LOCATION'),
+        }
+    }
+
+# Время жизни закешированного дерева курса (курс, модули, уроки) в секундах
+COURSE_TREE_CACHE_TIMEOUT = int(os.getenv('COURSE_TREE_CACHE_TIMEOUT') or 60 * 60)
+
+# Ключи ответов тестов (см. tests.answer_keys): сколько ключей хранится в памяти процесса
+# и время жизни ключа в Redis в секундах
+ANSWER_KEY_CACHE_SIZE = int(os.getenv('ANSWER_KEY_CACHE_SIZE') or 1024)
+ANSWER_KEY_CACHE_TIMEOUT = int(os.getenv('ANSWER_KEY_CACHE_TIMEOUT') or 24 * 60 * 60)
+
+# Курсы, в которых больше уроков, вопросов и ответов, копируются в фоновой задаче Celery
+COURSE_CLONE_ASYNC_THRESHOLD = int(os.getenv('COURSE_CLONE_ASYNC_THRESHOLD') or 5000)
+
+# Уменьшенные копии изображений уроков и аватаров (см. materials.images): размеры - максимальная сторона
+# в пикселях, форматы - webp и/или jpeg
+IMAGE_DERIVATIVE_SIZES = [int(size) for size in (os.getenv('IMAGE_DERIVATIVE_SIZES') or '160,480').split(',')]
+IMAGE_DERIVATIVE_FORMATS = (os.getenv('IMAGE_DERIVATIVE_FORMATS') or 'webp,jpeg').split(',')
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY') or 80)
+
+# Инструментирование запросов к базе данных (см. config.middleware): доля инструментируемых HTTP-запросов
+# (0 - отключено, 1 - все запросы) и количество повторов запроса одной формы, при котором запрос отмечается как N+1
+SQL_INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('SQL_INSTRUMENTATION_SAMPLE_RATE') or 0)
+SQL_REPEATED_QUERY_THRESHOLD = int(os.getenv('SQL_REPEATED_QUERY_THRESHOLD') or 5)
+
+# Доступ к метрикам Prometheus (/metrics, см. config.metrics): с адресов или подсетей METRICS_ALLOWED_IPS
+# (через запятую) или с заголовком "Authorization: Bearer <METRICS_TOKEN>", если токен задан
+METRICS_ALLOWED_IPS = (os.getenv('METRICS_ALLOWED_IPS') or '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'config.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
@@ -139,6 +205,31 @@ CELERY_TASK_TIME_LIMIT = 30 * 60
 CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
 
+# Уведомления преподавателей о зачислениях: immediate - письмо на каждое зачисление,
+# digest - зачисления накапливаются и раз в ENROLLMENT_DIGEST_INTERVAL минут отправляются одной сводкой
+ENROLLMENT_NOTIFICATION_MODE = os.getenv('ENROLLMENT_NOTIFICATION_MODE') or 'immediate'
+ENROLLMENT_DIGEST_INTERVAL = int(os.getenv('ENROLLMENT_DIGEST_INTERVAL') or 60)
+
+# Оценка результатов тестов: sync - при создании результата, async - в задаче Celery в отдельной очереди
+# grading (результат создается в статусе pending, клиент опрашивает GET /tests/results/<id>/)
+GRADING_MODE = os.getenv('GRADING_MODE') or 'sync'
+
+CELERY_TASK_ROUTES = {
+    'tests.tasks.grade_result_task': {'queue': 'grading'},
+    'tests.tasks.grade_pending_results': {'queue': 'grading'},
+}
+
+CELERY_BEAT_SCHEDULE = {
+    'send-enrollment-digests': {
+        'task': 'materials.tasks.send_enrollment_digests',
+        'schedule': timedelta(minutes=ENROLLMENT_DIGEST_INTERVAL),
+    },
+    'grade-pending-results': {
+        'task': 'tests.tasks.grade_pending_results',
+        'schedule': timedelta(minutes=5),
+    },
+}
+
 EMAIL_HOST = os.getenv('EMAIL_HOST')
 EMAIL_PORT = os.getenv('EMAIL_PORT')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
@@ -0,0 +1,8 @@
+#!/bin/sh
+# Запускает команду с отдельным каталогом метрик контейнера в общем томе PROMETHEUS_MULTIPROC_ROOT.
+# При старте очищается только каталог этого контейнера: файлы процессов других контейнеров
+# (воркеров Celery) не затрагиваются, /metrics суммирует метрики всех подкаталогов (см. config.metrics).
+export PROMETHEUS_MULTIPROC_DIR="$PROMETHEUS_MULTIPROC_ROOT/$(hostname)"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+exec "$@"
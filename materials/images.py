@@ -0,0 +1,166 @@
+import io
+import posixpath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+# Отправляется после записи (или очистки) производных изображений объекта условным UPDATE, который
+# не вызывает post_save: получатели обновляют версии и кеши, зависящие от объекта (см. materials.signals).
+# Аргументы: sender - модель, pk, field_name.
+derivatives_updated = Signal()
+
+# Поля изображений, для которых создаются уменьшенные копии: (модель, поле)
+DERIVATIVE_IMAGE_FIELDS = (
+    ('materials.Lesson', 'image'),
+    ('users.User', 'avatar'),
+)
+
+# Форматы производных изображений: имя формата Pillow и расширение файла
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+
+def get_derivatives_field(field_name):
+    """ Возвращает имя поля, в котором хранятся производные изображения поля field_name. """
+    return f'{field_name}_derivatives'
+
+
+def get_derivative_name(source_name, size, image_format):
+    """ Возвращает путь производного изображения: <папка оригинала>/derivatives/<имя>_<размер>.<расширение>. """
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derivatives', f'{stem}_{size}.{DERIVATIVE_FORMATS[image_format][1]}')
+
+
+def resize_image(image, size):
+    """ Уменьшает изображение до размера size x size с сохранением пропорций (увеличение не выполняется). """
+    derivative = image.copy()
+    derivative.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return derivative
+
+
+def encode_image(image, image_format):
+    """ Кодирует изображение в формат производного изображения. """
+    pillow_format, _ = DERIVATIVE_FORMATS[image_format]
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, quality=settings.IMAGE_DERIVATIVE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def delete_derivatives(storage, derivatives):
+    """ Удаляет файлы производных изображений из хранилища. """
+    for formats in (derivatives or {}).get('sizes', {}).values():
+        for name in formats.values():
+            storage.delete(name)
+
+
+def release_derivatives(model, field_name, storage, derivatives):
+    """
+    Удаляет файлы производных изображений, если исходное изображение больше не используется
+    ни одним объектом (копии курса ссылаются на те же файлы, что и оригинал).
+    """
+    source = (derivatives or {}).get('source')
+    if source and not model.objects.filter(**{field_name: source}).exists():
+        delete_derivatives(storage, derivatives)
+
+
+def generate_derivatives(model_label, pk, field_name, force=False):
+    """
+    Создает уменьшенные копии изображения объекта в размерах IMAGE_DERIVATIVE_SIZES
+    и форматах IMAGE_DERIVATIVE_FORMATS и записывает их пути в поле <field_name>_derivatives.
+
+    Запись выполняется условным UPDATE: если за время обработки загрузили другое изображение,
+    результат отбрасывается (производные для нового изображения создаст следующая задача).
+    Возвращает True, если производные изображения были созданы.
+    """
+    model = apps.get_model(model_label)
+    derivatives_field = get_derivatives_field(field_name)
+    instance = model.objects.filter(pk=pk).only(field_name, derivatives_field).first()
+    if instance is None:
+        return False
+
+    field_file = getattr(instance, field_name)
+    old_derivatives = getattr(instance, derivatives_field) or {}
+    if not field_file:
+        if old_derivatives:
+            release_derivatives(model, field_name, field_file.storage, old_derivatives)
+            without_image = Q(**{field_name: ''}) | Q(**{f'{field_name}__isnull': True})
+            if model.objects.filter(without_image, pk=pk).update(**{derivatives_field: None}):
+                derivatives_updated.send(sender=model, pk=pk, field_name=field_name)
+        return False
+    if not force and old_derivatives.get('source') == field_file.name:
+        return False
+
+    max_size = max(settings.IMAGE_DERIVATIVE_SIZES)
+    with field_file.open('rb'):
+        image = Image.open(field_file)
+        # Для JPEG декодирование сразу выполняется в уменьшенном масштабе (не меньше максимального размера)
+        image.draft('RGB', (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    storage = field_file.storage
+    sizes = {}
+    for size in settings.IMAGE_DERIVATIVE_SIZES:
+        resized = resize_image(image, size)
+        sizes[str(size)] = {}
+        for image_format in settings.IMAGE_DERIVATIVE_FORMATS:
+            name = get_derivative_name(field_file.name, size, image_format)
+            if storage.exists(name):
+                storage.delete(name)
+            sizes[str(size)][image_format] = storage.save(name, ContentFile(encode_image(resized, image_format)))
+
+    derivatives = {'source': field_file.name, 'sizes': sizes}
+    updated = model.objects.filter(pk=pk, **{field_name: field_file.name}).update(**{derivatives_field: derivatives})
+    if not updated:
+        release_derivatives(model, field_name, storage, derivatives)
+        return False
+    if old_derivatives.get('source') != field_file.name:
+        release_derivatives(model, field_name, storage, old_derivatives)
+    derivatives_updated.send(sender=model, pk=pk, field_name=field_name)
+    return True
+
+
+def schedule_derivatives(instance, field_name):
+    """
+    Ставит в очередь создание производных изображений после фиксации транзакции,
+    если изображение объекта изменилось с момента последней обработки.
+    """
+    from materials.tasks import generate_image_derivatives
+
+    field_file = getattr(instance, field_name)
+    derivatives = getattr(instance, get_derivatives_field(field_name)) or {}
+    if (field_file.name or None) == derivatives.get('source'):
+        return
+    model_label = instance._meta.label
+    pk = instance.pk
+    transaction.on_commit(lambda: generate_image_derivatives.delay(model_label, pk, field_name))
+
+
+def get_derivative_urls(instance, field_name, request=None):
+    """
+    Возвращает ссылки на производные изображения в виде {размер: {формат: url}}.
+    При наличии запроса ссылки абсолютные, как у ImageField в DRF.
+    """
+    field_file = getattr(instance, field_name)
+    derivatives = getattr(instance, get_derivatives_field(field_name)) or {}
+    if not field_file or derivatives.get('source') != field_file.name:
+        return {}
+    urls = {}
+    for size, formats in derivatives.get('sizes', {}).items():
+        urls[size] = {}
+        for image_format, name in formats.items():
+            url = field_file.storage.url(name)
+            urls[size][image_format] = request.build_absolute_uri(url) if request is not None else url
+    return urls
@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from materials.images import DERIVATIVE_IMAGE_FIELDS, generate_derivatives, get_derivatives_field
+from materials.services import _chunks
+
+BATCH_SIZE = 1000
+
+
+def iter_pending(model_label, field_name, force=False):
+    """ Возвращает задания (модель, pk, поле) для объектов, у изображений которых нет актуальных копий. """
+    model = apps.get_model(model_label)
+    queryset = model.objects.exclude(Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''}))
+    rows = queryset.values_list('pk', field_name, f'{get_derivatives_field(field_name)}__source')
+    for pk, name, source in rows.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        if force or name != source:
+            yield model_label, pk, field_name
+
+
+def process(job):
+    """ Создает копии изображения одного объекта в процессе пула, ошибка не прерывает остальные задания. """
+    model_label, pk, field_name, force = job
+    try:
+        return generate_derivatives(model_label, pk, field_name, force=force), None
+    except Exception as error:
+        return False, f'{model_label} {pk}: {error}'
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии для уже загруженных изображений уроков и аватаров в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Количество процессов (0 - обработка в текущем процессе)')
+        parser.add_argument('--force', action='store_true', help='Пересоздать копии для всех изображений')
+
+    def handle(self, *args, **options):
+        force = options['force']
+        workers = options['workers']
+        created = failed = 0
+
+        pool = None
+        if workers:
+            # Процессы запускаются через spawn, чтобы не наследовать открытые соединения с базой данных
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+        try:
+            for model_label, field_name in DERIVATIVE_IMAGE_FIELDS:
+                for batch in _chunks(iter_pending(model_label, field_name, force), BATCH_SIZE):
+                    jobs = [(*job, force) for job in batch]
+                    results = pool.map(process, jobs, chunksize=10) if pool else map(process, jobs)
+                    for done, error in results:
+                        created += done
+                        if error:
+                            failed += 1
+                            self.stderr.write(error)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(f'Создано копий: {created}, ошибок: {failed}')
@@ -0,0 +1,278 @@
+import io
+import json
+import math
+import statistics
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection, transaction
+from django.test import override_settings
+from django.urls import get_resolver, reverse
+from rest_framework.test import APIClient
+
+from materials.pagination import MyPagination
+from users.models import User
+
+URL_MODULES = ('materials', 'tests', 'users')
+ROLES = ('admin', 'teacher', 'student')
+BUDGET_FIELDS = ('queries', 'p95_ms', 'bytes')
+DEFAULT_BUDGETS = settings.BASE_DIR / 'benchmarks' / 'endpoint_budgets.json'
+
+# Обязательные параметры запросов. Результаты без курсорного режима отдаются целиком,
+# поэтому для сравнения размеров страниц они запрашиваются с курсорной пагинацией.
+ROUTE_PARAMS = {
+    'materials:search': {'q': 'курс'},
+    'tests:results': {'pagination': 'cursor'},
+}
+
+# Объемы данных (аргументы seed_lms) для проверки роста количества запросов с объемом данных.
+# У пользователей второго объема больше курсов, зачислений, вопросов и результатов, чем у первого.
+GROWTH_SEED_SIZES = (
+    {'teachers': 1, 'students': 1, 'courses': 1, 'modules': 1, 'lessons': 1, 'questions': 2, 'answers': 2,
+     'enrollments': 1, 'attempts': 1},
+    {'teachers': 1, 'students': 1, 'courses': 3, 'modules': 2, 'lessons': 2, 'questions': 3, 'answers': 3,
+     'enrollments': 3, 'attempts': 2},
+)
+
+# url_name - имя для reverse, list_name - список, из которого берется id объекта для маршрутов с pk
+Route = namedtuple('Route', ('url_name', 'list_name', 'paginated'))
+
+
+def get_routes():
+    """ Возвращает GET-маршруты API приложений URL_MODULES. """
+    routes = []
+    for app in URL_MODULES:
+        names = {pattern.name for pattern in get_resolver(f'{app}.urls').url_patterns}
+        for pattern in get_resolver(f'{app}.urls').url_patterns:
+            view = pattern.callback
+            actions = getattr(view, 'actions', None)
+            if ('get' not in actions) if actions is not None else not hasattr(view.cls, 'get'):
+                continue
+            kwargs = set(pattern.pattern.regex.groupindex)
+            if kwargs - {'pk'}:
+                continue
+            list_name = None
+            if kwargs:
+                base = pattern.name.rsplit('-', 1)[0]
+                list_name = f'{app}:{base}-list' if f'{base}-list' in names else f'{app}:{base}'
+            routes.append(Route(f'{app}:{pattern.name}', list_name, view.cls.pagination_class is not None))
+    return routes
+
+
+def get_first_id(response):
+    """ Возвращает id первого объекта списка из ответа (постраничного или нет). """
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    items = data.get('results', []) if isinstance(data, dict) else data
+    return items[0].get('id') if items else None
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * percent / 100) - 1, 0)]
+
+
+class EndpointBenchmark:
+    """
+    Измеряет для каждого маршрута и роли количество запросов к базе данных, задержку (p50/p95)
+    и размер ответа. Списки запрашиваются с разными размерами страницы: количество запросов
+    к базе данных не должно зависеть от размера страницы.
+    """
+
+    def __init__(self, users, repeat=10, page_sizes=(2, MyPagination.max_page_size)):
+        self.users = users
+        self.repeat = repeat
+        self.page_sizes = page_sizes
+        self.client = APIClient()
+
+    def request(self, url, params):
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.perf_counter()
+            response = self.client.get(url, params)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = (time.perf_counter() - started) * 1000
+        return response, query_count, elapsed, len(content)
+
+    def measure(self, url, params):
+        timings, query_counts = [], []
+        for _ in range(self.repeat):
+            response, query_count, elapsed, size = self.request(url, params)
+            timings.append(elapsed)
+            query_counts.append(query_count)
+        return {
+            'status': response.status_code,
+            # Первый запрос может заполнять кеш, поэтому учитывается наибольшее количество запросов
+            'queries': max(query_counts),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'bytes': size,
+        }
+
+    def iter_results(self, routes):
+        """ Измеряет маршруты по очереди и возвращает пары ('<роль> <маршрут>', метрики). """
+        # Разрешение testserver нужно, если команда запускается вне тестов
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for role, user in self.users.items():
+                self.client.force_authenticate(user=user)
+                for route in routes:
+                    yield f'{role} {route.url_name}', self.measure_route(route)
+
+    def measure_route(self, route):
+        params = dict(ROUTE_PARAMS.get(route.url_name, {}))
+        kwargs = None
+        if route.list_name:
+            list_params = {**ROUTE_PARAMS.get(route.list_name, {}), 'page_size': 1}
+            pk = get_first_id(self.client.get(reverse(route.list_name), list_params))
+            kwargs = {'pk': pk or 0}
+        url = reverse(route.url_name, kwargs=kwargs)
+
+        if not route.paginated or route.list_name:
+            return self.measure(url, params)
+        by_page_size = {size: self.measure(url, {**params, 'page_size': size}) for size in self.page_sizes}
+        metrics = by_page_size[max(self.page_sizes)]
+        metrics['queries_by_page_size'] = {size: value['queries'] for size, value in by_page_size.items()}
+        return metrics
+
+    def run(self, routes):
+        """ Возвращает результаты в виде {'<роль> <маршрут>': метрики}. """
+        return dict(self.iter_results(routes))
+
+
+def find_query_growth(results, budgets=None):
+    """
+    Возвращает маршруты, у которых количество запросов растет вместе с размером страницы.
+    Маршруты с известной проблемой отмечаются в бюджете флагом allow_query_growth.
+    """
+    growing = []
+    for key, metrics in results.items():
+        counts = list(metrics.get('queries_by_page_size', {}).values())
+        if counts and max(counts) > counts[0] and not (budgets or {}).get(key, {}).get('allow_query_growth'):
+            growing.append(key)
+    return growing
+
+
+def measure_data_growth(routes, sizes=GROWTH_SEED_SIZES):
+    """
+    Измеряет маршруты на нескольких объемах данных: для каждого объема seed_lms создает отдельных
+    пользователей всех ролей, и маршруты измеряются от их имени. Так проверяются и маршруты без пагинации,
+    и списки, ограниченные данными пользователя. Созданные данные удаляются откатом транзакции.
+    Возвращает список результатов (см. EndpointBenchmark.run) в порядке sizes.
+    """
+    results = []
+    with transaction.atomic():
+        for i, size in enumerate(sizes):
+            prefix = f'bench-growth-{i}'
+            call_command('seed_lms', prefix=prefix, stdout=io.StringIO(), **size)
+            users = {role: User.objects.get(email=f'{prefix}-{role}-0@example.com') for role in ROLES}
+            results.append(EndpointBenchmark(users, repeat=1).run(routes))
+        transaction.set_rollback(True)
+    return results
+
+
+def find_data_growth(results, budgets=None):
+    """
+    Возвращает маршруты, у которых количество запросов растет вместе с объемом данных
+    (results - замеры measure_data_growth от меньшего объема к большему).
+    """
+    growing = []
+    for key, metrics in results[0].items():
+        counts = [result[key]['queries'] for result in results if key in result]
+        if max(counts) > counts[0] and not (budgets or {}).get(key, {}).get('allow_query_growth'):
+            growing.append(key)
+    return growing
+
+
+def compare_with_budgets(results, budgets, tolerance):
+    """
+    Сравнивает результаты с бюджетами. Количество запросов должно не превышать бюджет,
+    задержка p95 и размер ответа - бюджет, умноженный на tolerance. Возвращает список нарушений.
+    """
+    violations = []
+    for key, metrics in results.items():
+        budget = budgets.get(key)
+        if budget is None:
+            continue
+        if metrics['queries'] > budget['queries']:
+            violations.append(f'{key}: запросов {metrics["queries"]} > {budget["queries"]}')
+        for field in ('p95_ms', 'bytes'):
+            if metrics[field] > budget[field] * tolerance:
+                violations.append(f'{key}: {field} {metrics[field]} > {budget[field]} x {tolerance}')
+    return violations
+
+
+class Command(BaseCommand):
+    help = ('Измеряет количество запросов к базе данных, задержку и размер ответа всех GET-маршрутов API '
+            'для каждой роли и сравнивает их с сохраненными бюджетами')
+
+    def add_arguments(self, parser):
+        for role in ROLES:
+            parser.add_argument(f'--{role}', help=f'Email пользователя с ролью {role} (по умолчанию - первый)')
+        parser.add_argument('--repeat', type=int, default=10, help='Количество запросов на каждый замер')
+        parser.add_argument('--route', action='append', help='Измерять только маршруты, содержащие строку')
+        parser.add_argument('--budgets', default=str(DEFAULT_BUDGETS), help='Файл бюджетов (JSON)')
+        parser.add_argument('--update-budgets', action='store_true',
+                            help='Записать результаты в файл бюджетов вместо сравнения')
+        parser.add_argument('--check-data-growth', action='store_true',
+                            help='Проверить, что количество запросов не растет с объемом данных (данные '
+                                 'создаются seed_lms во временной транзакции)')
+        parser.add_argument('--tolerance', type=float, default=2.0,
+                            help='Допустимое превышение бюджета задержки и размера ответа (множитель)')
+
+    def get_user(self, role, email):
+        users = User.objects.filter(role=role)
+        user = users.filter(email=email).first() if email else users.order_by('pk').first()
+        if user is None:
+            raise CommandError(f'Пользователь с ролью {role} не найден: заполните базу (python manage.py seed_lms).')
+        return user
+
+    def handle(self, *args, **options):
+        users = {role: self.get_user(role, options[role]) for role in ROLES}
+        routes = get_routes()
+        if options['route']:
+            routes = [route for route in routes if any(part in route.url_name for part in options['route'])]
+
+        results = {}
+        self.stdout.write(f'{"endpoint":<42} {"status":>6} {"queries":>10} {"p50, ms":>9} {"p95, ms":>9} '
+                          f'{"bytes":>10}')
+        for key, metrics in EndpointBenchmark(users, options['repeat']).iter_results(routes):
+            results[key] = metrics
+            queries = '/'.join(map(str, metrics.get('queries_by_page_size', {}).values())) or metrics['queries']
+            self.stdout.write(f'{key:<42} {metrics["status"]:>6} {queries:>10} {metrics["p50_ms"]:>9} '
+                              f'{metrics["p95_ms"]:>9} {metrics["bytes"]:>10}')
+
+        try:
+            with open(options['budgets'], encoding='utf-8') as file:
+                budgets = json.load(file)
+        except FileNotFoundError:
+            budgets = {}
+            self.stdout.write(self.style.WARNING(f'Файл бюджетов {options["budgets"]} не найден'))
+
+        if options['update_budgets']:
+            for key, metrics in results.items():
+                # Флаги, выставленные вручную (allow_query_growth), сохраняются
+                budgets[key] = {**budgets.get(key, {}), **{field: metrics[field] for field in BUDGET_FIELDS}}
+            with open(options['budgets'], 'w', encoding='utf-8') as file:
+                json.dump(budgets, file, ensure_ascii=False, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Бюджеты записаны в {options["budgets"]}')
+            return
+
+        violations = [f'{key}: количество запросов растет с размером страницы'
+                      for key in find_query_growth(results, budgets)]
+        if options['check_data_growth']:
+            violations += [f'{key}: количество запросов растет с объемом данных'
+                           for key in find_data_growth(measure_data_growth(routes), budgets)]
+        violations += compare_with_budgets(results, budgets, options['tolerance'])
+        if violations:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('Все маршруты в пределах бюджетов'))
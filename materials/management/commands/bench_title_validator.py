@@ -0,0 +1,67 @@
+import random
+import time
+
+from django.core.management import BaseCommand
+
+from materials.validators import build_matcher, build_pattern
+
+ALPHABET = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+
+
+def legacy_search(words, text):
+    """ Прежняя реализация TitleValidator: отдельный поиск подстроки для каждого слова. """
+    text = text.lower()
+    for word in words:
+        if word in text:
+            return word
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость прежней и скомпилированной проверки запрещенных слов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--words', type=int, nargs='+', default=[7, 100, 1000, 10000],
+                            help='Размеры словаря запрещенных слов')
+        parser.add_argument('--text-size', type=int, nargs='+', default=[100, 10000, 100000],
+                            help='Длина проверяемых текстов в символах')
+        parser.add_argument('--repeat', type=int, default=20, help='Количество проверок на каждый замер')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+
+        def make_word(min_len=4, max_len=10):
+            return ''.join(rnd.choice(ALPHABET) for _ in range(rnd.randint(min_len, max_len)))
+
+        self.stdout.write(f"{'words':>7} {'text':>8} {'legacy, ms':>12} {'regex, ms':>10} {'matcher, ms':>12} "
+                          f"{'speedup':>8}")
+        for words_count in options['words']:
+            words = [make_word() for _ in range(words_count)]
+            started = time.perf_counter()
+            pattern = build_pattern(words)
+            compile_ms = (time.perf_counter() - started) * 1000
+            matcher = build_matcher(words)
+
+            for text_size in options['text_size']:
+                # Случайный текст почти не содержит запрещенных слов - просматривается весь текст
+                text = ' '.join(make_word(2, 6) for _ in range(text_size // 5))[:text_size]
+                texts = [text] * options['repeat']
+
+                started = time.perf_counter()
+                legacy_results = [legacy_search(words, item) for item in texts]
+                legacy_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+                started = time.perf_counter()
+                regex_results = [pattern.search(item.lower()) is not None for item in texts]
+                regex_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+                started = time.perf_counter()
+                matcher_results = [matcher(item.lower()) is not None for item in texts]
+                matcher_ms = (time.perf_counter() - started) * 1000 / len(texts)
+
+                found = [result is not None for result in legacy_results]
+                assert found == regex_results == matcher_results
+                self.stdout.write(f'{words_count:>7} {text_size:>8} {legacy_ms:>12.3f} {regex_ms:>10.3f} '
+                                  f'{matcher_ms:>12.3f} {legacy_ms / matcher_ms if matcher_ms else 0:>7.1f}x')
+            self.stdout.write(f'        компиляция словаря из {words_count} слов: {compile_ms:.1f} ms')
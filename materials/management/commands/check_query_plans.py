@@ -0,0 +1,99 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from materials.models import Course, Module, Lesson, Enrollment
+from materials.pagination import MyPagination
+from materials.services import filter_by_role
+from tests.models import TestResult
+from users.models import User
+
+
+def get_hot_querysets(teacher, student):
+    """
+    Возвращает часто выполняемые запросы списков с ограничением по роли пользователя
+    (как в get_queryset представлений) в виде {название: queryset первой страницы}.
+    """
+    page = slice(0, MyPagination.page_size)
+    course = Course.objects.filter(owner=teacher).first()
+    module = Module.objects.filter(owner=teacher).first()
+    return {
+        'courses (teacher)': filter_by_role(Course.objects.all(), teacher)[page],
+        'modules (teacher)': filter_by_role(Module.objects.all(), teacher)[page],
+        'lessons (teacher)': filter_by_role(Lesson.objects.all(), teacher)[page],
+        'modules of course': Module.objects.filter(course=course),
+        'lessons of module': Lesson.objects.filter(module=module),
+        'enrollments (student)': Enrollment.objects.filter(student=student).order_by('pk')[page],
+        'enrollments (teacher)': Enrollment.objects.filter(course__owner=teacher).order_by('pk')[page],
+        'test results (student)': TestResult.objects.filter(student=student).order_by('pk')[page],
+        'test results (teacher)': TestResult.objects.filter(test__owner=teacher).order_by('pk')[page],
+    }
+
+
+def iter_plan_nodes(node):
+    """ Обходит узлы плана запроса (EXPLAIN FORMAT JSON). """
+    yield node
+    for child in node.get('Plans', ()):
+        yield from iter_plan_nodes(child)
+
+
+def explain(queryset, disable_seqscan=False):
+    """ Возвращает корневой узел плана запроса. """
+    with transaction.atomic():
+        if disable_seqscan:
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = json.loads(queryset.explain(format='json'))
+    return plan[0]['Plan']
+
+
+def get_full_scans(plan):
+    """
+    Возвращает полные просмотры таблиц в плане запроса: последовательное сканирование
+    и обход всего индекса с фильтрацией строк (индекс используется только для сортировки).
+    """
+    scans = []
+    for node in iter_plan_nodes(plan):
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(f'Seq Scan on {node["Relation Name"]}')
+        elif node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Filter' in node and 'Index Cond' not in node:
+            scans.append(f'Full Index Scan on {node["Relation Name"]}')
+    return scans
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы часто выполняемых запросов (EXPLAIN) и завершается с ошибкой, '
+            'если какой-либо запрос просматривает таблицу целиком (Seq Scan или обход всего индекса)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teacher', help='Email преподавателя (по умолчанию - первый преподаватель)')
+        parser.add_argument('--student', help='Email студента (по умолчанию - первый студент)')
+        parser.add_argument('--disable-seqscan', action='store_true',
+                            help='Запретить планировщику последовательное сканирование: на небольшой базе '
+                                 'проверяется только наличие подходящего индекса')
+
+    def get_user(self, role, email):
+        users = User.objects.filter(role=role)
+        user = users.filter(email=email).first() if email else users.order_by('pk').first()
+        if user is None:
+            raise CommandError(f'Пользователь с ролью {role} не найден: заполните базу данными.')
+        return user
+
+    def handle(self, *args, **options):
+        teacher = self.get_user('teacher', options['teacher'])
+        student = self.get_user('student', options['student'])
+
+        failed = []
+        for name, queryset in get_hot_querysets(teacher, student).items():
+            plan = explain(queryset, options['disable_seqscan'])
+            full_scans = get_full_scans(plan)
+            if full_scans:
+                failed.append(name)
+                status = self.style.ERROR(', '.join(full_scans))
+            else:
+                status = self.style.SUCCESS('OK')
+            self.stdout.write(f'{name:<24} {plan["Node Type"]:<18} cost={plan["Total Cost"]:<10} {status}')
+
+        if failed:
+            raise CommandError(f'Полный просмотр таблиц в запросах: {", ".join(failed)}')
@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand, CommandError
+
+from materials.models import Course
+from materials.transfer import export_course, TRANSFER_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Выгружает дерево курса (модули, уроки, тесты, вопросы, ответы) в формате JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('--output', '-o', help='Файл для выгрузки (по умолчанию - стандартный вывод)')
+        parser.add_argument('--chunk-size', type=int, default=TRANSFER_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(pk=options['course_id']).first()
+        if course is None:
+            raise CommandError(f'Курс {options["course_id"]} не найден.')
+
+        chunks = export_course(course, options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            file.writelines(chunks)
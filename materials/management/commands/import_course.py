@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from materials.transfer import import_course, TRANSFER_CHUNK_SIZE
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загружает курс из документа JSON Lines (см. export_course) в одной транзакции'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для загрузки ("-" - стандартный ввод)')
+        parser.add_argument('--owner', required=True, help='Email владельца загруженного курса')
+        parser.add_argument('--chunk-size', type=int, default=TRANSFER_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        owner = User.objects.filter(email=options['owner']).first()
+        if owner is None:
+            raise CommandError(f'Пользователь {options["owner"]} не найден.')
+
+        file = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        start = time.perf_counter()
+        try:
+            course, counts = import_course(file, owner, options['chunk_size'])
+        except ValidationError as error:
+            raise CommandError('\n'.join(str(detail) for detail in error.detail))
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        elapsed = time.perf_counter() - start
+
+        total = sum(counts.values())
+        self.stdout.write(', '.join(f'{name}: {count}' for name, count in counts.items()))
+        self.stdout.write(f'Курс {course.pk} загружен: {total} записей за {elapsed:.1f} с '
+                          f'({total / elapsed:.0f} записей/с)')
@@ -0,0 +1,186 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from materials.models import Course, Module, Lesson, Enrollment
+from materials.ordering import POSITION_STEP
+from tests.models import Test, Question, Answer, StudentAnswer, TestAttempt, TestResult
+from tests.services import get_score
+from users.models import User
+
+WORDS = (
+    'алгоритм', 'анализ', 'база', 'данные', 'модель', 'запрос', 'индекс', 'сервер', 'клиент', 'очередь',
+    'кеш', 'поиск', 'структура', 'функция', 'класс', 'объект', 'тест', 'проект', 'архитектура', 'сеть',
+    'протокол', 'безопасность', 'интерфейс', 'шаблон', 'транзакция', 'память', 'процесс', 'поток', 'файл',
+    'система', 'основы', 'введение', 'практика', 'углубленный', 'курс', 'задача', 'решение', 'пример',
+)
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими данными: пользователи по ролям, курсы, модули, уроки, '
+            'зачисления, тесты, вопросы, ответы, попытки, ответы студентов и результаты')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--admins', type=int, default=1)
+        parser.add_argument('--teachers', type=int, default=20)
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--courses', type=int, default=5, help='Курсов у каждого преподавателя')
+        parser.add_argument('--modules', type=int, default=5, help='Модулей в курсе')
+        parser.add_argument('--lessons', type=int, default=4, help='Уроков в модуле (у каждого урока - тест)')
+        parser.add_argument('--questions', type=int, default=5, help='Вопросов в тесте')
+        parser.add_argument('--answers', type=int, default=4, help='Вариантов ответа на вопрос (один правильный)')
+        parser.add_argument('--enrollments', type=int, default=5, help='Курсов, на которые зачислен студент')
+        parser.add_argument('--attempts', type=int, default=3, help='Пройденных тестов в каждом курсе студента')
+        parser.add_argument('--accuracy', type=float, default=0.7, help='Доля правильных ответов студентов')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора: при одинаковом зерне создаются одинаковые данные')
+        parser.add_argument('--prefix', default='seed', help='Префикс email создаваемых пользователей')
+        parser.add_argument('--password', default='seed1234', help='Пароль всех создаваемых пользователей')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rnd = random.Random(options['seed'])
+        self.counts = {}
+        if User.objects.filter(email__startswith=f'{options["prefix"]}-').exists():
+            raise CommandError(f'Пользователи с префиксом {options["prefix"]!r} уже созданы: укажите другой --prefix.')
+        if options['enrollments'] > options['teachers'] * options['courses']:
+            raise CommandError('Студент не может быть зачислен на большее количество курсов, чем создается.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            teacher_ids, student_ids = self.create_users()
+            course_ids, course_tests = self.create_courses(teacher_ids)
+            self.create_activity(student_ids, course_ids, course_tests)
+        elapsed = time.monotonic() - started
+
+        total = sum(self.counts.values())
+        for model, count in self.counts.items():
+            self.stdout.write(f'{model.__name__:<14} {count:>10}')
+        self.stdout.write(f'Создано записей: {total} за {elapsed:.1f} с ({total / max(elapsed, 1e-9):.0f} записей/с)')
+
+    def text(self, count):
+        return ' '.join(self.rnd.choices(WORDS, k=count))
+
+    def insert(self, model, objects):
+        """ Вставляет объекты пачками по batch_size и возвращает их id в порядке вставки. """
+        created = model.objects.bulk_create(objects, batch_size=self.options['batch_size'])
+        self.counts[model] = self.counts.get(model, 0) + len(created)
+        return [obj.pk for obj in created]
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        # Хеш пароля вычисляется один раз: хеширование для каждого пользователя заняло бы большую часть времени
+        password = make_password(self.options['password'])
+        ids = {}
+        for role in ('admin', 'teacher', 'student'):
+            ids[role] = self.insert(User, (
+                User(email=f'{prefix}-{role}-{i}@example.com', role=role, password=password, is_staff=role == 'admin',
+                     first_name=self.rnd.choice(WORDS).capitalize(), last_name=self.rnd.choice(WORDS).capitalize())
+                for i in range(self.options[f'{role}s'])
+            ))
+        return ids['teacher'], ids['student']
+
+    def create_courses(self, teacher_ids):
+        """
+        Создает дерево курсов: модули, уроки, по тесту на урок, вопросы и варианты ответов.
+        Возвращает id курсов и тесты каждого курса в виде [(id теста, [(id вопроса, id правильного ответа,
+        id всех ответов)])].
+        """
+        options = self.options
+        prefix = options['prefix']
+        owners = [teacher_id for teacher_id in teacher_ids for _ in range(options['courses'])]
+        course_ids = self.insert(Course, (
+            Course(title=f'{prefix} {i}: {self.text(3)}', description=self.text(12), owner_id=owner)
+            for i, owner in enumerate(owners)
+        ))
+
+        parents = [(course_id, owner) for course_id, owner in zip(course_ids, owners)
+                   for _ in range(options['modules'])]
+        module_ids = self.insert(Module, (
+            Module(title=self.text(3), description=self.text(12), course_id=course_id, owner_id=owner,
+                   position=(i % options['modules'] + 1) * POSITION_STEP)
+            for i, (course_id, owner) in enumerate(parents)
+        ))
+
+        parents = [(module_id, course_id, owner) for module_id, (course_id, owner) in zip(module_ids, parents)
+                   for _ in range(options['lessons'])]
+        lesson_ids = self.insert(Lesson, (
+            Lesson(title=self.text(3), description=self.text(20), module_id=module_id, owner_id=owner,
+                   position=(i % options['lessons'] + 1) * POSITION_STEP)
+            for i, (module_id, _, owner) in enumerate(parents)
+        ))
+
+        test_ids = self.insert(Test, (
+            Test(title=f'Тест: {self.text(2)}', lesson_id=lesson_id, owner_id=owner)
+            for lesson_id, (_, _, owner) in zip(lesson_ids, parents)
+        ))
+        test_parents = [(test_id, owner) for test_id, (_, _, owner) in zip(test_ids, parents)
+                        for _ in range(options['questions'])]
+        question_ids = self.insert(Question, (
+            Question(text=f'{self.text(6)}?', test_id=test_id, owner_id=owner) for test_id, owner in test_parents
+        ))
+
+        correct = [self.rnd.randrange(options['answers']) for _ in question_ids]
+        answer_ids = self.insert(Answer, (
+            Answer(text=self.text(2), is_correct=index == correct[i], question_id=question_id, owner_id=owner)
+            for i, (question_id, (_, owner)) in enumerate(zip(question_ids, test_parents))
+            for index in range(options['answers'])
+        ))
+
+        course_tests = {course_id: [] for course_id in course_ids}
+        questions_per_test = options['questions']
+        answers_per_question = options['answers']
+        for i, (test_id, (_, course_id, _)) in enumerate(zip(test_ids, parents)):
+            questions = []
+            for j in range(i * questions_per_test, (i + 1) * questions_per_test):
+                answers = answer_ids[j * answers_per_question:(j + 1) * answers_per_question]
+                questions.append((question_ids[j], answers[correct[j]], answers))
+            course_tests[course_id].append((test_id, questions))
+        return course_ids, course_tests
+
+    def create_activity(self, student_ids, course_ids, course_tests):
+        """ Зачисляет студентов на курсы и создает завершенные попытки с ответами студентов и результатами. """
+        options = self.options
+        batch_size = options['batch_size']
+        enrollments, attempts, student_answers, results = [], [], [], []
+        now = timezone.now()
+        for student_id in student_ids:
+            for course_id in self.rnd.sample(course_ids, options['enrollments']):
+                # О сгенерированных зачислениях преподавателям не сообщается
+                enrollments.append(Enrollment(student_id=student_id, course_id=course_id, is_notified=True))
+                tests = course_tests[course_id]
+                for test_id, questions in self.rnd.sample(tests, min(options['attempts'], len(tests))):
+                    attempt = TestAttempt(student_id=student_id, test_id=test_id, finished_at=now)
+                    attempts.append(attempt)
+                    count_right_answers = 0
+                    for question_id, correct_id, answers in questions:
+                        if self.rnd.random() < options['accuracy']:
+                            answer_id = correct_id
+                        else:
+                            answer_id = self.rnd.choice(answers)
+                        count_right_answers += answer_id == correct_id
+                        student_answers.append(StudentAnswer(student_id=student_id, question_id=question_id,
+                                                             answer_id=answer_id, attempt=attempt))
+                    results.append(TestResult(student_id=student_id, test_id=test_id, attempt=attempt,
+                                              count_questions=len(questions), count_right_answers=count_right_answers,
+                                              score=get_score(count_right_answers, len(questions))))
+
+            # Объекты накапливаются только до размера пачки, поэтому память не зависит от объема данных.
+            # Попытки вставляются раньше ответов и результатов, которые ссылаются на них.
+            if len(student_answers) >= batch_size:
+                self.insert(TestAttempt, attempts)
+                self.insert(StudentAnswer, student_answers)
+                self.insert(TestResult, results)
+                attempts, student_answers, results = [], [], []
+            if len(enrollments) >= batch_size:
+                self.insert(Enrollment, enrollments)
+                enrollments = []
+        self.insert(Enrollment, enrollments)
+        self.insert(TestAttempt, attempts)
+        self.insert(StudentAnswer, student_answers)
+        self.insert(TestResult, results)
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0002_enrollment_remove_course_unique_course_owner_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения (курса, модулей или уроков)'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения (модуля или уроков)'),
+        ),
+    ]
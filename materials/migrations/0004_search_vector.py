@@ -0,0 +1,79 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# Поисковый вектор: название с весом A, описание с весом B, русская морфология.
+# Поддерживается триггером, поэтому заполняется и при массовых вставках/обновлениях в обход ORM.
+SEARCH_VECTOR_FUNCTION = """
+CREATE OR REPLACE FUNCTION materials_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.russian', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+SEARCH_VECTOR_TABLES = ('materials_course', 'materials_module', 'materials_lesson')
+
+
+def create_triggers_sql():
+    statements = [SEARCH_VECTOR_FUNCTION]
+    for table in SEARCH_VECTOR_TABLES:
+        statements.append(f"""
+            CREATE TRIGGER {table}_search_vector_trigger
+            BEFORE INSERT OR UPDATE OF title, description ON {table}
+            FOR EACH ROW EXECUTE FUNCTION materials_search_vector_update();
+            UPDATE {table} SET title = title;
+        """)
+    return statements
+
+
+def drop_triggers_sql():
+    statements = [f'DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};'
+                  for table in SEARCH_VECTOR_TABLES]
+    statements.append('DROP FUNCTION IF EXISTS materials_search_vector_update();')
+    return statements
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0003_course_updated_at_lesson_updated_at_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='course_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lesson_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='module',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='module_search_vector_gin'),
+        ),
+        migrations.RunSQL(create_triggers_sql(), drop_triggers_sql()),
+    ]
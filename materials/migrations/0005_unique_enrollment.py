@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Перед добавлением ограничения удаляются дубли зачислений, оставляется самая ранняя запись
+REMOVE_DUPLICATES_SQL = """
+DELETE FROM materials_enrollment duplicate
+USING materials_enrollment original
+WHERE duplicate.student_id = original.student_id
+  AND duplicate.course_id = original.course_id
+  AND duplicate.id > original.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunSQL(REMOVE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='unique_enrollment'),
+        ),
+    ]
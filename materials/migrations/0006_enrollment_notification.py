@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:34
+
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+# О существующих зачислениях преподаватели уже уведомлены отдельными письмами
+MARK_EXISTING_NOTIFIED_SQL = "UPDATE materials_enrollment SET is_notified = TRUE;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0005_unique_enrollment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), verbose_name='Дата зачисления'),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='is_notified',
+            field=models.BooleanField(default=False, verbose_name='Преподаватель уведомлен'),
+        ),
+        migrations.RunSQL(MARK_EXISTING_NOTIFIED_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(condition=models.Q(('is_notified', False)), fields=['created_at'], name='enrollment_pending_notify'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0006_enrollment_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Уменьшенные копии изображения'),
+        ),
+    ]
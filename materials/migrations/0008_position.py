@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Существующие модули и уроки нумеруются в прежнем порядке (по id) с шагом 65536 (см. materials.ordering)
+NUMBER_POSITIONS_SQL = """
+UPDATE materials_module SET position = numbered.row_number * 65536
+FROM (SELECT id, row_number() OVER (PARTITION BY course_id ORDER BY id) FROM materials_module) numbered
+WHERE materials_module.id = numbered.id;
+
+UPDATE materials_lesson SET position = numbered.row_number * 65536
+FROM (SELECT id, row_number() OVER (PARTITION BY module_id ORDER BY id) FROM materials_lesson) numbered
+WHERE materials_lesson.id = numbered.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0007_image_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='lesson',
+            options={'ordering': ['module_id', 'position', 'pk'], 'verbose_name': 'Урок', 'verbose_name_plural': 'Уроки'},
+        ),
+        migrations.AlterModelOptions(
+            name='module',
+            options={'ordering': ['course_id', 'position', 'pk'], 'verbose_name': 'Модуль', 'verbose_name_plural': 'Модули'},
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='position',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Позиция'),
+        ),
+        migrations.AddField(
+            model_name='module',
+            name='position',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Позиция'),
+        ),
+        migrations.RunSQL(NUMBER_POSITIONS_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['module', 'position'], name='lesson_module_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='module',
+            index=models.Index(fields=['course', 'position'], name='module_course_position_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы создаются без блокировки записи в таблицы (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('materials', '0008_position'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='course',
+            index=models.Index(fields=['owner', 'id'], name='course_owner_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='lesson',
+            index=models.Index(fields=['owner', 'module', 'position'], name='lesson_owner_position_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='module',
+            index=models.Index(fields=['owner', 'course', 'position'], name='module_owner_position_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Now
 from config import settings
 
 
@@ -12,6 +15,9 @@ class Course(models.Model):
     description = models.TextField(verbose_name="Описание", **NULLABLE)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="courses", on_delete=models.SET_NULL, **NULLABLE,
                               verbose_name='Владелец')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения (курса, модулей или уроков)")
+    # Заполняется триггером базы данных (см. миграцию 0004_search_vector)
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
 
     def __str__(self):
         return self.title
@@ -20,6 +26,11 @@ class Course(models.Model):
         verbose_name = "Курс"
         verbose_name_plural = "Курсы"
         ordering = ['pk']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='course_search_vector_gin'),
+            # Список курсов преподавателя (filter_by_role) в порядке Meta.ordering
+            models.Index(fields=['owner', 'id'], name='course_owner_id_idx'),
+        ]
 
 
 class Module(models.Model):
@@ -30,6 +41,12 @@ class Module(models.Model):
     course = models.ForeignKey(Course, related_name="modules", on_delete=models.CASCADE, verbose_name="Курс")
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="modules", on_delete=models.SET_NULL, **NULLABLE,
                               verbose_name='Владелец')
+    # Порядок модуля в курсе: разреженные значения (см. materials.ordering)
+    position = models.BigIntegerField(default=0, editable=False, verbose_name="Позиция")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения (модуля или уроков)")
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
+
+    position_parent_field = 'course_id'
 
     def __str__(self):
         return self.title
@@ -37,7 +54,13 @@ class Module(models.Model):
     class Meta:
         verbose_name = "Модуль"
         verbose_name_plural = "Модули"
-        ordering = ['pk']
+        ordering = ['course_id', 'position', 'pk']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='module_search_vector_gin'),
+            models.Index(fields=['course', 'position'], name='module_course_position_idx'),
+            # Список модулей преподавателя (filter_by_role) в порядке Meta.ordering
+            models.Index(fields=['owner', 'course', 'position'], name='module_owner_position_idx'),
+        ]
 
 
 class Lesson(models.Model):
@@ -46,11 +69,18 @@ class Lesson(models.Model):
     title = models.CharField(max_length=100, verbose_name="Урок")
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
     image = models.ImageField(upload_to="media/course", verbose_name="Изображение", blank=True, null=True)
+    image_derivatives = models.JSONField(editable=False, verbose_name="Уменьшенные копии изображения", **NULLABLE)
     video = models.URLField(max_length=200, verbose_name="Ссылка на видео", blank=True, null=True)
     module = models.ForeignKey(Module, related_name="lessons", on_delete=models.SET_NULL, **NULLABLE,
                                verbose_name="Модуль")
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="lessons", on_delete=models.SET_NULL, **NULLABLE,
                               verbose_name='Владелец')
+    # Порядок урока в модуле: разреженные значения (см. materials.ordering)
+    position = models.BigIntegerField(default=0, editable=False, verbose_name="Позиция")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+    search_vector = SearchVectorField(editable=False, **NULLABLE)
+
+    position_parent_field = 'module_id'
 
     def __str__(self):
         return self.title
@@ -58,7 +88,13 @@ class Lesson(models.Model):
     class Meta:
         verbose_name = "Урок"
         verbose_name_plural = "Уроки"
-        ordering = ['pk']
+        ordering = ['module_id', 'position', 'pk']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lesson_search_vector_gin'),
+            models.Index(fields=['module', 'position'], name='lesson_module_position_idx'),
+            # Список уроков преподавателя (filter_by_role) в порядке Meta.ordering
+            models.Index(fields=['owner', 'module', 'position'], name='lesson_owner_position_idx'),
+        ]
 
 
 class Enrollment(models.Model):
@@ -66,6 +102,8 @@ class Enrollment(models.Model):
 
     student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Студент")
     course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name="Курс")
+    created_at = models.DateTimeField(db_default=Now(), verbose_name="Дата зачисления")
+    is_notified = models.BooleanField(default=False, verbose_name="Преподаватель уведомлен")
 
     def __str__(self):
         return f"{self.student} {self.course}"
@@ -74,3 +112,11 @@ class Enrollment(models.Model):
         verbose_name = "Зачисление на курс"
         verbose_name_plural = "Зачисления на курс"
         ordering = ['pk']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_enrollment'),
+        ]
+        indexes = [
+            # Очередь зачислений для сводки преподавателям: частичный индекс содержит только неотправленные
+            models.Index(fields=['created_at'], condition=models.Q(is_notified=False),
+                         name='enrollment_pending_notify'),
+        ]
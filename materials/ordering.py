@@ -0,0 +1,113 @@
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from rest_framework import serializers
+
+# Шаг между позициями соседних объектов: между двумя соседями можно вставить объект
+# без перенумерации остальных (позиция берется посередине), пока между ними есть свободные значения
+POSITION_STEP = 1 << 16
+
+
+def get_siblings(instance):
+    """ Возвращает queryset объектов с тем же родителем (уроки модуля или модули курса). """
+    parent_field = instance.position_parent_field
+    return type(instance).objects.filter(**{parent_field: getattr(instance, parent_field)})
+
+
+def next_position(model, parent_field, parent_id):
+    """ Возвращает позицию для нового объекта в конце списка. """
+    last = model.objects.filter(**{parent_field: parent_id}).aggregate(last=Max('position'))['last']
+    return POSITION_STEP if last is None else last + POSITION_STEP
+
+
+def rebalance(model, parent_field, parent_id):
+    """
+    Перенумеровывает позиции объектов одного родителя с шагом POSITION_STEP одним запросом
+    (нужно, только когда между соседями не осталось свободных позиций).
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    column = qn(model._meta.get_field(parent_field).column)
+    sql = f"""
+        UPDATE {table} SET position = numbered.row_number * %s, updated_at = now()
+        FROM (SELECT id, row_number() OVER (ORDER BY position, id) FROM {table} WHERE {column} = %s) numbered
+        WHERE {table}.id = numbered.id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [POSITION_STEP, parent_id])
+
+
+def get_position_after(instance, after):
+    """
+    Вычисляет позицию объекта, перемещаемого сразу после after (или в начало списка, если after = None).
+    Возвращает None, если между соседями нет свободной позиции.
+    """
+    siblings = get_siblings(instance).exclude(pk=instance.pk).order_by('position', 'pk')
+    if after is None:
+        first = siblings.values_list('position', flat=True).first()
+        return POSITION_STEP if first is None else first - POSITION_STEP
+
+    following = siblings.filter(Q(position__gt=after.position) | Q(position=after.position, pk__gt=after.pk))
+    next_value = following.values_list('position', flat=True).first()
+    if next_value is None:
+        return after.position + POSITION_STEP
+    if next_value - after.position > 1:
+        return (after.position + next_value) // 2
+    return None
+
+
+def move(instance, after_id=None):
+    """
+    Перемещает объект сразу после соседа after_id (None - в начало списка).
+
+    Обычно изменяется только позиция самого объекта; если свободных позиций между соседями не осталось,
+    позиции родителя предварительно перенумеровываются одним запросом.
+    """
+    model = type(instance)
+    parent_field = instance.position_parent_field
+    with transaction.atomic():
+        after = None
+        if after_id is not None:
+            after = get_siblings(instance).exclude(pk=instance.pk).filter(pk=after_id).first()
+            if after is None:
+                raise serializers.ValidationError({'after': ['Объект не найден среди соседних объектов.']})
+
+        position = get_position_after(instance, after)
+        if position is None:
+            rebalance(model, parent_field, getattr(instance, parent_field))
+            after.refresh_from_db(fields=['position'])
+            position = get_position_after(instance, after)
+
+        instance.position = position
+        # save() вызывает сигналы: обновляется версия родителя и сбрасывается кеш дерева курса
+        instance.save(update_fields=['position', 'updated_at'])
+    return instance
+
+
+def reorder(parent, children_name, ids):
+    """
+    Устанавливает порядок всех дочерних объектов родителя (уроков модуля или модулей курса) по списку id.
+
+    Позиции пересчитываются с шагом POSITION_STEP, измененные строки обновляются одним bulk_update.
+    Родитель сохраняется, чтобы обновить его версию и сбросить кеш дерева курса.
+    """
+    related = getattr(parent, children_name)
+    with transaction.atomic():
+        children = {child.pk: child for child in related.select_for_update().only('pk', 'position')}
+        if len(ids) != len(set(ids)) or set(ids) != set(children):
+            raise serializers.ValidationError(
+                {children_name: ['Нужно передать id всех объектов родителя, каждый один раз.']}
+            )
+
+        changed = []
+        now = timezone.now()
+        for index, pk in enumerate(ids, start=1):
+            child = children[pk]
+            if child.position != index * POSITION_STEP:
+                child.position = index * POSITION_STEP
+                child.updated_at = now
+                changed.append(child)
+        if changed:
+            related.model.objects.bulk_update(changed, ['position', 'updated_at'])
+            parent.save(update_fields=['updated_at'])
+    return len(changed)
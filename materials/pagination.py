@@ -1,7 +1,105 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
 
 
 class MyPagination(PageNumberPagination):
     page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 15
+
+
+class MyCursorPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по первичному ключу.
+
+    Не выполняет COUNT(*) и OFFSET: следующая страница выбирается условием pk > последнего pk,
+    поэтому время ответа не зависит от номера страницы.
+    """
+
+    page_size = 5
+    page_size_query_param = 'page_size'
+    max_page_size = 15
+    ordering = 'pk'
+
+
+class SwitchablePagination(BasePagination):
+    """
+    Пагинация с выбором режима через параметр запроса.
+
+    По умолчанию используется page_pagination_class (текущее поведение для существующих клиентов),
+    при ?pagination=cursor или наличии параметра cursor - курсорная пагинация.
+    Если page_pagination_class = None, без выбора курсорного режима список не разбивается на страницы.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    page_pagination_class = MyPagination
+    cursor_pagination_class = MyCursorPagination
+
+    def __init__(self):
+        self.paginator = None
+
+    def get_paginator(self, request):
+        """ Возвращает пагинатор для выбранного клиентом режима. """
+        cursor_requested = (request.query_params.get(self.mode_query_param) == self.cursor_mode
+                            or self.cursor_pagination_class.cursor_query_param in request.query_params)
+        if cursor_requested:
+            return self.cursor_pagination_class()
+        if self.page_pagination_class is None:
+            return None
+        return self.page_pagination_class()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginator = self.get_paginator(request)
+        if self.paginator is None:
+            return None
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        paginator = self.page_pagination_class or self.cursor_pagination_class
+        return paginator().get_paginated_response_schema(schema)
+
+    def get_paginators(self):
+        """ Возвращает пагинаторы всех доступных режимов. """
+        paginators = [self.cursor_pagination_class()]
+        if self.page_pagination_class is not None:
+            paginators.insert(0, self.page_pagination_class())
+        return paginators
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        fields = {}
+        for paginator in self.get_paginators():
+            for field in paginator.get_schema_fields(view):
+                fields.setdefault(field.name, field)
+        fields[self.mode_query_param] = coreapi.Field(
+            name=self.mode_query_param,
+            required=False,
+            location='query',
+            schema=coreschema.String(title='Pagination mode',
+                                     description=f'Set to "{self.cursor_mode}" to use cursor pagination.'),
+        )
+        return list(fields.values())
+
+    def get_schema_operation_parameters(self, view):
+        parameters = {}
+        for paginator in self.get_paginators():
+            for parameter in paginator.get_schema_operation_parameters(view):
+                parameters.setdefault(parameter['name'], parameter)
+        parameters[self.mode_query_param] = {
+            'name': self.mode_query_param,
+            'required': False,
+            'in': 'query',
+            'description': f'Set to "{self.cursor_mode}" to use cursor pagination.',
+            'schema': {'type': 'string', 'enum': [self.cursor_mode]},
+        }
+        return list(parameters.values())
+
+
+class CursorOnlySwitchablePagination(SwitchablePagination):
+    """ Без выбора курсорного режима список возвращается целиком, как раньше. """
+
+    page_pagination_class = None
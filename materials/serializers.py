@@ -1,9 +1,103 @@
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from materials.images import get_derivative_urls
 from materials.models import Course, Module, Lesson, Enrollment
 from materials.validators import TitleValidator
 
 
-class CourseSerializer(serializers.ModelSerializer):
+def parse_list_param(value):
+    """ Разбирает значение параметра вида 'a,b,c' в множество. """
+    return {item.strip() for item in value.split(',') if item.strip()}
+
+
+def get_sparse_params(request):
+    """
+    Возвращает параметры выборочного вывода полей из запроса: (fields, expand).
+
+    fields - множество полей верхнего уровня, expand - множество раскрываемых вложенных связей
+    (через точку для более глубоких уровней, например 'modules.lessons').
+    Если ни один из параметров ?fields= и ?expand= не передан, возвращается (None, None) -
+    в этом случае выводятся все поля и все вложенные связи.
+    """
+    if request is None or request.method != 'GET':
+        return None, None
+    fields_param = request.query_params.get('fields')
+    expand_param = request.query_params.get('expand')
+    if fields_param is None and expand_param is None:
+        return None, None
+
+    fields = parse_list_param(fields_param) if fields_param is not None else None
+    expand = set()
+    for path in parse_list_param(expand_param or ''):
+        parts = path.split('.')
+        expand.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    if fields is not None:
+        # Связь, указанная в fields, тоже считается раскрытой
+        expand.update(fields)
+    return fields, expand
+
+
+def get_nested_expand(expand, name):
+    """ Возвращает раскрываемые связи вложенного serializer'а для связи name. """
+    if expand is None:
+        return None
+    prefix = f'{name}.'
+    return {path[len(prefix):] for path in expand if path.startswith(prefix)}
+
+
+class SparseFieldsMixin:
+    """
+    Выборочный вывод полей (?fields=) и раскрытие вложенных связей (?expand=).
+
+    Вложенные связи перечислены в expandable_fields. Если клиент передал ?fields= или ?expand=,
+    нераскрытые связи не сериализуются, а поля, не указанные в fields, не выводятся.
+    Для вложенных serializer'ов параметры передаются явно через аргументы fields и expand.
+    """
+
+    expandable_fields = ()
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sparse_params = (fields, expand) if fields is not None or expand is not None else None
+
+    def get_sparse_params(self):
+        if self._sparse_params is not None:
+            return self._sparse_params
+        return get_sparse_params(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, expand = self.get_sparse_params()
+        if expand is None:
+            return fields
+
+        for name in list(fields):
+            if name in self.expandable_fields:
+                if name not in expand:
+                    fields.pop(name)
+            elif only is not None and name not in only:
+                fields.pop(name)
+        return fields
+
+    def get_nested_expand(self, name):
+        """ Возвращает раскрываемые связи для вложенного serializer'а связи name. """
+        return get_nested_expand(self.get_sparse_params()[1], name)
+
+
+class ImageDerivativesField(serializers.Field):
+    """ Ссылки на уменьшенные копии изображения: {размер: {формат: url}}, пока копии не созданы - {}. """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return get_derivative_urls(instance, self.image_field, self.context.get('request'))
+
+
+class CourseSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ Serializer для модели Course. """
 
     count_modules = serializers.SerializerMethodField(read_only=True)
@@ -11,18 +105,24 @@ class CourseSerializer(serializers.ModelSerializer):
     is_enrolled = serializers.SerializerMethodField(read_only=True)
 
     def get_count_modules(self, instance):
-        """ Получаем количество модулей в курсе. """
-        return Module.objects.filter(course=instance).count()
+        """ Получаем количество модулей в курсе из аннотации queryset. """
+        if hasattr(instance, 'count_modules'):
+            return instance.count_modules
+        return instance.modules.count()
 
     def get_modules(self, instance):
-        """ Получаем список модулей курса. """
-        modules = Module.objects.filter(course=instance)
-        return ModuleSerializer(modules, many=True).data
+        """ Получаем список модулей курса (используются предзагруженные модули, если они есть). """
+        modules = instance.modules.all()
+        return ModuleSerializer(modules, many=True, expand=self.get_nested_expand('modules')).data
 
     def get_is_enrolled(self, instance):
-        """ Получаем статус зачисления на курс. """
+        """ Получаем статус зачисления на курс из аннотации queryset. """
+        if hasattr(instance, 'is_enrolled'):
+            return instance.is_enrolled
         user = self.context['request'].user
-        return Enrollment.objects.filter(student=user, course=instance).exists()
+        return Enrollment.objects.filter(student=user.pk, course=instance).exists()
+
+    expandable_fields = ('modules',)
 
     class Meta:
         model = Course
@@ -34,24 +134,28 @@ class CourseSerializer(serializers.ModelSerializer):
         ]
 
 
-class ModuleSerializer(serializers.ModelSerializer):
+class ModuleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ Serializer для модели Module. """
 
     count_lessons = serializers.SerializerMethodField(read_only=True)
     lessons = serializers.SerializerMethodField(read_only=True)
 
     def get_count_lessons(self, instance):
-        """ Получаем количество уроков. """
-        return Lesson.objects.filter(module=instance).count()
+        """ Получаем количество уроков из аннотации queryset. """
+        if hasattr(instance, 'count_lessons'):
+            return instance.count_lessons
+        return instance.lessons.count()
 
     def get_lessons(self, instance):
-        """ Получаем список уроков. """
-        modules = Lesson.objects.filter(module=instance)
-        return LessonSerializer(modules, many=True).data
+        """ Получаем список уроков (используются предзагруженные уроки, если они есть). """
+        lessons = instance.lessons.all()
+        return LessonSerializer(lessons, many=True).data
+
+    expandable_fields = ('lessons',)
 
     class Meta:
         model = Module
-        fields = '__all__'
+        exclude = ('updated_at', 'search_vector')
         read_only_fields = ('owner',)
         validators = [TitleValidator('title')]
 
@@ -59,17 +163,78 @@ class ModuleSerializer(serializers.ModelSerializer):
 class LessonSerializer(serializers.ModelSerializer):
     """ Serializer для модели Lesson. """
 
+    image_thumbnails = ImageDerivativesField('image')
+
     class Meta:
         model = Lesson
-        fields = '__all__'
+        exclude = ('updated_at', 'search_vector', 'image_derivatives')
         read_only_fields = ('owner',)
         validators = [TitleValidator('title')]
 
 
+class CourseCloneSerializer(serializers.Serializer):
+    """ Serializer для копирования курса: название копии (по умолчанию - см. materials.services.get_clone_title). """
+
+    title = serializers.CharField(max_length=100, required=False,
+                                  validators=[UniqueValidator(queryset=Course.objects.all())])
+
+    class Meta:
+        validators = [TitleValidator('title')]
+
+
+class CourseImportSerializer(serializers.Serializer):
+    """ Serializer для загрузки курса из файла JSON Lines. """
+
+    file = serializers.FileField()
+
+
+class MoveSerializer(serializers.Serializer):
+    """ Serializer для перемещения модуля или урока. """
+
+    after = serializers.IntegerField(allow_null=True, required=False,
+                                     help_text='id соседа, после которого поместить объект (null - в начало)')
+
+
+class ModuleReorderSerializer(serializers.Serializer):
+    """ Serializer для установки порядка модулей курса. """
+
+    modules = serializers.ListField(child=serializers.IntegerField(), help_text='id всех модулей курса по порядку')
+
+
+class LessonReorderSerializer(serializers.Serializer):
+    """ Serializer для установки порядка уроков модуля. """
+
+    lessons = serializers.ListField(child=serializers.IntegerField(), help_text='id всех уроков модуля по порядку')
+
+
 class EnrollmentSerializer(serializers.ModelSerializer):
     """ Serializer для модели Enrollment. """
 
     class Meta:
         model = Enrollment
         fields = '__all__'
-        read_only_fields = ('student',)
+        read_only_fields = ('student', 'created_at', 'is_notified')
+
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    """ Serializer для массового зачисления студентов на курс. """
+
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.select_related('owner'))
+    students = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False,
+                                     help_text='Список id студентов')
+    email_domain = serializers.CharField(required=False, help_text='Зачислить всех студентов с email в этом домене')
+
+    def validate(self, attrs):
+        if ('students' in attrs) == ('email_domain' in attrs):
+            raise serializers.ValidationError("Укажите либо список студентов (students), либо домен (email_domain).")
+        return attrs
+
+
+class SearchResultSerializer(serializers.Serializer):
+    """ Serializer для результатов поиска по материалам. """
+
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    description = serializers.CharField(allow_null=True)
+    rank = serializers.FloatField()
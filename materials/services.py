@@ -0,0 +1,343 @@
+import csv
+import io
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Value
+
+from materials.models import Course, Module, Lesson, Enrollment
+from materials.serializers import CourseSerializer, get_nested_expand
+from tests.models import Test, Question, Answer
+
+COURSE_TREE_CACHE_KEY = 'materials:course_tree:v1:{}'
+SEARCH_CONFIG = 'russian'
+
+ENROLLMENT_ACTIONS = ('toggle', 'enroll', 'unenroll')
+BULK_ENROLLMENT_CHUNK_SIZE = 5000
+
+ENROLLMENT_EXPORT_FIELDS = ('id', 'student', 'course', 'created_at')
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_CHUNK_SIZE = 2000
+
+# Поля, которые не копируются при клонировании курса (заполняются заново)
+CLONE_EXCLUDED_FIELDS = {'id', 'updated_at', 'search_vector'}
+CLONE_BATCH_SIZE = 2000
+# Сколько вариантов названия копии курса проверяется одним запросом
+CLONE_TITLE_BATCH_SIZE = 20
+
+EnrollmentResult = namedtuple('EnrollmentResult', ('course_title', 'owner_email', 'enrolled', 'unenrolled'))
+
+
+def filter_by_role(queryset, user):
+    """ Ограничивает queryset материалов в зависимости от роли пользователя. """
+    if user.role in ['admin', 'student']:
+        return queryset
+    return queryset.filter(owner=user)
+
+
+def get_modules_queryset(queryset, fields=None, expand=None):
+    """
+    Добавляет к queryset модулей количество уроков и предзагруженный список уроков.
+
+    fields и expand - параметры выборочного вывода (см. materials.serializers.get_sparse_params):
+    неиспользуемые аннотации и предзагрузки не добавляются.
+    """
+    if fields is None or 'count_lessons' in fields:
+        queryset = queryset.annotate(count_lessons=Count('lessons', distinct=True))
+    if expand is None or 'lessons' in expand:
+        queryset = queryset.prefetch_related(Prefetch('lessons', queryset=Lesson.objects.defer('search_vector')))
+    # Meta.ordering не применяется к запросам с GROUP BY, поэтому сортировка задается явно
+    return queryset.defer('search_vector').order_by(*Module._meta.ordering)
+
+
+def get_courses_queryset(queryset, user=None, fields=None, expand=None):
+    """
+    Добавляет к queryset курсов количество модулей, статус зачисления пользователя
+    и предзагруженное дерево модулей и уроков.
+
+    Количество запросов к базе данных не зависит от количества курсов на странице.
+    Если пользователь не передан, статус зачисления не вычисляется.
+    fields и expand ограничивают аннотации и предзагрузки запрошенными клиентом полями.
+    """
+    if fields is None or 'count_modules' in fields:
+        queryset = queryset.annotate(count_modules=Count('modules', distinct=True))
+    if user is not None and (fields is None or 'is_enrolled' in fields):
+        queryset = queryset.annotate(
+            is_enrolled=Exists(Enrollment.objects.filter(student=user.pk, course=OuterRef('pk')))
+        )
+    if expand is None or 'modules' in expand:
+        modules = get_modules_queryset(Module.objects.all(), expand=get_nested_expand(expand, 'modules'))
+        queryset = queryset.prefetch_related(Prefetch('modules', queryset=modules))
+    # Meta.ordering не применяется к запросам с GROUP BY, поэтому сортировка задается явно
+    return queryset.defer('search_vector').order_by('pk')
+
+
+def build_course_trees(course_ids):
+    """ Сериализует дерево курсов (курс, модули, уроки, количества) без данных, зависящих от пользователя. """
+    courses = get_courses_queryset(Course.objects.filter(pk__in=course_ids))
+    serializer = CourseSerializer(courses, many=True)
+    serializer.child.fields.pop('is_enrolled')
+    return {item['id']: item for item in serializer.data}
+
+
+def get_course_trees(course_ids):
+    """
+    Возвращает деревья курсов из кеша, недостающие деревья строятся одним набором запросов
+    и сохраняются в кеш. Если кеш отключен, деревья строятся каждый раз.
+    """
+    course_ids = set(course_ids)
+    if not settings.CACHE_ENABLED:
+        return build_course_trees(course_ids)
+
+    keys = {COURSE_TREE_CACHE_KEY.format(pk): pk for pk in course_ids}
+    trees = {keys[key]: tree for key, tree in cache.get_many(keys).items()}
+    missing = course_ids - trees.keys()
+    if missing:
+        built = build_course_trees(missing)
+        cache.set_many({COURSE_TREE_CACHE_KEY.format(pk): tree for pk, tree in built.items()},
+                       timeout=settings.COURSE_TREE_CACHE_TIMEOUT)
+        trees.update(built)
+    return trees
+
+
+def get_course_tree(course_id):
+    """ Возвращает дерево одного курса. """
+    return get_course_trees([course_id]).get(course_id)
+
+
+def invalidate_course_trees(course_ids):
+    """ Удаляет из кеша деревья указанных курсов. """
+    keys = [COURSE_TREE_CACHE_KEY.format(pk) for pk in course_ids if pk is not None]
+    if keys and settings.CACHE_ENABLED:
+        cache.delete_many(keys)
+
+
+def search_materials(text, user):
+    """
+    Полнотекстовый поиск по курсам, модулям и урокам с учетом роли пользователя.
+
+    Используются поисковые векторы, поддерживаемые триггером, и GIN-индексы;
+    релевантность вычисляется и сортируется в базе данных.
+    """
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    querysets = []
+    for kind, model in (('course', Course), ('module', Module), ('lesson', Lesson)):
+        queryset = filter_by_role(model.objects.all(), user).filter(search_vector=query).annotate(
+            type=Value(kind),
+            rank=SearchRank(F('search_vector'), query),
+        )
+        querysets.append(queryset.values('id', 'title', 'description', 'type', 'rank').order_by())
+    first, *others = querysets
+    return first.union(*others, all=True).order_by('-rank', 'type', 'id')
+
+
+def is_enrollment_digest_enabled():
+    """ Уведомления о зачислениях отправляются преподавателям периодической сводкой (см. send_enrollment_digests). """
+    return settings.ENROLLMENT_NOTIFICATION_MODE == 'digest'
+
+
+def change_enrollment(student, course_id, action='toggle'):
+    """
+    Зачисляет (enroll), отчисляет (unenroll) или переключает статус зачисления (toggle)
+    студента одним SQL-запросом.
+
+    Вставка выполняется через INSERT ... ON CONFLICT DO NOTHING, удаление - через DELETE ... RETURNING,
+    поэтому повторные и одновременные запросы не создают дублей (см. ограничение unique_enrollment).
+    Возвращает EnrollmentResult с названием курса и email владельца или None, если курс не найден.
+    В режиме сводки новое зачисление остается в очереди уведомлений (is_notified = false).
+    """
+    assert action in ENROLLMENT_ACTIONS
+    qn = connection.ops.quote_name
+    enrollment = qn(Enrollment._meta.db_table)
+    course = qn(Course._meta.db_table)
+    user = qn(Course._meta.get_field('owner').related_model._meta.db_table)
+
+    deleted = 'SELECT NULL::bigint AS id WHERE FALSE'
+    if action in ('toggle', 'unenroll'):
+        deleted = f'DELETE FROM {enrollment} WHERE student_id = %(student)s AND course_id = %(course)s RETURNING id'
+
+    inserted = 'SELECT NULL::bigint AS id WHERE FALSE'
+    if action in ('toggle', 'enroll'):
+        # Данные, измененные в CTE deleted, не видны в этом же запросе, поэтому при toggle
+        # вставка выполняется только если удалять было нечего
+        skip_if_deleted = 'AND NOT EXISTS (SELECT 1 FROM deleted)' if action == 'toggle' else ''
+        inserted = f"""
+            INSERT INTO {enrollment} (student_id, course_id, is_notified)
+            SELECT %(student)s, id, %(notified)s FROM {course} WHERE id = %(course)s {skip_if_deleted}
+            ON CONFLICT (student_id, course_id) DO NOTHING
+            RETURNING id
+        """
+
+    sql = f"""
+        WITH deleted AS ({deleted}), inserted AS ({inserted})
+        SELECT course.title, owner.email,
+               EXISTS (SELECT 1 FROM inserted), EXISTS (SELECT 1 FROM deleted)
+        FROM {course} course LEFT JOIN {user} owner ON owner.id = course.owner_id
+        WHERE course.id = %(course)s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'student': student.pk, 'course': course_id,
+                             'notified': not is_enrollment_digest_enabled()})
+        row = cursor.fetchone()
+    return EnrollmentResult(*row) if row else None
+
+
+def _chunks(iterable, size):
+    """ Разбивает последовательность на списки длиной не больше size. """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_enroll(course, students, chunk_size=BULK_ENROLLMENT_CHUNK_SIZE):
+    """
+    Массово зачисляет студентов на курс.
+
+    students - queryset пользователей или список их id; зачисляются только пользователи с ролью student.
+    Вставка выполняется пачками через bulk_create(ignore_conflicts=True) в одной транзакции,
+    уже зачисленные студенты пропускаются.
+    О массовом зачислении владелец курса уведомляется одним итоговым письмом, поэтому в сводку оно не попадает.
+    Возвращает кортеж (количество новых зачислений, количество найденных студентов).
+    """
+    student_model = Course._meta.get_field('owner').related_model
+    if isinstance(students, (list, tuple, set)):
+        id_chunks = (
+            student_model.objects.filter(pk__in=chunk, role='student').values_list('pk', flat=True)
+            for chunk in _chunks(dict.fromkeys(students), chunk_size)
+        )
+        student_ids = (pk for chunk in id_chunks for pk in chunk)
+    else:
+        student_ids = students.filter(role='student').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+
+    with transaction.atomic():
+        # Блокировка курса сериализует массовые зачисления, чтобы подсчет новых записей был точным
+        Course.objects.select_for_update().filter(pk=course.pk).exists()
+        enrollments = Enrollment.objects.filter(course=course)
+        count_before = enrollments.count()
+        count_students = 0
+        for chunk in _chunks(student_ids, chunk_size):
+            Enrollment.objects.bulk_create(
+                [Enrollment(student_id=pk, course=course, is_notified=True) for pk in chunk],
+                ignore_conflicts=True,
+            )
+            count_students += len(chunk)
+        return enrollments.count() - count_before, count_students
+
+
+def iter_export(queryset, fields, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Построчно выгружает queryset в формате NDJSON или CSV для StreamingHttpResponse.
+
+    Строки читаются серверным курсором через values_list().iterator(chunk_size), модели не создаются,
+    а текст отдается частями по chunk_size строк, поэтому потребление памяти не зависит от размера выгрузки.
+    """
+    assert export_format in EXPORT_FORMATS
+    rows = queryset.values_list(*fields).order_by('pk').iterator(chunk_size=chunk_size)
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for chunk in _chunks(rows, chunk_size):
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.getvalue():
+            # Пустая выгрузка: только заголовок
+            yield buffer.getvalue()
+        return
+
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in chunk
+        )
+
+
+def get_course_tests(course):
+    """ Возвращает тесты курса: привязанные к самому курсу, его модулям или урокам. """
+    return Test.objects.filter(Q(course=course) | Q(module__course=course) | Q(lesson__module__course=course))
+
+
+def count_course_rows(course):
+    """ Возвращает количество уроков, вопросов и ответов курса - оценку объема копирования. """
+    tests = get_course_tests(course)
+    return (Lesson.objects.filter(module__course=course).count()
+            + Question.objects.filter(test__in=tests).count()
+            + Answer.objects.filter(question__test__in=tests).count())
+
+
+def _clone_rows(model, queryset, remap=None, **values):
+    """
+    Копирует строки queryset одним bulk_create.
+
+    remap - соответствие старых и новых id для внешних ключей ({'module_id': {старый id: новый id}}),
+    ключи на объекты вне копируемого курса обнуляются; values - значения полей, общие для всех копий.
+    Возвращает соответствие {старый id: новый id}.
+    """
+    remap = remap or {}
+    # values могут задаваться по имени поля (owner) или по attname (course_id): исключаются оба варианта,
+    # иначе скопированный owner_id исходной строки перекрыл бы нового владельца
+    overridden = {model._meta.get_field(name).attname for name in values}
+    fields = [field.attname for field in model._meta.concrete_fields
+              if field.attname not in CLONE_EXCLUDED_FIELDS and field.attname not in overridden]
+    rows = list(queryset.order_by('pk').values_list('pk', *fields))
+    objects = []
+    for pk, *row in rows:
+        data = dict(zip(fields, row))
+        for attname, mapping in remap.items():
+            if data[attname] is not None:
+                data[attname] = mapping.get(data[attname])
+        objects.append(model(**data, **values))
+    created = model.objects.bulk_create(objects, batch_size=CLONE_BATCH_SIZE)
+    return {row[0]: obj.pk for row, obj in zip(rows, created)}
+
+
+def get_clone_title(course):
+    """
+    Возвращает свободное название копии курса по умолчанию: '<название> (копия)', если оно занято -
+    '<название> (копия 2)', '<название> (копия 3)' и т. д. Название курса сокращается до 100 символов с суффиксом.
+    """
+    start = 1
+    while True:
+        candidates = []
+        for number in range(start, start + CLONE_TITLE_BATCH_SIZE):
+            suffix = ' (копия)' if number == 1 else f' (копия {number})'
+            candidates.append(course.title[:100 - len(suffix)] + suffix)
+        taken = set(Course.objects.filter(title__in=candidates).values_list('title', flat=True))
+        for candidate in candidates:
+            if candidate not in taken:
+                return candidate
+        start += CLONE_TITLE_BATCH_SIZE
+
+
+def clone_course(course, owner, title=None):
+    """
+    Копирует курс со всеми модулями, уроками, тестами, вопросами и ответами в одной транзакции.
+
+    Каждая модель копируется одним SELECT и одним bulk_create с переназначенными внешними ключами,
+    поэтому количество запросов не зависит от размера курса. Владельцем всех копий становится owner.
+    Изображения уроков и их уменьшенные копии используются совместно с оригиналом.
+    """
+    with transaction.atomic():
+        new_course = Course.objects.create(title=title or course.title, description=course.description, owner=owner)
+        modules = _clone_rows(Module, Module.objects.filter(course=course), course_id=new_course.pk, owner=owner)
+        lessons = _clone_rows(Lesson, Lesson.objects.filter(module__course=course), {'module_id': modules},
+                              owner=owner)
+        tests = get_course_tests(course)
+        new_tests = _clone_rows(Test, tests, {'course_id': {course.pk: new_course.pk}, 'module_id': modules,
+                                              'lesson_id': lessons}, owner=owner)
+        questions = _clone_rows(Question, Question.objects.filter(test__in=tests), {'test_id': new_tests},
+                                owner=owner)
+        _clone_rows(Answer, Answer.objects.filter(question__test__in=tests), {'question_id': questions}, owner=owner)
+    return new_course
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from materials.images import derivatives_updated, schedule_derivatives
+from materials.ordering import next_position
+from materials.models import Course, Module, Lesson
+from materials.services import invalidate_course_trees
+
+
+def _invalidate_on_commit(course_ids):
+    """ Сбрасывает кеш деревьев курсов после фиксации транзакции. """
+    if course_ids and settings.CACHE_ENABLED:
+        transaction.on_commit(lambda: invalidate_course_trees(course_ids))
+
+
+def _touch(model, pks):
+    """ Обновляет дату изменения (версию) родительских объектов. """
+    if pks:
+        model.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def _get_lesson_course_ids(module_ids):
+    """ Возвращает курсы, к которым относятся модули урока. """
+    if not module_ids:
+        return set()
+    return set(Module.objects.filter(pk__in=module_ids).values_list('course_id', flat=True))
+
+
+@receiver(pre_save, sender=Module)
+def remember_module_course(sender, instance, **kwargs):
+    """ Запоминает курс, к которому модуль относился до сохранения (модуль могут перенести в другой курс). """
+    instance._old_course_id = None
+    if instance.pk:
+        instance._old_course_id = Module.objects.filter(pk=instance.pk).values_list('course_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_module(sender, instance, **kwargs):
+    """ Запоминает модуль, к которому урок относился до сохранения. """
+    instance._old_module_id = None
+    if instance.pk:
+        instance._old_module_id = Lesson.objects.filter(pk=instance.pk).values_list('module_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Module)
+@receiver(pre_save, sender=Lesson)
+def assign_position(sender, instance, **kwargs):
+    """
+    Ставит новый модуль (урок) в конец курса (модуля). Перенесенный в другой курс (модуль)
+    объект также ставится в конец нового родителя.
+    """
+    parent_field = instance.position_parent_field
+    old_parent_id = getattr(instance, '_old_course_id' if sender is Module else '_old_module_id', None)
+    moved = not instance._state.adding and old_parent_id != getattr(instance, parent_field)
+    if (instance._state.adding and not instance.position) or moved:
+        instance.position = next_position(sender, parent_field, getattr(instance, parent_field))
+
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    """ Сбрасывает кеш дерева курса при его изменении или удалении. """
+    _invalidate_on_commit({instance.pk})
+
+
+@receiver([post_save, post_delete], sender=Module)
+def module_changed(sender, instance, **kwargs):
+    """ Обновляет версию и сбрасывает кеш деревьев текущего и прежнего курса модуля. """
+    course_ids = {instance.course_id, getattr(instance, '_old_course_id', None)} - {None}
+    _touch(Course, course_ids)
+    _invalidate_on_commit(course_ids)
+
+
+@receiver([post_save, post_delete], sender=Lesson)
+def lesson_changed(sender, instance, **kwargs):
+    """ Обновляет версии и сбрасывает кеш деревьев курсов текущего и прежнего модуля урока. """
+    module_ids = {instance.module_id, getattr(instance, '_old_module_id', None)} - {None}
+    course_ids = _get_lesson_course_ids(module_ids)
+    _touch(Module, module_ids)
+    _touch(Course, course_ids)
+    _invalidate_on_commit(course_ids)
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_image_changed(sender, instance, **kwargs):
+    """ Ставит в очередь создание уменьшенных копий нового изображения урока. """
+    schedule_derivatives(instance, 'image')
+
+
+@receiver(derivatives_updated, sender=Lesson)
+def lesson_derivatives_updated(sender, pk, **kwargs):
+    """
+    Обновляет версии урока, его модуля и курса и сбрасывает кеш дерева курса после записи
+    уменьшенных копий изображения: иначе закешированное дерево и ETag не содержали бы новых ссылок.
+    """
+    parents = Lesson.objects.filter(pk=pk).values_list('module_id', 'module__course_id').first()
+    if parents is None:
+        return
+    module_id, course_id = parents
+    _touch(Lesson, {pk})
+    _touch(Module, {module_id})
+    _touch(Course, {course_id})
+    _invalidate_on_commit({course_id})
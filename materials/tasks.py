@@ -1,6 +1,17 @@
+from collections import defaultdict
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import send_mail, get_connection, EmailMessage
+from django.db import transaction
 from config import settings
+from materials.images import generate_derivatives
+from materials.models import Course, Enrollment
+from materials.services import clone_course, is_enrollment_digest_enabled
+from users.models import User
+
+# Сколько студентов курса перечисляется в сводке поименно, остальные указываются количеством
+DIGEST_MAX_STUDENTS_PER_COURSE = 50
+DIGEST_UPDATE_CHUNK_SIZE = 5000
 
 
 @shared_task
@@ -13,3 +24,98 @@ def send_information_about_enrolling(course_title, first_name, last_name, studen
         settings.EMAIL_HOST_USER,
         [teacher_email],
         fail_silently=False)
+
+
+@shared_task
+def send_information_about_bulk_enrolling(course_title, count_enrolled, teacher_email):
+    """ Отправляет одно итоговое письмо о массовом зачислении студентов на курс. """
+
+    send_mail(
+        "Информация о зачислении",
+        f'На Ваш курс "{course_title}" зачислено студентов: {count_enrolled}.',
+        settings.EMAIL_HOST_USER,
+        [teacher_email],
+        fail_silently=False)
+
+
+def build_enrollment_digest(courses):
+    """ Формирует текст сводки о зачислениях: courses - словарь {id курса: список зачислений}. """
+    lines = ['На Ваши курсы зачислены студенты:']
+    for students in courses.values():
+        lines.append('')
+        lines.append(f'"{students[0]["course__title"]}":')
+        for student in students[:DIGEST_MAX_STUDENTS_PER_COURSE]:
+            lines.append(f'- {student["student__first_name"]} {student["student__last_name"]} '
+                         f'- {student["student__email"]}')
+        if len(students) > DIGEST_MAX_STUDENTS_PER_COURSE:
+            lines.append(f'и еще {len(students) - DIGEST_MAX_STUDENTS_PER_COURSE}')
+    return '\n'.join(lines)
+
+
+def _mark_notified(pks, is_notified=True):
+    """ Отмечает зачисления как отправленные в сводке (is_notified=False - возвращает их в очередь сводки). """
+    pks = list(pks)
+    for start in range(0, len(pks), DIGEST_UPDATE_CHUNK_SIZE):
+        Enrollment.objects.filter(pk__in=pks[start:start + DIGEST_UPDATE_CHUNK_SIZE]).update(is_notified=is_notified)
+
+
+@shared_task
+def send_enrollment_digests():
+    """
+    Отправляет каждому преподавателю одно письмо со всеми зачислениями на его курсы,
+    накопленными с прошлого запуска (периодическая задача celery beat). В режиме immediate
+    уведомления уже отправлены при зачислении, поэтому задача ничего не делает.
+
+    Зачисления захватываются до отправки: строки блокируются (заблокированные другим запуском пропускаются)
+    и сразу отмечаются отправленными, поэтому пересекающиеся запуски не отправят одну сводку дважды.
+    Все письма отправляются через одно SMTP-соединение; зачисления преподавателя, письмо которому
+    отправить не удалось, возвращаются в очередь и попадут в следующую сводку.
+    Возвращает количество отправленных писем.
+    """
+    if not is_enrollment_digest_enabled():
+        return 0
+
+    with transaction.atomic():
+        pending = list(Enrollment.objects.filter(is_notified=False).select_for_update(
+            skip_locked=True, of=('self',),
+        ).values(
+            'pk', 'course_id', 'course__title', 'course__owner__email',
+            'student__first_name', 'student__last_name', 'student__email',
+        ).order_by('course__owner__email', 'course_id', 'pk'))
+        _mark_notified(enrollment['pk'] for enrollment in pending)
+
+    # Зачисления на курсы без владельца уведомлять некому, они остаются отмеченными
+    digests = defaultdict(lambda: defaultdict(list))
+    for enrollment in pending:
+        teacher_email = enrollment['course__owner__email']
+        if teacher_email:
+            digests[teacher_email][enrollment['course_id']].append(enrollment)
+
+    sent = 0
+    unsent = dict(digests)
+    try:
+        if digests:
+            with get_connection(fail_silently=False) as connection:
+                for teacher_email, courses in digests.items():
+                    message = EmailMessage("Сводка о зачислениях", build_enrollment_digest(courses),
+                                           settings.EMAIL_HOST_USER, [teacher_email], connection=connection)
+                    connection.send_messages([message])
+                    del unsent[teacher_email]
+                    sent += 1
+    finally:
+        _mark_notified((item['pk'] for courses in unsent.values() for students in courses.values()
+                        for item in students), is_notified=False)
+    return sent
+
+
+@shared_task
+def generate_image_derivatives(model_label, pk, field_name):
+    """ Создает уменьшенные копии загруженного изображения (см. materials.images.generate_derivatives). """
+    return generate_derivatives(model_label, pk, field_name)
+
+
+@shared_task
+def clone_course_task(course_id, owner_id, title=None):
+    """ Копирует большой курс в фоне (см. materials.services.clone_course). Возвращает id копии. """
+    course = Course.objects.get(pk=course_id)
+    return clone_course(course, User.objects.get(pk=owner_id), title).pk
@@ -1,7 +1,38 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from functools import partial
+from unittest.mock import patch
+
+from celery.signals import before_task_publish, task_prerun
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.db import connection
+from django.db.models import F, Q
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APITestCase
+from PIL import Image
+from prometheus_client import REGISTRY
+from config.middleware import get_query_shape
+from materials.images import generate_derivatives
+from materials.management.commands.bench_endpoints import EndpointBenchmark, DEFAULT_BUDGETS, get_routes, \
+    find_query_growth, find_data_growth, measure_data_growth, compare_with_budgets
+from materials.management.commands.check_query_plans import explain, get_full_scans
 from materials.models import Course, Lesson, Enrollment, Module
+from materials.services import get_course_tree, iter_export
+from materials.tasks import send_enrollment_digests, clone_course_task
+from materials.validators import ForbiddenWordsMatcher, TitleValidator, forbidden_words
+from tests.models import Test, Question, Answer, StudentAnswer, TestResult, RESULT_GRADED
 from users.models import User
 
 
@@ -51,6 +82,20 @@ class CourseTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.json(), {"detail": "No Course matches the given query."})
 
+    def test_retrieve_course_deleted(self):
+        """ Проверяем просмотр курса, удаленного между проверкой версии и загрузкой дерева курса. """
+
+        def delete_and_get_tree(course_id):
+            Course.objects.filter(pk=course_id).delete()
+            return get_course_tree(course_id)
+
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        with patch('materials.views.get_course_tree', side_effect=delete_and_get_tree):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json(), {"detail": "No Course matches the given query."})
+
     def test_course_update(self):
         """ Проверяем обновление курса преподавателем. """
 
@@ -97,6 +142,53 @@ class CourseTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
 
+    def test_course_list_num_queries(self):
+        """ Проверяем, что количество запросов при просмотре списка курсов не зависит от количества курсов. """
+
+        for i in range(5):
+            course = Course.objects.create(title=f'Course {i}', owner=self.teacher)
+            for j in range(3):
+                module = Module.objects.create(title=f'Module {i}.{j}', course=course, owner=self.teacher)
+                Lesson.objects.create(title=f'Lesson {i}.{j}', module=module, owner=self.teacher)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-list')
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'page_size': 15})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(data['results']), 6)
+        self.assertTrue(data['results'][0]['is_enrolled'])
+        self.assertEqual(data['results'][1]['count_modules'], 3)
+        self.assertEqual(data['results'][1]['modules'][0]['count_lessons'], 1)
+
+    def test_course_list_sparse_fields(self):
+        """ Проверяем выборочный вывод полей списка курсов без загрузки модулей. """
+
+        Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-list')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'id,title'})
+        self.assertEqual(response.json()['results'], [{'id': self.course.pk, 'title': 'Test Course'}])
+
+    def test_course_retrieve_expand(self):
+        """ Проверяем раскрытие модулей курса без уроков. """
+
+        module = Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+        Lesson.objects.create(title='Test Lesson', module=module, owner=self.teacher)
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        response = self.client.get(url, {'fields': 'title', 'expand': 'modules'})
+        data = response.json()
+        self.assertEqual(set(data), {'title', 'modules'})
+        self.assertNotIn('lessons', data['modules'][0])
+        self.assertEqual(data['modules'][0]['count_lessons'], 1)
+
+        response = self.client.get(url, {'fields': 'title', 'expand': 'modules.lessons'})
+        self.assertEqual(response.json()['modules'][0]['lessons'][0]['title'], 'Test Lesson')
+
 
 class ModuleTestCase(APITestCase):
     def setUp(self):
@@ -175,6 +267,7 @@ class ModuleTestCase(APITestCase):
                     "description": self.module.description,
                     "course": self.course.pk,
                     "owner": self.module.owner.pk,
+                    "position": self.module.position,
                     'lessons': [],
                     "count_lessons": 0
                 }
@@ -184,6 +277,125 @@ class ModuleTestCase(APITestCase):
         self.assertEqual(data, result)
 
 
+@override_settings(CACHE_ENABLED=True,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CourseTreeCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.module = Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+        self.lesson = Lesson.objects.create(title='Test Lesson', module=self.module, owner=self.teacher)
+
+    def test_retrieve_course_from_cache(self):
+        """ Проверяем, что повторный просмотр курса берет дерево курса из кеша. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        self.client.get(url)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['modules'][0]['lessons'][0]['title'], 'Test Lesson')
+        self.assertTrue(data['is_enrolled'])
+
+    def test_lesson_update_invalidates_cache(self):
+        """ Проверяем сброс кеша дерева курса при изменении урока. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lesson.title = 'Test Lesson Update'
+            self.lesson.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['modules'][0]['lessons'][0]['title'], 'Test Lesson Update')
+
+    def test_module_move_invalidates_both_courses(self):
+        """ Проверяем сброс кеша обоих курсов при переносе модуля. """
+
+        course2 = Course.objects.create(title='Test Course 2', owner=self.teacher)
+        self.client.force_authenticate(user=self.student)
+        self.client.get(reverse('materials:course-detail', args=(self.course.pk,)))
+        self.client.get(reverse('materials:course-detail', args=(course2.pk,)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.module.course = course2
+            self.module.save()
+
+        response = self.client.get(reverse('materials:course-detail', args=(self.course.pk,)))
+        self.assertEqual(response.json()['count_modules'], 0)
+        response = self.client.get(reverse('materials:course-detail', args=(course2.pk,)))
+        self.assertEqual(response.json()['count_modules'], 1)
+
+    def test_module_list_from_cache(self):
+        """ Проверяем, что список модулей собирается из закешированных деревьев курсов. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:module-list')
+        self.client.get(url)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['count_lessons'], 1)
+        self.assertEqual(data['results'][0]['lessons'][0]['id'], self.lesson.pk)
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.module = Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+        self.lesson = Lesson.objects.create(title='Test Lesson', module=self.module, owner=self.teacher)
+
+    def test_course_not_modified(self):
+        """ Проверяем ответ 304 на повторный запрос курса с ETag. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_modified_by_lesson_and_enrollment(self):
+        """ Проверяем смену ETag курса при изменении урока и при зачислении на курс. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:course-detail', args=(self.course.pk,))
+        etag = self.client.get(url)['ETag']
+
+        self.lesson.title = 'Test Lesson Update'
+        self.lesson.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        Enrollment.objects.create(student=self.student, course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['is_enrolled'])
+
+    def test_lesson_if_modified_since(self):
+        """ Проверяем ответ 304 на запрос урока с If-Modified-Since. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:lesson-detail', args=(self.lesson.pk,))
+        last_modified = self.client.get(url)['Last-Modified']
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
 class LessonTestCase(APITestCase):
     def setUp(self):
         self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
@@ -262,13 +474,36 @@ class LessonTestCase(APITestCase):
                     "module": self.module.pk,
                     "owner": self.lesson.owner.pk,
                     "video": self.lesson.video,
-                    "image": self.lesson.image
+                    "image": self.lesson.image,
+                    "position": self.lesson.position,
+                    "image_thumbnails": {}
                 }
             ]
         }
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(data, result)
 
+    def test_lesson_list_cursor_pagination(self):
+        """ Проверяем курсорную пагинацию списка уроков. """
+
+        for i in range(6):
+            Lesson.objects.create(title=f'Lesson {i}', module=self.module, owner=self.teacher)
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:lesson-list')
+        response = self.client.get(url, {'pagination': 'cursor'})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', data)
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(data['results'][0]['id'], self.lesson.pk)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(data['next'])
+        data = response.json()
+        self.assertEqual([item['title'] for item in data['results']], ['Lesson 4', 'Lesson 5'])
+        self.assertIsNone(data['next'])
+
 
 class EnrollmentTestCase(APITestCase):
     def setUp(self):
@@ -320,3 +555,1018 @@ class EnrollmentTestCase(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.json(), {'message': 'Вы отчислились с курса'})
+
+    def test_enroll_unenroll_idempotent(self):
+        """ Проверяем повторное зачисление и отчисление студента одним запросом к базе данных. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:enrollment')
+        data = {'course': self.course.pk, 'action': 'enroll'}
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'message': 'Вы зачислены на курс'})
+        response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'message': 'Вы уже зачислены на курс'})
+        self.assertEqual(Enrollment.objects.filter(student=self.student, course=self.course).count(), 1)
+
+        data['action'] = 'unenroll'
+        response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'message': 'Вы отчислились с курса'})
+        response = self.client.post(url, data)
+        self.assertEqual(response.json(), {'message': 'Вы не зачислены на курс'})
+        self.assertFalse(Enrollment.objects.filter(student=self.student, course=self.course).exists())
+
+    def test_enrollment_unknown_course(self):
+        """ Проверяем зачисление на несуществующий курс и неизвестное действие. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:enrollment')
+        response = self.client.post(url, {'course': self.course.pk + 100})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(url, {'course': self.course.pk, 'action': 'delete'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class EnrollmentListTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email='admin@example.com', role='admin')
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.course = Course.objects.create(title='Test Course', owner=self.teacher)
+        self.course2 = Course.objects.create(title='Test Course 2')
+        self.students = User.objects.bulk_create(
+            [User(email=f'student{i}@example.com', role='student') for i in range(7)]
+        )
+        Enrollment.objects.bulk_create([Enrollment(student=student, course=self.course) for student in self.students])
+        Enrollment.objects.create(student=self.students[0], course=self.course2)
+
+    def test_list_paginated(self):
+        """ Проверяем постраничный вывод зачислений. """
+
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('materials:enrollment')
+        response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data['count'], 8)
+        self.assertEqual(len(data['results']), 5)
+
+        response = self.client.get(url, {'pagination': 'cursor'})
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_export_ndjson(self):
+        """ Проверяем потоковую выгрузку зачислений преподавателя в формате NDJSON. """
+
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('materials:enrollment'), {'export': 'ndjson'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual({row['course'] for row in rows}, {self.course.pk})
+        self.assertEqual(set(rows[0]), {'id', 'student', 'course', 'created_at'})
+
+    def test_export_csv(self):
+        """ Проверяем потоковую выгрузку зачислений в формате CSV частями. """
+
+        self.client.force_authenticate(user=self.admin)
+        with patch('materials.views.iter_export', wraps=partial(iter_export, chunk_size=3)) as mock_export:
+            response = self.client.get(reverse('materials:enrollment'), {'export': 'csv'})
+            chunks = list(response.streaming_content)
+        mock_export.assert_called_once()
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(b''.join(chunks).decode().splitlines()))
+        self.assertEqual(rows[0], ['id', 'student', 'course', 'created_at'])
+        self.assertEqual(len(rows), 9)
+
+    def test_export_unknown_format(self):
+        """ Проверяем выгрузку в неизвестном формате. """
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('materials:enrollment'), {'export': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkEnrollmentTestCase(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email='admin@example.com', role='admin')
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.course = Course.objects.create(title='Test Course', owner=self.teacher)
+        self.students = User.objects.bulk_create(
+            [User(email=f'student{i}@univ.example.com', role='student') for i in range(30)]
+        )
+        Enrollment.objects.create(student=self.students[0], course=self.course)
+
+    @patch('materials.views.send_information_about_bulk_enrolling.delay')
+    def test_bulk_enroll_list(self, mock_delay):
+        """ Проверяем массовое зачисление по списку студентов и одно итоговое письмо преподавателю. """
+
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('materials:enrollment-bulk')
+        ids = [student.pk for student in self.students[:10]] + [self.teacher2.pk]
+        response = self.client.post(url, {'course': self.course.pk, 'students': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'inserted': 9, 'skipped': 2})
+        self.assertEqual(Enrollment.objects.filter(course=self.course).count(), 10)
+        mock_delay.assert_called_once_with(self.course.title, 9, self.teacher.email)
+
+    @patch('materials.views.send_information_about_bulk_enrolling.delay')
+    def test_bulk_enroll_email_domain(self, mock_delay):
+        """ Проверяем массовое зачисление всех студентов по домену email. """
+
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('materials:enrollment-bulk')
+        response = self.client.post(url, {'course': self.course.pk, 'email_domain': 'univ.example.com'},
+                                    format='json')
+        self.assertEqual(response.json(), {'inserted': 29, 'skipped': 1})
+        self.assertEqual(mock_delay.call_count, 1)
+
+    def test_bulk_enroll_not_owner(self):
+        """ Проверяем массовое зачисление на чужой курс преподавателем. """
+
+        self.client.force_authenticate(user=self.teacher2)
+        url = reverse('materials:enrollment-bulk')
+        response = self.client.post(url, {'course': self.course.pk, 'students': [self.students[1].pk]},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class EnrollmentDigestTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.students = [User.objects.create(email=f'student{i}@example.com', role='student') for i in range(3)]
+        self.course = Course.objects.create(title='Test Course', owner=self.teacher)
+        self.course2 = Course.objects.create(title='Test Course 2', owner=self.teacher)
+        self.course3 = Course.objects.create(title='Test Course 3', owner=self.teacher2)
+
+    def enroll(self, student, course):
+        self.client.force_authenticate(user=student)
+        return self.client.post(reverse('materials:enrollment'), {'course': course.pk, 'action': 'enroll'})
+
+    @override_settings(ENROLLMENT_NOTIFICATION_MODE='digest')
+    @patch('materials.views.send_information_about_enrolling.delay')
+    def test_digest(self, mock_delay):
+        """ Проверяем отправку одной сводки каждому преподавателю через одно соединение. """
+
+        self.enroll(self.students[0], self.course)
+        self.enroll(self.students[1], self.course)
+        self.enroll(self.students[1], self.course2)
+        self.enroll(self.students[2], self.course3)
+        mock_delay.assert_not_called()
+        self.assertEqual(Enrollment.objects.filter(is_notified=False).count(), 4)
+
+        with patch('materials.tasks.get_connection', wraps=get_connection) as mock_connection:
+            self.assertEqual(send_enrollment_digests(), 2)
+        mock_connection.assert_called_once()
+        messages = {message.to[0]: message.body for message in mail.outbox}
+        self.assertEqual(set(messages), {self.teacher.email, self.teacher2.email})
+        self.assertIn('"Test Course 2":', messages[self.teacher.email])
+        self.assertEqual(messages[self.teacher.email].count('student1@example.com'), 2)
+        self.assertFalse(Enrollment.objects.filter(is_notified=False).exists())
+
+        self.assertEqual(send_enrollment_digests(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    @patch('materials.views.send_information_about_enrolling.delay')
+    def test_immediate(self, mock_delay):
+        """ Проверяем, что в режиме immediate письмо отправляется сразу и зачисление не попадает в сводку. """
+
+        self.enroll(self.students[0], self.course)
+        mock_delay.assert_called_once()
+        # Зачисление, созданное без change_enrollment (например, в админке), тоже не попадает в сводку
+        Enrollment.objects.create(student=self.students[1], course=self.course)
+        self.assertEqual(send_enrollment_digests(), 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(ENROLLMENT_NOTIFICATION_MODE='digest')
+    def test_digest_send_failure(self):
+        """ Проверяем, что зачисления, сводку о которых отправить не удалось, попадают в следующую сводку. """
+
+        Enrollment.objects.create(student=self.students[0], course=self.course)
+        Enrollment.objects.create(student=self.students[1], course=self.course3)
+        send_messages = mail.get_connection().__class__.send_messages
+
+        def fail_for_teacher(connection, messages):
+            if messages[0].to == [self.teacher.email]:
+                raise ConnectionError
+            return send_messages(connection, messages)
+
+        # Сводки отправляются в порядке email преподавателей: сначала teacher2, затем teacher
+        with patch.object(mail.get_connection().__class__, 'send_messages', fail_for_teacher):
+            with self.assertRaises(ConnectionError):
+                send_enrollment_digests()
+        self.assertEqual(list(Enrollment.objects.filter(is_notified=False).values_list('course', flat=True)),
+                         [self.course.pk])
+
+        self.assertEqual(send_enrollment_digests(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [[self.teacher2.email], [self.teacher.email]])
+        self.assertFalse(Enrollment.objects.filter(is_notified=False).exists())
+
+
+class SearchTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Программирование на Python', description='Основы языка',
+                                            owner=self.teacher)
+        self.module = Module.objects.create(title='Функции', description='Функции и модули в Python',
+                                            course=self.course, owner=self.teacher)
+        self.lesson = Lesson.objects.create(title='Рекурсия', description='Рекурсивные функции',
+                                            module=self.module, owner=self.teacher2)
+
+    def test_search_student(self):
+        """ Проверяем поиск с учетом морфологии и сортировку по релевантности. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('materials:search')
+        response = self.client.get(url, {'q': 'функция'})
+        data = response.json()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([(item['type'], item['id']) for item in data['results']],
+                         [('module', self.module.pk), ('lesson', self.lesson.pk)])
+
+    def test_search_teacher(self):
+        """ Проверяем, что преподаватель находит только свои материалы. """
+
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('materials:search')
+        response = self.client.get(url, {'q': 'функции'})
+        self.assertEqual([item['type'] for item in response.json()['results']], ['module'])
+
+    def test_search_after_update(self):
+        """ Проверяем обновление поискового вектора при изменении названия. """
+
+        self.course.title = 'Алгоритмы'
+        self.course.save()
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(reverse('materials:search'), {'q': 'алгоритм'})
+        self.assertEqual(response.json()['results'][0]['id'], self.course.pk)
+
+    def test_search_without_query(self):
+        """ Проверяем поиск без поискового запроса. """
+
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(reverse('materials:search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TitleValidatorTestCase(APITestCase):
+    def test_forbidden_words_from_settings(self):
+        """ Проверяем запрещенные слова из настроек, в том числе при большом словаре. """
+
+        validator = TitleValidator('title')
+        with self.assertRaises(ValidationError):
+            validator({'title': 'Курс по КРИПТОвалютам'})
+        validator({'title': 'Курс по Python'})
+        validator({'description': 'Без названия'})
+
+        words = [f'слово{i}' for i in range(500)] + ['python']
+        with self.settings(FORBIDDEN_WORDS=words):
+            with self.assertRaises(ValidationError):
+                validator({'title': 'Курс по Python'})
+
+    def test_forbidden_words_file_reload(self):
+        """ Проверяем, что изменения файла со словарем подхватываются без перезапуска. """
+
+        validator = TitleValidator('title')
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as file:
+            file.write('# словарь\npython\n')
+        self.addCleanup(os.remove, file.name)
+
+        with self.settings(FORBIDDEN_WORDS_FILE=file.name, FORBIDDEN_WORDS_CHECK_INTERVAL=0):
+            with self.assertRaises(ValidationError):
+                validator({'title': 'Курс по Python'})
+            validator({'title': 'Курс по Django'})
+
+            with open(file.name, 'w', encoding='utf-8') as changed:
+                changed.write('django\n')
+            stat = os.stat(file.name)
+            os.utime(file.name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+            validator({'title': 'Курс по Python'})
+            with self.assertRaises(ValidationError):
+                validator({'title': 'Курс по Django'})
+
+    def write_words_file(self, words):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as file:
+            file.write(words)
+        self.addCleanup(lambda: os.path.exists(file.name) and os.remove(file.name))
+        return file.name
+
+    def test_forbidden_words_file_check_interval(self):
+        """ Проверяем, что время изменения файла со словарем проверяется не чаще раза в интервал. """
+
+        path = self.write_words_file('python\n')
+        forbidden_words.reload()
+        with self.settings(FORBIDDEN_WORDS_FILE=path, FORBIDDEN_WORDS_CHECK_INTERVAL=60), \
+                patch('materials.validators.time.monotonic', return_value=1000) as monotonic, \
+                patch('materials.validators.os.stat', wraps=os.stat) as stat:
+            self.assertEqual(forbidden_words.search('Курс по Python'), 'python')
+            for _ in range(3):
+                forbidden_words.search('Курс по Django')
+            self.assertEqual(stat.call_count, 1)
+
+            with open(path, 'w', encoding='utf-8') as changed:
+                changed.write('django\n')
+            self.assertIsNone(forbidden_words.search('Курс по Django'))
+
+            monotonic.return_value = 1061
+            self.assertEqual(forbidden_words.search('Курс по Django'), 'django')
+            self.assertEqual(stat.call_count, 2)
+
+    def test_forbidden_words_file_missing(self):
+        """ Проверяем, что при недоступном файле со словарем используется последний загруженный словарь. """
+
+        path = self.write_words_file('python\n')
+        forbidden_words.reload()
+        validator = TitleValidator('title')
+        with self.settings(FORBIDDEN_WORDS_FILE=path, FORBIDDEN_WORDS_CHECK_INTERVAL=0):
+            validator({'title': 'Курс по Django'})
+            os.remove(path)
+            with self.assertLogs('materials.validators', 'WARNING'):
+                with self.assertRaises(ValidationError):
+                    validator({'title': 'Курс по Python'})
+
+        # До первой загрузки файла используются слова из настроек
+        with self.settings(FORBIDDEN_WORDS_FILE=path, FORBIDDEN_WORDS=['django']):
+            with self.assertLogs('materials.validators', 'WARNING'):
+                self.assertEqual(ForbiddenWordsMatcher().search('Курс по Django'), 'django')
+
+
+def make_image(name='image.png', size=(400, 300), mode='RGBA'):
+    """ Создает загружаемый файл изображения. """
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageDerivativesTestCase(APITestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media.name, IMAGE_DERIVATIVE_SIZES=[50, 100],
+                                                   IMAGE_DERIVATIVE_FORMATS=['webp', 'jpeg'])
+        self.settings_override.enable()
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.course = Course.objects.create(title='Test Course', owner=self.teacher)
+        self.module = Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    @patch('materials.tasks.generate_image_derivatives.delay')
+    def test_schedule_after_upload(self, mock_delay):
+        """ Проверяем постановку задачи после загрузки изображения и отсутствие задачи без изменения. """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(title='Lesson', module=self.module, image=make_image())
+        mock_delay.assert_called_once_with('materials.Lesson', lesson.pk, 'image')
+
+        generate_derivatives('materials.Lesson', lesson.pk, 'image')
+        lesson.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.title = 'Lesson 2'
+            lesson.save()
+        mock_delay.assert_called_once()
+
+    @patch('materials.tasks.generate_image_derivatives.delay')
+    def test_generate(self, mock_delay):
+        """ Проверяем создание копий, ссылки в ответе API и удаление копий прежнего изображения. """
+
+        lesson = Lesson.objects.create(title='Lesson', module=self.module, owner=self.teacher, image=make_image())
+        self.assertTrue(generate_derivatives('materials.Lesson', lesson.pk, 'image'))
+        self.assertFalse(generate_derivatives('materials.Lesson', lesson.pk, 'image'))
+        lesson.refresh_from_db()
+        sizes = lesson.image_derivatives['sizes']
+        self.assertEqual(set(sizes), {'50', '100'})
+        with Image.open(lesson.image.storage.path(sizes['100']['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (100, 75)))
+        with Image.open(lesson.image.storage.path(sizes['50']['jpeg'])) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (50, 38)))
+
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('materials:lesson-detail', args=[lesson.pk]))
+        thumbnails = response.json()['image_thumbnails']
+        self.assertTrue(thumbnails['50']['webp'].startswith('http://testserver/media/'))
+
+        old_path = lesson.image.storage.path(sizes['50']['webp'])
+        lesson.image = make_image('other.png')
+        lesson.save()
+        self.assertEqual(self.client.get(reverse('materials:lesson-detail', args=[lesson.pk])).json()
+                         ['image_thumbnails'], {})
+        generate_derivatives('materials.Lesson', lesson.pk, 'image')
+        self.assertFalse(os.path.exists(old_path))
+
+    @override_settings(CACHE_ENABLED=True,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('materials.tasks.generate_image_derivatives.delay')
+    def test_cached_course_after_generation(self, mock_delay):
+        """ Проверяем, что закешированный курс и его ETag обновляются после создания уменьшенных копий. """
+
+        cache.clear()
+        lesson = Lesson.objects.create(title='Lesson', module=self.module, image=make_image())
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('materials:course-detail', args=[self.course.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['modules'][0]['lessons'][0]['image_thumbnails'], {})
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_derivatives('materials.Lesson', lesson.pk, 'image')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        thumbnails = response.json()['modules'][0]['lessons'][0]['image_thumbnails']
+        self.assertEqual(set(thumbnails), {'50', '100'})
+
+    @patch('materials.tasks.generate_image_derivatives.delay')
+    def test_backfill(self, mock_delay):
+        """ Проверяем создание копий для уже загруженных изображений уроков и аватаров. """
+
+        Lesson.objects.create(title='Lesson', module=self.module, image=make_image())
+        Lesson.objects.create(title='Lesson without image', module=self.module)
+        self.teacher.avatar = make_image('avatar.png', mode='P')
+        self.teacher.save()
+
+        out = io.StringIO()
+        call_command('backfill_image_derivatives', workers=0, stdout=out)
+        self.assertIn('Создано копий: 2, ошибок: 0', out.getvalue())
+        self.teacher.refresh_from_db()
+        self.assertEqual(set(self.teacher.avatar_derivatives['sizes']['100']), {'webp', 'jpeg'})
+
+        call_command('backfill_image_derivatives', workers=0, stdout=out)
+        self.assertIn('Создано копий: 0, ошибок: 0', out.getvalue())
+
+
+class CourseCloneTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = self.make_course(modules=2, lessons=2, questions=2)
+
+    def make_course(self, modules, lessons, questions):
+        course = Course.objects.create(title='Test Course', description='Description', owner=self.teacher)
+        tests = [Test.objects.create(title='Course test', course=course, owner=self.teacher)]
+        for i in range(modules):
+            module = Module.objects.create(title=f'Module {i}', course=course, owner=self.teacher)
+            tests.append(Test.objects.create(title=f'Module test {i}', module=module, owner=self.teacher))
+            for j in range(lessons):
+                lesson = Lesson.objects.create(title=f'Lesson {i}.{j}', module=module, owner=self.teacher)
+                tests.append(Test.objects.create(title=f'Lesson test {i}.{j}', lesson=lesson, owner=self.teacher))
+        for test in tests:
+            for k in range(questions):
+                question = Question.objects.create(text=f'Question {k}', test=test, owner=self.teacher)
+                Answer.objects.create(text='Yes', is_correct=True, question=question, owner=self.teacher)
+                Answer.objects.create(text='No', question=question, owner=self.teacher)
+        return course
+
+    def clone(self, course, data=None):
+        return self.client.post(reverse('materials:course-clone', args=[course.pk]), data or {}, format='json')
+
+    def test_clone(self):
+        """ Проверяем копирование курса с модулями, уроками и тестами и переназначение связей. """
+
+        self.client.force_authenticate(user=self.teacher2)
+        self.assertEqual(self.clone(self.course).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.teacher)
+        response = self.clone(self.course, {'title': 'Test Course 2025'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data['title'], 'Test Course 2025')
+        self.assertEqual(data['count_modules'], 2)
+
+        new_course = Course.objects.get(pk=data['id'])
+        self.assertEqual(Lesson.objects.filter(module__course=new_course).count(), 4)
+        self.assertEqual(Lesson.objects.filter(module__course=self.course).count(), 4)
+        self.assertEqual(Test.objects.filter(course=new_course).count(), 1)
+        self.assertEqual(Test.objects.filter(module__course=new_course).count(), 2)
+        self.assertEqual(Test.objects.filter(lesson__module__course=new_course).count(), 4)
+        self.assertEqual(Question.objects.filter(test__lesson__module__course=new_course).count(), 8)
+        self.assertEqual(Answer.objects.filter(question__test__module__course=new_course, is_correct=True).count(),
+                         4)
+        self.assertEqual(Answer.objects.count(), 2 * 2 * 2 * 7)
+
+    def test_clone_by_other_user(self):
+        """ Проверяем, что при копировании чужого курса администратором он становится владельцем всех копий. """
+
+        admin = User.objects.create(email='admin@example.com', role='admin')
+        self.client.force_authenticate(user=admin)
+        response = self.clone(self.course, {'title': 'Admin copy'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        new_course = Course.objects.get(pk=response.json()['id'])
+        tests = Test.objects.filter(Q(course=new_course) | Q(module__course=new_course)
+                                    | Q(lesson__module__course=new_course))
+        copies = {
+            'course': Course.objects.filter(pk=new_course.pk),
+            'modules': Module.objects.filter(course=new_course),
+            'lessons': Lesson.objects.filter(module__course=new_course),
+            'tests': tests,
+            'questions': Question.objects.filter(test__in=tests),
+            'answers': Answer.objects.filter(question__test__in=tests),
+        }
+        for name, queryset in copies.items():
+            with self.subTest(name):
+                self.assertTrue(queryset.exists())
+                self.assertEqual(set(queryset.values_list('owner_id', flat=True)), {admin.pk})
+        self.assertEqual(set(Module.objects.filter(course=self.course).values_list('owner_id', flat=True)),
+                         {self.teacher.pk})
+
+    def test_clone_default_title(self):
+        """ Проверяем, что повторные копии без названия получают свободные названия по умолчанию. """
+
+        self.client.force_authenticate(user=self.teacher)
+        titles = [self.clone(self.course).json()['title'] for _ in range(3)]
+        self.assertEqual(titles, ['Test Course (копия)', 'Test Course (копия 2)', 'Test Course (копия 3)'])
+
+        self.course.title = 'К' * 100
+        self.course.save()
+        self.assertEqual(self.clone(self.course).json()['title'], 'К' * 92 + ' (копия)')
+        self.assertEqual(self.clone(self.course).json()['title'], 'К' * 90 + ' (копия 2)')
+
+    def test_clone_query_count(self):
+        """ Проверяем, что количество запросов не зависит от размера курса. """
+
+        big_course = self.make_course(modules=4, lessons=5, questions=5)
+        self.client.force_authenticate(user=self.teacher)
+        with CaptureQueriesContext(connection) as small:
+            self.clone(self.course, {'title': 'Small copy'})
+        with CaptureQueriesContext(connection) as big:
+            self.assertEqual(self.clone(big_course, {'title': 'Big copy'}).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(small), len(big))
+
+    def test_clone_forbidden(self):
+        """ Проверяем копирование курса студентом и название с запрещенным словом. """
+
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.clone(self.course).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.teacher)
+        self.assertEqual(self.clone(self.course, {'title': 'Казино'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.clone(self.course, {'title': 'Test Course'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(COURSE_CLONE_ASYNC_THRESHOLD=10)
+    @patch('materials.views.clone_course_task.delay')
+    def test_clone_async(self, mock_delay):
+        """ Проверяем копирование большого курса в фоновой задаче. """
+
+        mock_delay.return_value.id = 'task-id'
+        self.client.force_authenticate(user=self.teacher)
+        response = self.clone(self.course)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.json()['task_id'], 'task-id')
+        mock_delay.assert_called_once_with(self.course.pk, self.teacher.pk, 'Test Course (копия)')
+
+        new_course_id = clone_course_task(self.course.pk, self.teacher.pk, 'Copy')
+        self.assertEqual(Module.objects.filter(course_id=new_course_id).count(), 2)
+
+
+class CourseTransferTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Описание', owner=self.teacher)
+        module = Module.objects.create(title='Test Module', course=self.course, owner=self.teacher)
+        lesson = Lesson.objects.create(title='Test Lesson', module=module, video='https://example.com/video',
+                                       owner=self.teacher)
+        test = Test.objects.create(title='Lesson test', lesson=lesson, owner=self.teacher)
+        Test.objects.create(title='Course test', course=self.course, owner=self.teacher)
+        for i in range(3):
+            question = Question.objects.create(text=f'Question {i}', test=test, owner=self.teacher)
+            Answer.objects.create(text='Yes', is_correct=True, question=question, owner=self.teacher)
+            Answer.objects.create(text='No', question=question, owner=self.teacher)
+
+    def export(self):
+        response = self.client.get(reverse('materials:course-export', args=[self.course.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+
+    def upload(self, content):
+        file = SimpleUploadedFile('course.jsonl', content, content_type='application/x-ndjson')
+        return self.client.post(reverse('materials:course-import'), {'file': file}, format='multipart')
+
+    def test_export_import(self):
+        """ Проверяем выгрузку дерева курса и его загрузку другим преподавателем. """
+
+        self.client.force_authenticate(user=self.teacher)
+        content = self.export()
+        records = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(records[0]['type'], 'header')
+        self.assertEqual([record['type'] for record in records[1:4]], ['course', 'module', 'lesson'])
+        self.assertEqual(len(records), 1 + 1 + 1 + 1 + 2 + 3 + 6)
+
+        self.client.force_authenticate(user=self.teacher2)
+        response = self.upload(content)
+        self.assertEqual(response.json(), ["Строка 2: курс с названием 'Test Course' уже существует."])
+        self.course.title = 'Old Course'
+        self.course.save()
+        response = self.upload(content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['counts'], {'course': 1, 'module': 1, 'lesson': 1, 'test': 2,
+                                                     'question': 3, 'answer': 6})
+        course = Course.objects.get(pk=response.json()['id'])
+        self.assertEqual((course.owner, course.description), (self.teacher2, 'Описание'))
+        self.assertEqual(Test.objects.filter(lesson__module__course=course).count(), 1)
+        self.assertEqual(Answer.objects.filter(question__test__lesson__module__course=course, is_correct=True,
+                                               owner=self.teacher2).count(), 3)
+
+    def test_import_invalid(self):
+        """ Проверяем отклонение документа с запрещенными словами и неизвестными ссылками целиком. """
+
+        self.client.force_authenticate(user=self.teacher)
+        lines = self.export().decode().splitlines()
+        Course.objects.filter(pk=self.course.pk).update(title='Old Course')
+        bad = lines[:5] + [json.dumps({'type': 'test', 'id': 1, 'lesson': 999, 'title': 'Тест'})] + lines[5:]
+        bad[2] = bad[2].replace('Test Module', 'Казино')
+        response = self.upload('\n'.join(bad).encode())
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), ['Строка 3: использованы запрещенные слова.'])
+
+        bad[2] = lines[2]
+        response = self.upload('\n'.join(bad).encode())
+        self.assertEqual(response.json(), ['Строка 6: lesson с id 999 не найден в документе.'])
+        self.assertEqual(Course.objects.count(), 1)
+
+        response = self.upload(b'{"type": "course", "title": "Course"}')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_forbidden(self):
+        """ Проверяем выгрузку чужого курса и загрузку курса студентом. """
+
+        self.client.force_authenticate(user=self.teacher2)
+        response = self.client.get(reverse('materials:course-export', args=[self.course.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.upload(b'').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_commands(self):
+        """ Проверяем выгрузку и загрузку курса командами export_course и import_course. """
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'course.jsonl')
+            call_command('export_course', self.course.pk, output=path)
+            Course.objects.filter(pk=self.course.pk).update(title='Old Course')
+            out = io.StringIO()
+            call_command('import_course', path, owner=self.teacher2.email, chunk_size=2, stdout=out)
+        self.assertIn('question: 3, answer: 6', out.getvalue())
+        self.assertEqual(Question.objects.filter(owner=self.teacher2).count(), 3)
+
+
+class OrderingTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.teacher2 = User.objects.create(email='teacher2@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', owner=self.teacher)
+        self.modules = [Module.objects.create(title=f'Module {i}', course=self.course, owner=self.teacher)
+                        for i in range(3)]
+        self.lessons = [Lesson.objects.create(title=f'Lesson {i}', module=self.modules[0], owner=self.teacher)
+                        for i in range(4)]
+
+    def lesson_titles(self, module):
+        return list(module.lessons.values_list('title', flat=True))
+
+    def move_lesson(self, lesson, after):
+        return self.client.post(reverse('materials:lesson-move', args=[lesson.pk]), {'after': after}, format='json')
+
+    def test_new_objects_appended(self):
+        """ Проверяем, что новые и перенесенные в другой модуль уроки ставятся в конец. """
+
+        self.assertEqual(self.lesson_titles(self.modules[0]), ['Lesson 0', 'Lesson 1', 'Lesson 2', 'Lesson 3'])
+        positions = [lesson.position for lesson in self.lessons]
+        self.assertEqual(positions, sorted(positions))
+
+        Lesson.objects.create(title='Lesson 4', module=self.modules[1], owner=self.teacher)
+        lesson = self.lessons[0]
+        lesson.module = self.modules[1]
+        lesson.save()
+        self.assertEqual(self.lesson_titles(self.modules[1]), ['Lesson 4', 'Lesson 0'])
+
+    def test_move_lesson(self):
+        """ Проверяем, что перемещение урока изменяет одну строку и порядок в дереве курса. """
+
+        self.client.force_authenticate(user=self.student)
+        self.assertEqual(self.move_lesson(self.lessons[3], None).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.teacher2)
+        self.assertEqual(self.move_lesson(self.lessons[3], None).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move_lesson(self.lessons[3], self.lessons[0].pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "materials_lesson"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.lesson_titles(self.modules[0]), ['Lesson 0', 'Lesson 3', 'Lesson 1', 'Lesson 2'])
+
+        self.assertEqual(self.move_lesson(self.lessons[2], None).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.lesson_titles(self.modules[0]), ['Lesson 2', 'Lesson 0', 'Lesson 3', 'Lesson 1'])
+
+        response = self.client.get(reverse('materials:course-detail', args=[self.course.pk]))
+        lessons = [lesson['title'] for lesson in response.json()['modules'][0]['lessons']]
+        self.assertEqual(lessons, ['Lesson 2', 'Lesson 0', 'Lesson 3', 'Lesson 1'])
+
+        # Урок другого модуля не может быть соседом
+        other = Lesson.objects.create(title='Other', module=self.modules[1], owner=self.teacher)
+        self.assertEqual(self.move_lesson(self.lessons[0], other.pk).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_move_rebalance(self):
+        """ Проверяем перенумерацию позиций, когда между соседями не осталось свободных значений. """
+
+        Lesson.objects.filter(pk=self.lessons[1].pk).update(position=self.lessons[0].position + 1)
+        self.client.force_authenticate(user=self.teacher)
+        response = self.move_lesson(self.lessons[3], self.lessons[0].pk)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.lesson_titles(self.modules[0]), ['Lesson 0', 'Lesson 3', 'Lesson 1', 'Lesson 2'])
+        positions = list(self.modules[0].lessons.values_list('position', flat=True))
+        self.assertEqual(len(set(positions)), 4)
+
+    def test_reorder(self):
+        """ Проверяем установку порядка модулей курса и уроков модуля списком id. """
+
+        self.client.force_authenticate(user=self.teacher)
+        ids = [self.modules[2].pk, self.modules[0].pk, self.modules[1].pk]
+        url = reverse('materials:course-reorder', args=[self.course.pk])
+        response = self.client.post(url, {'modules': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('materials:course-detail', args=[self.course.pk]))
+        self.assertEqual([module['id'] for module in response.json()['modules']], ids)
+
+        response = self.client.post(url, {'modules': ids[:2]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        ids = [lesson.pk for lesson in reversed(self.lessons)]
+        url = reverse('materials:module-reorder', args=[self.modules[0].pk])
+        response = self.client.post(url, {'lessons': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'changed': 4})
+        self.assertEqual(self.lesson_titles(self.modules[0]), ['Lesson 3', 'Lesson 2', 'Lesson 1', 'Lesson 0'])
+
+        response = self.client.post(reverse('materials:module-move', args=[self.modules[1].pk]), {'after': None},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(self.course.modules.values_list('title', flat=True)),
+                         ['Module 1', 'Module 2', 'Module 0'])
+
+
+class QueryPlanTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        course = Course.objects.create(title='Test Course', owner=self.teacher)
+        module = Module.objects.create(title='Test Module', course=course, owner=self.teacher)
+        Lesson.objects.create(title='Test Lesson', module=module, owner=self.teacher)
+        Enrollment.objects.create(student=self.student, course=course)
+
+    def test_hot_querysets_use_indexes(self):
+        """ Проверяем, что для всех часто выполняемых запросов есть подходящие индексы. """
+
+        out = io.StringIO()
+        call_command('check_query_plans', '--disable-seqscan', stdout=out)
+        self.assertNotIn('Scan on', out.getvalue())
+
+    def test_seq_scan_detected(self):
+        """ Проверяем, что запрос без подходящего индекса обнаруживается. """
+
+        plan = explain(Course.objects.filter(description='Описание'), disable_seqscan=True)
+        self.assertEqual(get_full_scans(plan), ['Full Index Scan on materials_course'])
+        plan = explain(Course.objects.filter(description='Описание').order_by(), disable_seqscan=False)
+        self.assertEqual(get_full_scans(plan), ['Seq Scan on materials_course'])
+        with patch('materials.management.commands.check_query_plans.get_hot_querysets',
+                   return_value={'courses': Course.objects.filter(description='Описание')}):
+            with self.assertRaises(CommandError):
+                call_command('check_query_plans', '--disable-seqscan', stdout=io.StringIO())
+
+
+class SeedTestCase(APITestCase):
+    def seed(self, prefix, seed=1):
+        call_command('seed_lms', '--prefix', prefix, '--seed', str(seed), '--teachers', '2', '--students', '3',
+                     '--courses', '2', '--modules', '2', '--lessons', '2', '--questions', '3', '--answers', '3',
+                     '--enrollments', '2', '--attempts', '2', stdout=io.StringIO())
+
+    def test_seed(self):
+        """ Проверяем объемы и согласованность сгенерированных данных. """
+
+        self.seed('a')
+        self.assertEqual(User.objects.filter(role='teacher').count(), 2)
+        self.assertEqual(Course.objects.count(), 4)
+        self.assertEqual(Lesson.objects.count(), 16)
+        self.assertEqual(Test.objects.count(), 16)
+        self.assertEqual(Answer.objects.count(), 16 * 3 * 3)
+        self.assertEqual(Answer.objects.filter(is_correct=True).count(), 16 * 3)
+        self.assertEqual(Enrollment.objects.count(), 3 * 2)
+        self.assertEqual(TestResult.objects.count(), 3 * 2 * 2)
+        # Результаты создаются уже проверенными, иначе их подхватила бы периодическая задача проверки
+        self.assertFalse(TestResult.objects.exclude(status=RESULT_GRADED).exists())
+        self.assertEqual(StudentAnswer.objects.count(), 3 * 2 * 2 * 3)
+        # Уроки и тесты принадлежат преподавателю курса, результаты - тестам курсов студента
+        self.assertFalse(Lesson.objects.exclude(owner=F('module__course__owner')).exists())
+        self.assertFalse(TestResult.objects.exclude(test__lesson__module__course__enrollment__student=F('student'))
+                         .exists())
+        for result in TestResult.objects.all():
+            right = StudentAnswer.objects.filter(student=result.student, question__test=result.test,
+                                                 answer__is_correct=True).count()
+            self.assertEqual(result.count_right_answers, right)
+
+        with self.assertRaises(CommandError):
+            self.seed('a')
+
+    def test_seed_deterministic(self):
+        """ Проверяем, что при одинаковом зерне создаются одинаковые данные. """
+
+        self.seed('a')
+        self.seed('b')
+        self.seed('c', seed=2)
+        titles = {prefix: list(Lesson.objects.filter(owner__email__startswith=prefix).values_list('title', flat=True))
+                  for prefix in 'abc'}
+        self.assertEqual(titles['a'], titles['b'])
+        self.assertNotEqual(titles['a'], titles['c'])
+
+
+class EndpointBenchmarkTestCase(APITestCase):
+    def seed(self, prefix, students):
+        call_command('seed_lms', '--prefix', prefix, '--teachers', '1', '--students', str(students), '--courses', '3',
+                     '--modules', '2', '--lessons', '2', '--questions', '2', '--answers', '2', '--enrollments', '2',
+                     '--attempts', '2', stdout=io.StringIO())
+
+    def run_benchmark(self):
+        users = {role: User.objects.filter(role=role).order_by('pk').first()
+                 for role in ('admin', 'teacher', 'student')}
+        return EndpointBenchmark(users, repeat=1).run(get_routes())
+
+    def test_query_counts(self):
+        """ Проверяем, что количество запросов не растет с размером страницы и объемом данных. """
+
+        with open(DEFAULT_BUDGETS, encoding='utf-8') as file:
+            budgets = json.load(file)
+        self.seed('a', students=2)
+        small = self.run_benchmark()
+        self.assertIn('teacher materials:course-list', small)
+        self.assertEqual(find_query_growth(small, budgets), [])
+        self.assertEqual(compare_with_budgets(small, budgets, tolerance=100), [])
+
+        results = measure_data_growth(get_routes())
+        self.assertIn('student tests:question-list', results[1])
+        self.assertEqual(find_data_growth(results, budgets), [])
+        self.assertFalse(User.objects.filter(email__startswith='bench-growth-').exists())
+
+    def test_budget_violations(self):
+        """ Проверяем сравнение с бюджетами и запись бюджетов. """
+
+        self.seed('a', students=2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'budgets.json')
+            options = ['--repeat', '1', '--route', 'materials:course', '--budgets', path]
+            call_command('bench_endpoints', *options, '--update-budgets', stdout=io.StringIO())
+            call_command('bench_endpoints', *options, stdout=io.StringIO())
+
+            with open(path, encoding='utf-8') as file:
+                budgets = json.load(file)
+            budgets['teacher materials:course-list']['queries'] -= 1
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(budgets, file)
+            with self.assertRaisesMessage(CommandError, 'teacher materials:course-list: запросов'):
+                call_command('bench_endpoints', *options, stdout=io.StringIO())
+
+        results = {'teacher tests:results': {'queries_by_page_size': {2: 5, 15: 18}}}
+        self.assertEqual(find_query_growth(results), ['teacher tests:results'])
+        self.assertEqual(find_query_growth(results, {'teacher tests:results': {'allow_query_growth': True}}), [])
+
+        results = [{'student tests:question-list': {'queries': 2}, 'student tests:test-list': {'queries': 3}},
+                   {'student tests:question-list': {'queries': 7}, 'student tests:test-list': {'queries': 3}}]
+        self.assertEqual(find_data_growth(results), ['student tests:question-list'])
+
+
+class SQLInstrumentationTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        course = Course.objects.create(title='Test Course', owner=self.teacher)
+        test = Test.objects.create(title='Test', course=course, owner=self.teacher)
+        for i in range(6):
+            question = Question.objects.create(text=f'Question {i}', test=test, owner=self.teacher)
+            Answer.objects.create(text='Yes', is_correct=True, question=question, owner=self.teacher)
+        self.client.force_authenticate(user=self.teacher)
+
+    def test_query_shape(self):
+        """ Проверяем приведение запросов к форме без значений параметров. """
+
+        self.assertEqual(get_query_shape("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+                         "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+        self.assertEqual(get_query_shape('SELECT "t1"."id" FROM "t1" WHERE "t1"."id" = %s'),
+                         'SELECT "t1"."id" FROM "t1" WHERE "t1"."id" = ?')
+
+    @override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=1, SQL_REPEATED_QUERY_THRESHOLD=5)
+    def test_server_timing_and_repeated_queries(self):
+        """ Проверяем заголовок Server-Timing и обнаружение повторов запроса одной формы. """
+
+        with self.assertLogs('config.middleware', 'INFO') as logs:
+            response = self.client.get(reverse('materials:course-list'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(record['view'], 'materials:course-list')
+        self.assertEqual(record['repeated'], [])
+
+        # Без предзагрузки варианты ответов загружаются отдельным запросом для каждого вопроса
+        with patch('tests.views.get_questions_queryset', side_effect=lambda queryset, expand: queryset), \
+                self.assertLogs('config.middleware', 'WARNING') as logs:
+            self.client.get(reverse('tests:question-list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['repeated'][0]['count'], 6)
+        self.assertIn('"tests_answer"', record['repeated'][0]['sql'])
+
+    @override_settings(SQL_INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """ Проверяем, что запросы вне выборки не инструментируются. """
+
+        response = self.client.get(reverse('materials:course-list'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class MetricsTestCase(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.client.force_authenticate(user=self.teacher)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        """ Проверяем метрики HTTP-запросов с названием представления DRF и их отдачу на /metrics. """
+
+        labels = {'view': 'CourseViewSet.list', 'method': 'GET'}
+        count = self.sample('http_request_duration_seconds_count', **labels)
+        responses = self.sample('http_responses_total', status='200', **labels)
+        self.client.get(reverse('materials:course-list'))
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels), count + 1)
+        self.assertEqual(self.sample('http_responses_total', status='200', **labels), responses + 1)
+        self.assertGreater(self.sample('http_request_db_queries_sum', **labels), 0)
+
+        labels = {'view': 'TestResultListCreateAPIView.create', 'method': 'POST'}
+        forbidden = self.sample('http_responses_total', status='403', **labels)
+        self.client.post(reverse('tests:results'), {})
+        self.assertEqual(self.sample('http_responses_total', status='403', **labels), forbidden + 1)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",view="CourseViewSet.list"}',
+                      response.content.decode())
+
+    def test_metrics_access(self):
+        """ Проверяем, что метрики доступны только с разрешенных адресов или с токеном. """
+
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'], METRICS_TOKEN=None):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.1.2.3').status_code, status.HTTP_200_OK)
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code,
+                             status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer secret').status_code,
+                             status.HTTP_200_OK)
+
+    def test_metrics_from_container_directories(self):
+        """ Проверяем суммирование метрик процессов из каталогов разных контейнеров. """
+
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        key = mmap_key('http_responses_total', 'http_responses_total', ['view', 'method', 'status'],
+                       ['CourseViewSet.list', 'GET', '200'], 'Количество HTTP-ответов')
+        for container, value in (('app', 2), ('celery', 3)):
+            os.mkdir(os.path.join(root.name, container))
+            values = MmapedDict(os.path.join(root.name, container, 'counter_1.db'))
+            values.write_value(key, value, 0)
+            values.close()
+
+        with patch.dict(os.environ, PROMETHEUS_MULTIPROC_ROOT=root.name):
+            response = self.client.get(reverse('metrics'))
+        self.assertIn('http_responses_total{method="GET",status="200",view="CourseViewSet.list"} 5.0',
+                      response.content.decode())
+
+    def test_task_metrics(self):
+        """ Проверяем метрики времени выполнения задачи Celery и ожидания в очереди. """
+
+        task = send_enrollment_digests
+        labels = {'task': task.name}
+        runtime = self.sample('celery_task_runtime_seconds_count', state='SUCCESS', **labels)
+        task.apply()
+        self.assertEqual(self.sample('celery_task_runtime_seconds_count', state='SUCCESS', **labels), runtime + 1)
+
+        headers = {}
+        before_task_publish.send(sender=task.name, headers=headers)
+        wait = self.sample('celery_task_queue_wait_seconds_count', **labels)
+        task.push_request(published_at=headers['published_at'] - 2)
+        try:
+            task_prerun.send(sender=task, task_id='test', task=task)
+        finally:
+            task.pop_request()
+        self.assertEqual(self.sample('celery_task_queue_wait_seconds_count', **labels), wait + 1)
+        self.assertGreaterEqual(self.sample('celery_task_queue_wait_seconds_sum', **labels), 2)
@@ -0,0 +1,199 @@
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import serializers
+
+from materials.models import Course, Module, Lesson
+from materials.services import get_course_tests, _chunks
+from materials.validators import forbidden_words
+from tests.models import Test, Question, Answer
+
+TRANSFER_FORMAT = 'my_lms.course'
+TRANSFER_VERSION = 1
+TRANSFER_CHUNK_SIZE = 2000
+# Сколько ошибок показывать пользователю при отклонении импорта
+MAX_REPORTED_ERRORS = 20
+
+# Тип записи, модель, ссылки на родителей {ключ в записи: поле модели}, переносимые поля, проверяемое поле.
+# Записи в документе идут в этом порядке: родитель всегда раньше дочерних записей.
+RecordType = namedtuple('RecordType', ('name', 'model', 'parents', 'fields', 'checked_field'))
+RECORD_TYPES = (
+    RecordType('course', Course, {}, ('title', 'description'), 'title'),
+    RecordType('module', Module, {'course': 'course_id'}, ('title', 'description', 'position'), 'title'),
+    RecordType('lesson', Lesson, {'module': 'module_id'}, ('title', 'description', 'video', 'position'), 'title'),
+    RecordType('test', Test, {'course': 'course_id', 'module': 'module_id', 'lesson': 'lesson_id'},
+               ('title', 'description'), 'title'),
+    RecordType('question', Question, {'test': 'test_id'}, ('text',), 'text'),
+    RecordType('answer', Answer, {'question': 'question_id'}, ('text', 'is_correct'), 'text'),
+)
+RECORD_TYPES_BY_NAME = {record_type.name: record_type for record_type in RECORD_TYPES}
+# Типы записей, на которые ссылаются другие записи: только для них запоминаются новые id
+REFERENCED_TYPES = {key for record_type in RECORD_TYPES for key in record_type.parents}
+
+
+def get_course_querysets(course):
+    """ Возвращает queryset каждого типа записей дерева курса в порядке выгрузки. """
+    tests = get_course_tests(course)
+    return {
+        'course': Course.objects.filter(pk=course.pk),
+        'module': Module.objects.filter(course=course),
+        'lesson': Lesson.objects.filter(module__course=course),
+        'test': tests,
+        'question': Question.objects.filter(test__in=tests),
+        'answer': Answer.objects.filter(question__test__in=tests),
+    }
+
+
+def export_course(course, chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Выгружает дерево курса (курс, модули, уроки, тесты, вопросы, ответы) в формате JSON Lines.
+
+    Первая строка - заголовок с форматом и версией, далее по одной записи в строке:
+    {"type": ..., "id": ..., <ссылки на родителей>, <поля>}. Строки читаются серверным курсором
+    и отдаются частями по chunk_size, поэтому память не зависит от размера курса.
+    """
+    yield json.dumps({'type': 'header', 'format': TRANSFER_FORMAT, 'version': TRANSFER_VERSION}) + '\n'
+    querysets = get_course_querysets(course)
+    for record_type in RECORD_TYPES:
+        keys = ('id', *record_type.parents, *record_type.fields)
+        columns = ('pk', *record_type.parents.values(), *record_type.fields)
+        rows = querysets[record_type.name].order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+        for chunk in _chunks(rows, chunk_size):
+            yield ''.join(
+                json.dumps({'type': record_type.name, **dict(zip(keys, row))}, cls=DjangoJSONEncoder,
+                           ensure_ascii=False) + '\n'
+                for row in chunk
+            )
+
+
+class CourseImporter:
+    """
+    Загружает дерево курса из документа JSON Lines (см. export_course).
+
+    Строки разбираются по одной, записи одного типа накапливаются до chunk_size, проверяются пачкой
+    (значения полей и запрещенные слова) и вставляются одним bulk_create. В памяти хранятся только
+    текущая пачка и соответствие исходных id новым. Импорт выполняется в одной транзакции:
+    при любой ошибке курс не создается.
+    """
+
+    def __init__(self, owner, chunk_size=TRANSFER_CHUNK_SIZE):
+        self.owner = owner
+        self.chunk_size = chunk_size
+        self.id_maps = {name: {} for name in REFERENCED_TYPES}
+        self.counts = {record_type.name: 0 for record_type in RECORD_TYPES}
+        self.record_type = None
+        self.batch = []
+        self.course = None
+
+    def fail(self, errors):
+        raise serializers.ValidationError(errors[:MAX_REPORTED_ERRORS])
+
+    def import_lines(self, lines):
+        """ Импортирует документ из итератора строк и возвращает созданный курс. """
+        with transaction.atomic():
+            header_read = False
+            for line_number, line in enumerate(lines, start=1):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8')
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.fail([f'Строка {line_number}: некорректный JSON.'])
+                if not isinstance(record, dict):
+                    self.fail([f'Строка {line_number}: ожидается объект JSON.'])
+
+                if not header_read:
+                    if record.get('type') != 'header' or record.get('format') != TRANSFER_FORMAT:
+                        self.fail([f'Строка {line_number}: ожидается заголовок формата {TRANSFER_FORMAT}.'])
+                    if record.get('version') != TRANSFER_VERSION:
+                        self.fail([f'Строка {line_number}: неподдерживаемая версия {record.get("version")}.'])
+                    header_read = True
+                    continue
+                self.add(line_number, record)
+            self.flush()
+
+            if self.course is None:
+                self.fail(['Документ не содержит курса.'])
+        return self.course
+
+    def add(self, line_number, record):
+        """ Добавляет запись в текущую пачку, при смене типа записей или заполнении пачки вставляет ее. """
+        record_type = RECORD_TYPES_BY_NAME.get(record.get('type'))
+        if record_type is None:
+            self.fail([f'Строка {line_number}: неизвестный тип записи {record.get("type")!r}.'])
+        if record_type is not self.record_type:
+            if self.record_type is not None and RECORD_TYPES.index(record_type) < RECORD_TYPES.index(self.record_type):
+                self.fail([f'Строка {line_number}: запись {record_type.name} после записей {self.record_type.name}.'])
+            self.flush()
+            self.record_type = record_type
+        if record_type.name == 'course' and (self.counts['course'] or self.batch):
+            self.fail([f'Строка {line_number}: документ должен содержать один курс.'])
+
+        self.batch.append((line_number, record))
+        if len(self.batch) >= self.chunk_size:
+            self.flush()
+
+    def build_object(self, line_number, record, errors):
+        """ Проверяет запись и создает объект модели с переназначенными ссылками на родителей. """
+        record_type = self.record_type
+        model = record_type.model
+        data = {}
+        for field_name in record_type.fields:
+            field = model._meta.get_field(field_name)
+            value = record.get(field_name, field.get_default())
+            try:
+                data[field_name] = field.clean(value, None)
+            except DjangoValidationError as error:
+                errors.append(f'Строка {line_number}, поле {field_name}: {" ".join(error.messages)}')
+
+        if record_type.model is Course and Course.objects.filter(title=data.get('title')).exists():
+            # Названия курсов уникальны (см. CourseSerializer)
+            errors.append(f'Строка {line_number}: курс с названием {data.get("title")!r} уже существует.')
+        if record_type.parents and all(record.get(key) is None for key in record_type.parents):
+            errors.append(f'Строка {line_number}: не указан родитель ({", ".join(record_type.parents)}).')
+        for key, attname in record_type.parents.items():
+            source_id = record.get(key)
+            data[attname] = None
+            if source_id is not None:
+                data[attname] = self.id_maps[key].get(source_id)
+                if data[attname] is None:
+                    errors.append(f'Строка {line_number}: {key} с id {source_id} не найден в документе.')
+        return model(owner=self.owner, **data)
+
+    def flush(self):
+        """ Проверяет накопленную пачку записей и вставляет ее одним bulk_create. """
+        if not self.batch:
+            return
+        record_type = self.record_type
+        errors = []
+        objects = [self.build_object(line_number, record, errors) for line_number, record in self.batch]
+
+        # Запрещенные слова проверяются для всей пачки сразу одним скомпилированным словарем
+        for (line_number, _), obj in zip(self.batch, objects):
+            if forbidden_words.search(getattr(obj, record_type.checked_field)):
+                errors.append(f'Строка {line_number}: использованы запрещенные слова.')
+        if errors:
+            self.fail(errors)
+
+        created = record_type.model.objects.bulk_create(objects)
+        if record_type.name in REFERENCED_TYPES:
+            id_map = self.id_maps[record_type.name]
+            for (_, record), obj in zip(self.batch, created):
+                if record.get('id') is not None:
+                    id_map[record['id']] = obj.pk
+        if record_type.name == 'course':
+            self.course = created[0]
+        self.counts[record_type.name] += len(created)
+        self.batch = []
+
+
+def import_course(lines, owner, chunk_size=TRANSFER_CHUNK_SIZE):
+    """ Импортирует курс из строк JSON Lines. Возвращает (курс, количество записей по типам). """
+    importer = CourseImporter(owner, chunk_size)
+    course = importer.import_lines(lines)
+    return course, importer.counts
@@ -2,7 +2,8 @@ from django.urls import path
 from rest_framework.routers import SimpleRouter
 
 from materials.apps import MaterialsConfig
-from materials.views import CourseViewSet, ModuleViewSet, LessonViewSet, EnrollmentAPIView
+from materials.views import CourseViewSet, ModuleViewSet, LessonViewSet, EnrollmentAPIView, SearchAPIView, \
+    BulkEnrollmentAPIView
 
 app_name = MaterialsConfig.name
 
@@ -13,4 +14,6 @@ router.register('lessons', LessonViewSet)
 
 urlpatterns = [
     path('enrollment/', EnrollmentAPIView.as_view(), name='enrollment'),
+    path('enrollment/bulk/', BulkEnrollmentAPIView.as_view(), name='enrollment-bulk'),
+    path('search/', SearchAPIView.as_view(), name='search'),
               ] + router.urls
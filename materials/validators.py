@@ -1,5 +1,148 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
 from rest_framework import serializers
 
+logger = logging.getLogger(__name__)
+
+
+def load_forbidden_words():
+    """
+    Загружает список запрещенных слов: из файла FORBIDDEN_WORDS_FILE (по одному слову в строке,
+    строки, начинающиеся с '#', пропускаются), а если файл не задан - из настройки FORBIDDEN_WORDS.
+    """
+    path = settings.FORBIDDEN_WORDS_FILE
+    if path:
+        with open(path, encoding='utf-8') as file:
+            words = [line.strip() for line in file]
+        return [word for word in words if word and not word.startswith('#')]
+    return list(settings.FORBIDDEN_WORDS)
+
+
+# До этого размера словаря поиск подстрок на C (str.__contains__) быстрее регулярного выражения
+# (см. python manage.py bench_title_validator)
+SUBSTRING_SEARCH_MAX_WORDS = 200
+
+
+def build_pattern(words):
+    """
+    Компилирует список слов в одно регулярное выражение в виде префиксного дерева.
+
+    Общие префиксы слов объединяются, поэтому текст проверяется за один проход
+    без перебора слов по отдельности (аналогично автомату Ахо-Корасик).
+    """
+    trie = {}
+    for word in {word.lower() for word in words if word}:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def to_regex(node):
+        if '' in node:
+            # Слово закончилось: совпадения по более коротому слову достаточно
+            return ''
+        branches = [re.escape(char) + to_regex(child) for char, child in sorted(node.items())]
+        if len(branches) == 1:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')'
+
+    if not trie:
+        return None
+    return re.compile(to_regex(trie))
+
+
+def build_matcher(words):
+    """
+    Возвращает функцию поиска запрещенного слова в тексте (текст должен быть в нижнем регистре).
+
+    Небольшие словари проверяются поиском подстрок, большие - одним проходом
+    скомпилированного регулярного выражения.
+    """
+    words = tuple(sorted({word.lower() for word in words if word}))
+    if len(words) <= SUBSTRING_SEARCH_MAX_WORDS:
+        def search(text):
+            for word in words:
+                if word in text:
+                    return word
+            return None
+        return search
+
+    pattern = build_pattern(words)
+
+    def search(text):
+        match = pattern.search(text)
+        return match.group() if match else None
+    return search
+
+
+class ForbiddenWordsMatcher:
+    """
+    Скомпилированный список запрещенных слов.
+
+    Функция поиска строится один раз и перестраивается только при изменении источника:
+    настройки FORBIDDEN_WORDS или времени изменения файла FORBIDDEN_WORDS_FILE,
+    поэтому обновленный словарь подхватывается без перезапуска. Время изменения файла проверяется
+    не чаще раза в FORBIDDEN_WORDS_CHECK_INTERVAL секунд; если файл недоступен, используется
+    последний загруженный словарь (а до первой загрузки - FORBIDDEN_WORDS).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._source = None
+        self._matcher = None
+        # Файл и время (time.monotonic), до которого его не нужно проверять
+        self._checked_path = None
+        self._next_check = 0
+
+    def get_source(self):
+        """ Возвращает ключ, по которому определяется, что словарь изменился. """
+        path = settings.FORBIDDEN_WORDS_FILE
+        if path:
+            return path, os.stat(path).st_mtime_ns
+        return tuple(settings.FORBIDDEN_WORDS)
+
+    def get_matcher(self):
+        path = settings.FORBIDDEN_WORDS_FILE
+        if path:
+            if path == self._checked_path and time.monotonic() < self._next_check:
+                return self._matcher
+        elif tuple(settings.FORBIDDEN_WORDS) == self._source:
+            return self._matcher
+
+        with self._lock:
+            try:
+                source = self.get_source()
+                if source != self._source:
+                    self._matcher = build_matcher(load_forbidden_words())
+                    self._source = source
+            except OSError as error:
+                logger.warning('Не удалось прочитать словарь запрещенных слов %s: %s', path, error)
+                if self._matcher is None:
+                    self._matcher = build_matcher(settings.FORBIDDEN_WORDS)
+            self._checked_path = path
+            self._next_check = time.monotonic() + settings.FORBIDDEN_WORDS_CHECK_INTERVAL
+        return self._matcher
+
+    def reload(self):
+        """ Принудительно перечитывает словарь. """
+        with self._lock:
+            self._source = None
+            self._checked_path = None
+
+    def search(self, text):
+        """ Возвращает первое найденное запрещенное слово или None. """
+        if not text:
+            return None
+        return self.get_matcher()(text.lower())
+
+
+forbidden_words = ForbiddenWordsMatcher()
+
 
 class TitleValidator:
     """ Проверяет наличие запрещенных слов в названиях материалов """
@@ -7,9 +150,7 @@ class TitleValidator:
         self.field = field
 
     def __call__(self, value):
-        words = ["казино", "криптовалюта", "крипта", "биржа", "обман", "полиция", "радар"]
-        title = dict(value).get(self.field).lower()
+        title = dict(value).get(self.field)
 
-        for word in words:
-            if word in title:
-                raise serializers.ValidationError("Использованы запрещенные слова")
+        if forbidden_words.search(title):
+            raise serializers.ValidationError("Использованы запрещенные слова")
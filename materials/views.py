@@ -1,11 +1,26 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
-from rest_framework.generics import get_object_or_404, GenericAPIView
+from rest_framework.parsers import MultiPartParser
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
-from materials.tasks import send_information_about_enrolling
+from materials.tasks import send_information_about_enrolling, send_information_about_bulk_enrolling, \
+    clone_course_task
 from materials.models import Course, Module, Lesson, Enrollment
-from materials.pagination import MyPagination
-from materials.serializers import CourseSerializer, ModuleSerializer, LessonSerializer, EnrollmentSerializer
+from materials.pagination import MyPagination, SwitchablePagination
+from materials.services import get_courses_queryset, get_modules_queryset, get_course_tree, get_course_trees, \
+    filter_by_role, search_materials, change_enrollment, bulk_enroll, ENROLLMENT_ACTIONS, \
+    is_enrollment_digest_enabled, iter_export, EXPORT_FORMATS, ENROLLMENT_EXPORT_FIELDS, clone_course, \
+    count_course_rows, get_clone_title
+from materials.transfer import export_course, import_course
+from materials.serializers import CourseSerializer, ModuleSerializer, LessonSerializer, EnrollmentSerializer, \
+    SearchResultSerializer, BulkEnrollmentSerializer, CourseCloneSerializer, CourseImportSerializer, MoveSerializer, \
+    ModuleReorderSerializer, LessonReorderSerializer, get_sparse_params
+from materials.ordering import move, reorder
 from tests.views import CustomModelViewSet
+from users.models import User
 from users.permissions import IsStudent, IsAdmin, IsTeacher
 
 
@@ -14,15 +29,112 @@ class CourseViewSet(CustomModelViewSet):
 
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
-    pagination_class = MyPagination
+    pagination_class = SwitchablePagination
+    version_fields = ('updated_at', 'is_enrolled', 'pk')
+    # Статус зачисления меняется без изменения курса, поэтому версия проверяется только по ETag
+    use_last_modified = False
+    # Копировать, выгружать, загружать курсы и менять порядок модулей могут администраторы и преподаватели
+    # (преподаватель - только в своих курсах)
+    manage_actions = CustomModelViewSet.manage_actions + ('clone', 'export', 'upload', 'reorder')
+
+    def get_scoped_queryset(self):
+        """ Возвращает курсы, доступные пользователю в зависимости от его роли. """
+        return filter_by_role(Course.objects.all(), self.request.user)
 
     def get_queryset(self):
         """ Возвращает список курсов в зависимости от роли пользователя. """
 
-        user = self.request.user
-        if user.role in ['admin', 'student']:
-            return Course.objects.all()
-        return Course.objects.filter(owner=user)
+        queryset = self.get_scoped_queryset()
+        fields, expand = get_sparse_params(self.request)
+        if (self.action == 'retrieve' and expand is None) or self.action in ('clone', 'export', 'reorder'):
+            # Дерево курса берется из кеша (курс копируется или выгружается), поэтому достаточно проверить доступ
+            return queryset
+        return get_courses_queryset(queryset, self.request.user, fields, expand)
+
+    def get_version_queryset(self):
+        """ Версия курса включает статус зачисления пользователя. """
+        return get_courses_queryset(self.get_scoped_queryset(), self.request.user, fields={'is_enrolled'},
+                                    expand=set())
+
+    def retrieve_object(self, request, *args, **kwargs):
+        """
+        Возвращает дерево курса из кеша, дополняя его статусом зачисления пользователя
+        из версии курса, полученной в retrieve.
+        При выборочном выводе полей (?fields=, ?expand=) курс сериализуется без кеша.
+        """
+        if get_sparse_params(request)[1] is not None:
+            return super().retrieve_object(request, *args, **kwargs)
+
+        if self.object_version is None:
+            # Курс не найден или недоступен пользователю
+            course = self.get_object()
+            self.object_version = (course.updated_at,
+                                   Enrollment.objects.filter(student=request.user, course=course).exists(),
+                                   course.pk)
+
+        _, is_enrolled, course_id = self.object_version
+        tree = get_course_tree(course_id)
+        if tree is None:
+            # Курс удален после проверки версии
+            raise Http404("No Course matches the given query.")
+        data = dict(tree)
+        data['is_enrolled'] = is_enrolled
+        return Response(data)
+
+    @action(detail=True, methods=['post'], serializer_class=CourseCloneSerializer)
+    def clone(self, request, *args, **kwargs):
+        """
+        Копирует курс со всеми модулями, уроками, тестами, вопросами и ответами.
+        Владельцем копии становится текущий пользователь. Название копии (title) должно быть уникальным,
+        по умолчанию - свободное из '<название курса> (копия)', '<название курса> (копия 2)', ...
+
+        Большие курсы (больше COURSE_CLONE_ASYNC_THRESHOLD уроков, вопросов и ответов) копируются
+        в фоновой задаче: возвращается 202 и id задачи, копия появится в списке курсов.
+        """
+        course = self.get_object()
+        title = request.data.get('title') or get_clone_title(course)
+        serializer = self.get_serializer(data={'title': title})
+        serializer.is_valid(raise_exception=True)
+        title = serializer.validated_data['title']
+
+        if count_course_rows(course) > settings.COURSE_CLONE_ASYNC_THRESHOLD:
+            task = clone_course_task.delay(course.pk, request.user.pk, title)
+            return Response({"task_id": task.id, "detail": "Копирование курса запущено."},
+                            status=status.HTTP_202_ACCEPTED)
+
+        new_course = clone_course(course, request.user, title)
+        queryset = get_courses_queryset(Course.objects.filter(pk=new_course.pk), request.user)
+        data = CourseSerializer(queryset.get(), context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """ Выгружает дерево курса потоком в формате JSON Lines (см. materials.transfer.export_course). """
+        course = self.get_object()
+        response = StreamingHttpResponse(export_course(course), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="course-{course.pk}.jsonl"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import', url_name='import', parser_classes=[MultiPartParser],
+            serializer_class=CourseImportSerializer)
+    def upload(self, request, *args, **kwargs):
+        """
+        Загружает курс из файла JSON Lines (поле file), владельцем курса становится текущий пользователь.
+        Файл разбирается построчно, записи вставляются пачками в одной транзакции.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course, counts = import_course(serializer.validated_data['file'], request.user)
+        return Response({"id": course.pk, "counts": counts}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], serializer_class=ModuleReorderSerializer)
+    def reorder(self, request, *args, **kwargs):
+        """ Устанавливает порядок модулей курса по списку id (modules). """
+        course = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = reorder(course, 'modules', serializer.validated_data['modules'])
+        return Response({"changed": changed})
 
 
 class ModuleViewSet(CustomModelViewSet):
@@ -30,14 +142,65 @@ class ModuleViewSet(CustomModelViewSet):
 
     queryset = Module.objects.all()
     serializer_class = ModuleSerializer
-    pagination_class = MyPagination
+    pagination_class = SwitchablePagination
+    version_fields = ('updated_at',)
+    manage_actions = CustomModelViewSet.manage_actions + ('move', 'reorder')
+
+    def get_scoped_queryset(self):
+        """ Возвращает модули, доступные пользователю в зависимости от его роли. """
+        return filter_by_role(Module.objects.all(), self.request.user)
 
     def get_queryset(self):
         """ Возвращает список модулей в зависимости от роли пользователя. """
-        user = self.request.user
-        if user.role in ['admin', 'student']:
-            return Module.objects.all()
-        return Module.objects.filter(owner=user)
+        queryset = self.get_scoped_queryset()
+        fields, expand = get_sparse_params(self.request)
+        if self.action == 'list' and expand is None:
+            # Модули берутся из закешированных деревьев курсов
+            return queryset.only('pk', 'course')
+        if self.action in ('move', 'reorder'):
+            return queryset
+        return get_modules_queryset(queryset, fields, expand)
+
+    def get_version_queryset(self):
+        """ Версия модуля проверяется по queryset без аннотаций и предзагрузок. """
+        return self.get_scoped_queryset()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает список модулей, собранный из закешированных деревьев курсов.
+        При выборочном выводе полей (?fields=, ?expand=) модули сериализуются без кеша.
+        """
+        if get_sparse_params(request)[1] is not None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        modules = page if page is not None else list(queryset)
+
+        trees = get_course_trees({module.course_id for module in modules})
+        tree_modules = {item['id']: item for tree in trees.values() for item in tree['modules']}
+        data = [tree_modules[module.pk] for module in modules if module.pk in tree_modules]
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @action(detail=True, methods=['post'], serializer_class=MoveSerializer)
+    def move(self, request, *args, **kwargs):
+        """ Перемещает модуль в курсе сразу после модуля after (null - в начало курса). """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        module = move(self.get_object(), serializer.validated_data.get('after'))
+        return Response(ModuleSerializer(module, context=self.get_serializer_context()).data)
+
+    @action(detail=True, methods=['post'], serializer_class=LessonReorderSerializer)
+    def reorder(self, request, *args, **kwargs):
+        """ Устанавливает порядок уроков модуля по списку id (lessons). """
+        module = self.get_object()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = reorder(module, 'lessons', serializer.validated_data['lessons'])
+        return Response({"changed": changed})
 
 
 class LessonViewSet(CustomModelViewSet):
@@ -45,14 +208,53 @@ class LessonViewSet(CustomModelViewSet):
 
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
-    pagination_class = MyPagination
+    pagination_class = SwitchablePagination
+    version_fields = ('updated_at',)
+    manage_actions = CustomModelViewSet.manage_actions + ('move',)
 
     def get_queryset(self):
         """ Возвращает список уроков в зависимости от роли пользователя. """
-        user = self.request.user
-        if user.role in ['admin', 'student']:
-            return Lesson.objects.all()
-        return Lesson.objects.filter(owner=user)
+        return filter_by_role(Lesson.objects.defer('search_vector'), self.request.user)
+
+    @action(detail=True, methods=['post'], serializer_class=MoveSerializer)
+    def move(self, request, *args, **kwargs):
+        """
+        Перемещает урок в модуле сразу после урока after (null - в начало модуля).
+        Обычно изменяется только позиция самого урока.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lesson = move(self.get_object(), serializer.validated_data.get('after'))
+        return Response(LessonSerializer(lesson, context=self.get_serializer_context()).data)
+
+
+class SearchAPIView(GenericAPIView):
+    """ Endpoint для полнотекстового поиска по курсам, модулям и урокам. """
+
+    serializer_class = SearchResultSerializer
+    pagination_class = MyPagination
+
+    def get(self, request, *args, **kwargs):
+        """ Возвращает найденные материалы по параметру q, отсортированные по релевантности. """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({"detail": "Укажите поисковый запрос в параметре q."}, status=400)
+
+        queryset = search_materials(text, request.user)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def get_permissions(self):
+        if self.request.user.is_anonymous:
+            raise PermissionDenied("У вас нет доступа к этому ресурсу.")
+
+        if not self.request.user.role:
+            raise PermissionDenied("У вас нет доступа к этому ресурсу.")
+
+        self.permission_classes = [IsAdmin | IsStudent | IsTeacher]
+        return super().get_permissions()
 
 
 class EnrollmentAPIView(GenericAPIView):
@@ -60,27 +262,49 @@ class EnrollmentAPIView(GenericAPIView):
 
     queryset = Enrollment.objects.all()
     serializer_class = EnrollmentSerializer
+    pagination_class = SwitchablePagination
 
     def post(self, request, *args, **kwargs):
-        """ Обрабатывает запрос на запись или отчисление студента с курса. """
+        """
+        Обрабатывает запрос на запись или отчисление студента с курса.
+
+        Параметр action: toggle (по умолчанию) - переключает статус зачисления,
+        enroll / unenroll - идемпотентно зачисляет или отчисляет студента.
+        """
         user = request.user
-        course_id = request.data.get('course')
-        course_item = get_object_or_404(Course, pk=course_id)
-        enroll_item = Enrollment.objects.filter(student=user, course=course_item)
+        action = request.data.get('action', 'toggle')
+        if action not in ENROLLMENT_ACTIONS:
+            return Response({"action": [f"Допустимые значения: {', '.join(ENROLLMENT_ACTIONS)}."]}, status=400)
 
-        if enroll_item.exists():
-            enroll_item.delete()
+        try:
+            result = change_enrollment(user, int(request.data.get('course')), action)
+        except (TypeError, ValueError):
+            result = None
+        if result is None:
+            raise Http404("No Course matches the given query.")
+
+        if result.enrolled:
+            # В режиме сводки преподаватель получит уведомление периодической задачей send_enrollment_digests
+            if result.owner_email and not is_enrollment_digest_enabled():
+                send_information_about_enrolling.delay(result.course_title, user.first_name, user.last_name,
+                                                       user.email, result.owner_email)
+            message = 'Вы зачислены на курс'
+        elif result.unenrolled:
             message = 'Вы отчислились с курса'
+        elif action == 'unenroll':
+            message = 'Вы не зачислены на курс'
         else:
-            Enrollment.objects.create(student=user, course=course_item)
-            send_information_about_enrolling.delay(course_item.title, user.first_name, user.last_name, user.email,
-                                                   course_item.owner.email)
-            message = 'Вы зачислены на курс'
+            message = 'Вы уже зачислены на курс'
 
         return Response({"message": message})
 
     def get(self, request, *args, **kwargs):
-        """ Возвращает список зачислений в зависимости от роли пользователя """
+        """
+        Возвращает список зачислений в зависимости от роли пользователя.
+
+        Список разбивается на страницы (?pagination=cursor - курсорная пагинация).
+        Параметр export (ndjson или csv) выгружает все зачисления потоком без пагинации.
+        """
         user = request.user
         if user.role == 'admin':
             queryset = Enrollment.objects.all()
@@ -91,9 +315,18 @@ class EnrollmentAPIView(GenericAPIView):
         else:
             return Response({"detail": "У вас нет доступа к этому ресурсу."}, status=403)
 
-        # Сериализуем queryset перед отправкой ответа
-        serializer = self.serializer_class(queryset, many=True)
-        return Response(serializer.data)
+        export_format = request.query_params.get('export')
+        if export_format is not None:
+            if export_format not in EXPORT_FORMATS:
+                return Response({"export": [f"Допустимые значения: {', '.join(EXPORT_FORMATS)}."]}, status=400)
+            response = StreamingHttpResponse(iter_export(queryset, ENROLLMENT_EXPORT_FIELDS, export_format),
+                                             content_type=EXPORT_FORMATS[export_format])
+            response['Content-Disposition'] = f'attachment; filename="enrollments.{export_format}"'
+            return response
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.serializer_class(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def get_permissions(self):
         if self.request.user.is_anonymous:
@@ -110,3 +343,41 @@ class EnrollmentAPIView(GenericAPIView):
             self.permission_classes = [IsAdmin | IsStudent | IsTeacher]
 
         return super().get_permissions()
+
+
+class BulkEnrollmentAPIView(GenericAPIView):
+    """ Endpoint для массового зачисления студентов на курс. """
+
+    serializer_class = BulkEnrollmentSerializer
+
+    def post(self, request, *args, **kwargs):
+        """
+        Зачисляет на курс список студентов (students) или всех студентов с email в домене (email_domain).
+        Владельцу курса отправляется одно итоговое письмо.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course = serializer.validated_data['course']
+
+        if request.user.role == 'teacher' and course.owner != request.user:
+            raise PermissionDenied("У вас нет доступа к этому курсу.")
+
+        if 'students' in serializer.validated_data:
+            students = serializer.validated_data['students']
+            inserted, _ = bulk_enroll(course, students)
+            requested = len(students)
+        else:
+            domain = serializer.validated_data['email_domain'].lstrip('@')
+            inserted, requested = bulk_enroll(course, User.objects.filter(email__iendswith=f'@{domain}'))
+
+        if inserted and course.owner and course.owner.email:
+            send_information_about_bulk_enrolling.delay(course.title, inserted, course.owner.email)
+
+        return Response({"inserted": inserted, "skipped": requested - inserted})
+
+    def get_permissions(self):
+        if self.request.user.is_anonymous:
+            raise PermissionDenied("У вас нет доступа к этому ресурсу.")
+
+        self.permission_classes = [IsAdmin | IsTeacher]
+        return super().get_permissions()
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from tests.models import Test, Question, Answer, StudentAnswer, TestResult
+from tests.models import Test, Question, Answer, StudentAnswer, TestAttempt, TestResult
+from tests.services import calculate_scores
 
 
 @admin.register(Test)
@@ -18,11 +19,23 @@ class AnswerAdmin(admin.ModelAdmin):
     list_display = ('id', 'text', 'question')
 
 
+@admin.register(TestAttempt)
+class TestAttemptAdmin(admin.ModelAdmin):
+    list_display = ('id', 'student', 'test', 'started_at', 'finished_at')
+
+
 @admin.register(StudentAnswer)
 class StudentAnswerAdmin(admin.ModelAdmin):
-    list_display = ('id', 'student', 'answer', 'question')
+    list_display = ('id', 'student', 'answer', 'question', 'attempt')
 
 
 @admin.register(TestResult)
 class TestResultAdmin(admin.ModelAdmin):
     list_display = ('id', 'student', 'test')
+    actions = ('recalculate_scores',)
+
+    @admin.action(description='Пересчитать оценки')
+    def recalculate_scores(self, request, queryset):
+        """ Пересчитывает оценки выбранных результатов, например после исправления правильных ответов. """
+        count = calculate_scores(queryset)
+        self.message_user(request, f'Пересчитано результатов: {count}')
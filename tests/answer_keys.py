@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.cache import cache
+from django.db.models import Q
+
+from tests.models import Question
+
+# Ключ ответов теста - {id вопроса: frozenset(id правильных вариантов)}. В кеше хранится вместе с версией теста
+# (Test.updated_at, обновляется при изменении вопросов и вариантов ответа, см. tests.signals):
+# ключ другой версии считается отсутствующим, поэтому устаревший ключ другого процесса не используется.
+ANSWER_KEY_CACHE_KEY = 'tests:answer_key:v1:{}'
+
+
+class LRUCache:
+    """ Потокобезопасный словарь ограниченного размера: при переполнении удаляются давно не использованные ключи. """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_answer_keys = LRUCache(settings.ANSWER_KEY_CACHE_SIZE)
+
+
+def build_answer_keys(test_ids):
+    """ Строит ключи ответов тестов одним запросом. """
+    keys = {test_id: {} for test_id in test_ids}
+    questions = Question.objects.filter(test_id__in=test_ids).order_by().annotate(
+        correct=ArrayAgg('answers__pk', filter=Q(answers__is_correct=True)),
+    ).values_list('test_id', 'pk', 'correct')
+    for test_id, question_id, correct in questions:
+        keys[test_id][question_id] = frozenset(answer_id for answer_id in correct or () if answer_id is not None)
+    return keys
+
+
+def get_answer_keys(versions):
+    """
+    Возвращает ключи ответов тестов в виде {id теста: ключ}; versions - {id теста: Test.updated_at}.
+
+    Ключи берутся из памяти процесса, затем из Redis (если кеш включен), недостающие строятся
+    одним запросом и сохраняются в оба кеша.
+    """
+    keys = {}
+    for test_id, version in versions.items():
+        cached = local_answer_keys.get(test_id)
+        if cached is not None and cached[0] == version:
+            keys[test_id] = cached[1]
+
+    missing = versions.keys() - keys.keys()
+    if missing and settings.CACHE_ENABLED:
+        cached = cache.get_many([ANSWER_KEY_CACHE_KEY.format(test_id) for test_id in missing])
+        for test_id in missing:
+            item = cached.get(ANSWER_KEY_CACHE_KEY.format(test_id))
+            if item is not None and item[0] == versions[test_id]:
+                local_answer_keys.set(test_id, item)
+                keys[test_id] = item[1]
+        missing = versions.keys() - keys.keys()
+
+    if missing:
+        items = {test_id: (versions[test_id], key) for test_id, key in build_answer_keys(missing).items()}
+        for test_id, item in items.items():
+            local_answer_keys.set(test_id, item)
+            keys[test_id] = item[1]
+        if settings.CACHE_ENABLED:
+            cache.set_many({ANSWER_KEY_CACHE_KEY.format(test_id): item for test_id, item in items.items()},
+                           timeout=settings.ANSWER_KEY_CACHE_TIMEOUT)
+    return keys
+
+
+def get_answer_key(test):
+    """ Возвращает ключ ответов теста (версия - test.updated_at). """
+    return get_answer_keys({test.pk: test.updated_at})[test.pk]
+
+
+def invalidate_answer_keys(test_ids):
+    """ Удаляет ключи ответов тестов из памяти процесса и из Redis. """
+    for test_id in test_ids:
+        local_answer_keys.delete(test_id)
+    if test_ids and settings.CACHE_ENABLED:
+        cache.delete_many([ANSWER_KEY_CACHE_KEY.format(test_id) for test_id in test_ids])
+
+
+def count_right_answers(answer_key, answers):
+    """ Считает правильные ответы: answers - пары (id вопроса, id выбранного варианта). """
+    return sum(answer_id in answer_key.get(question_id, ()) for question_id, answer_id in answers)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0005_alter_test_options_remove_test_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='test',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения (теста, вопросов или ответов)'),
+        ),
+    ]
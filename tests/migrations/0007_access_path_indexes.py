@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы создаются без блокировки записи в таблицы (CREATE INDEX CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('materials', '0009_owner_indexes'),
+        ('tests', '0006_test_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='test',
+            index=models.Index(fields=['owner', 'id'], name='test_owner_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='testresult',
+            index=models.Index(fields=['student', 'id'], name='testresult_student_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='testresult',
+            index=models.Index(fields=['test', 'student', 'completed_at'], name='testresult_test_student_idx'),
+        ),
+    ]
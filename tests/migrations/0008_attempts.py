@@ -0,0 +1,84 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Каждый существующий результат получает свою завершенную попытку с тем же id. Прежние ответы студента
+# нельзя разделить по попыткам, поэтому они относятся к последней попытке по тесту; для ответов
+# без результата создается открытая попытка. В конце отложенные проверки внешних ключей выполняются сразу,
+# иначе изменение столбцов на NOT NULL в той же транзакции невозможно.
+CREATE_ATTEMPTS_SQL = """
+INSERT INTO tests_testattempt (id, student_id, test_id, started_at, finished_at)
+SELECT id, student_id, test_id, completed_at, completed_at FROM tests_testresult;
+
+UPDATE tests_testresult SET attempt_id = id;
+
+SELECT setval(pg_get_serial_sequence('tests_testattempt', 'id'),
+              COALESCE((SELECT MAX(id) FROM tests_testattempt), 0) + 1, false);
+
+INSERT INTO tests_testattempt (student_id, test_id, started_at)
+SELECT DISTINCT answer.student_id, question.test_id, now()
+FROM tests_studentanswer answer JOIN tests_question question ON question.id = answer.question_id
+WHERE NOT EXISTS (SELECT 1 FROM tests_testattempt attempt
+                  WHERE attempt.student_id = answer.student_id AND attempt.test_id = question.test_id);
+
+UPDATE tests_studentanswer SET attempt_id = latest.id
+FROM tests_question question,
+     (SELECT student_id, test_id, MAX(id) AS id FROM tests_testattempt GROUP BY student_id, test_id) latest
+WHERE question.id = tests_studentanswer.question_id
+  AND latest.student_id = tests_studentanswer.student_id AND latest.test_id = question.test_id;
+
+SET CONSTRAINTS ALL IMMEDIATE;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0007_access_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время начала')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата и время завершения')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to=settings.AUTH_USER_MODEL, verbose_name='Студент')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempts', to='tests.test', verbose_name='Тест')),
+            ],
+            options={
+                'verbose_name': 'Попытка прохождения теста',
+                'verbose_name_plural': 'Попытки прохождения тестов',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('finished_at__isnull', True)), fields=('student', 'test'), name='testattempt_open_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='studentanswer',
+            name='attempt',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='student_answers', to='tests.testattempt', verbose_name='Попытка'),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='attempt',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='result', to='tests.testattempt', verbose_name='Попытка'),
+        ),
+        migrations.RunSQL(CREATE_ATTEMPTS_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='studentanswer',
+            name='attempt',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='student_answers', to='tests.testattempt', verbose_name='Попытка'),
+        ),
+        migrations.AlterField(
+            model_name='testresult',
+            name='attempt',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result', to='tests.testattempt', verbose_name='Попытка'),
+        ),
+        migrations.AddIndex(
+            model_name='studentanswer',
+            index=models.Index(fields=['attempt', 'question'], name='studentanswer_attempt_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 12:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0008_attempts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Существующие результаты уже оценены; новые создаются в статусе pending
+        migrations.AddField(
+            model_name='testresult',
+            name='status',
+            field=models.CharField(choices=[('pending', 'ожидает оценки'), ('graded', 'оценен')], default='graded', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='testresult',
+            name='status',
+            field=models.CharField(choices=[('pending', 'ожидает оценки'), ('graded', 'оценен')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='testresult',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['completed_at'], name='testresult_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0009_result_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='testresult',
+            name='status',
+            field=models.CharField(choices=[('pending', 'ожидает оценки'), ('graded', 'оценен')], default='graded', max_length=10, verbose_name='Статус'),
+        ),
+    ]
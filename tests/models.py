@@ -12,6 +12,13 @@ SCORE = [
     ("d", "неудовлетворительно"),
 ]
 
+RESULT_PENDING = "pending"
+RESULT_GRADED = "graded"
+RESULT_STATUS = [
+    (RESULT_PENDING, "ожидает оценки"),
+    (RESULT_GRADED, "оценен"),
+]
+
 
 class Test(models.Model):
     """ Модель теста. """
@@ -25,6 +32,7 @@ class Test(models.Model):
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="tests", on_delete=models.CASCADE,
                               verbose_name='Владелец')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения (теста, вопросов или ответов)")
 
     def __str__(self):
         return f"Тест: {self.title}"
@@ -33,6 +41,10 @@ class Test(models.Model):
         verbose_name = "Тест"
         verbose_name_plural = "Тесты"
         ordering = ['pk']
+        indexes = [
+            # Тесты преподавателя, в том числе при выборке результатов по test__owner
+            models.Index(fields=['owner', 'id'], name='test_owner_id_idx'),
+        ]
 
 
 class Question(models.Model):
@@ -69,12 +81,40 @@ class Answer(models.Model):
         verbose_name_plural = "Ответы"
 
 
+class TestAttempt(models.Model):
+    """
+    Модель попытки прохождения теста. Ответы студента относятся к открытой попытке (finished_at не задан),
+    при получении результата попытка завершается.
+    """
+
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="attempts", on_delete=models.CASCADE,
+                                verbose_name="Студент")
+    test = models.ForeignKey(Test, related_name="attempts", on_delete=models.CASCADE, verbose_name="Тест")
+    started_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата и время начала")
+    finished_at = models.DateTimeField(verbose_name="Дата и время завершения", **NULLABLE)
+
+    def __str__(self):
+        return f'{self.student} - {self.test} - {self.started_at}'
+
+    class Meta:
+        verbose_name = "Попытка прохождения теста"
+        verbose_name_plural = "Попытки прохождения тестов"
+        constraints = [
+            # У студента может быть только одна открытая попытка по тесту
+            models.UniqueConstraint(fields=['student', 'test'], condition=models.Q(finished_at__isnull=True),
+                                    name='testattempt_open_uniq'),
+        ]
+
+
 class StudentAnswer(models.Model):
     """ Модель ответа студента на вопрос в тесте. """
 
     student = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="student_answers", on_delete=models.CASCADE)
     question = models.ForeignKey(Question, related_name="student_answers", on_delete=models.CASCADE)
     answer = models.ForeignKey(Answer, related_name="student_answers", on_delete=models.CASCADE)
+    # Индекс по попытке - первое поле индекса (attempt, question)
+    attempt = models.ForeignKey(TestAttempt, related_name="student_answers", on_delete=models.CASCADE,
+                                db_index=False, verbose_name="Попытка")
 
     def __str__(self):
         return f"Ответ студента: {self.answer}"
@@ -82,6 +122,10 @@ class StudentAnswer(models.Model):
     class Meta:
         verbose_name = "Ответ студента"
         verbose_name_plural = "Ответы студентов"
+        indexes = [
+            # Ответы попытки: оценка и просмотр результата не зависят от истории студента
+            models.Index(fields=['attempt', 'question'], name='studentanswer_attempt_idx'),
+        ]
 
 
 class TestResult(models.Model):
@@ -90,9 +134,13 @@ class TestResult(models.Model):
     student = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="results", on_delete=models.CASCADE,
                                 verbose_name="Студент")
     test = models.ForeignKey(Test, related_name="results", on_delete=models.CASCADE)
+    attempt = models.OneToOneField(TestAttempt, related_name="result", on_delete=models.CASCADE,
+                                   verbose_name="Попытка")
     count_questions = models.IntegerField(default=0, verbose_name="Количество вопросов")
     count_right_answers = models.IntegerField(default=0, verbose_name="Количество правильных ответов")
     score = models.CharField(choices=SCORE, verbose_name="Оценка")
+    # Результат ожидает оценки только в асинхронном режиме (статус выставляет tests.services.grade_result)
+    status = models.CharField(max_length=10, choices=RESULT_STATUS, default=RESULT_GRADED, verbose_name="Статус")
     completed_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата и время получения результата")
 
     def __str__(self):
@@ -101,3 +149,12 @@ class TestResult(models.Model):
     class Meta:
         verbose_name = "Результат тестирования"
         verbose_name_plural = "Результаты тестирования"
+        indexes = [
+            # Результаты студента в порядке курсорной пагинации
+            models.Index(fields=['student', 'id'], name='testresult_student_id_idx'),
+            # Результаты тестов преподавателя и история попыток студента по тесту
+            models.Index(fields=['test', 'student', 'completed_at'], name='testresult_test_student_idx'),
+            # Результаты, ожидающие оценки (см. tests.tasks.grade_pending_results)
+            models.Index(fields=['completed_at'], condition=models.Q(status=RESULT_PENDING),
+                         name='testresult_pending_idx'),
+        ]
@@ -1,17 +1,21 @@
 from rest_framework import serializers
 
+from materials.serializers import SparseFieldsMixin
 from materials.validators import TitleValidator
+from tests.answer_keys import get_answer_key
 from .models import Test, Question, Answer, TestResult, StudentAnswer
 
 
-class TestSerializer(serializers.ModelSerializer):
+class TestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ Serializer для модели Test. """
 
     questions = serializers.SerializerMethodField(read_only=True)
 
+    expandable_fields = ('questions',)
+
     def get_questions(self, instance):
-        modules = Question.objects.filter(test=instance)
-        return QuestionSerializer(modules, many=True).data
+        questions = instance.questions.all()
+        return QuestionSerializer(questions, many=True, expand=self.get_nested_expand('questions')).data
 
     class Meta:
         model = Test
@@ -20,13 +24,15 @@ class TestSerializer(serializers.ModelSerializer):
         validators = [TitleValidator('title')]
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ Serializer для модели Question. """
 
     answers = serializers.SerializerMethodField(read_only=True)
 
+    expandable_fields = ('answers',)
+
     def get_answers(self, instance):
-        answers = Answer.objects.filter(question=instance)
+        answers = instance.answers.all()
         return AnswerSerializer(answers, many=True).data
 
     class Meta:
@@ -52,12 +58,29 @@ class StudentAnswerSerializer(serializers.ModelSerializer):
     is_correct = serializers.SerializerMethodField(read_only=True)
 
     def get_is_correct(self, instance):
-        return Answer.objects.get(pk=instance.answer.pk).is_correct
+        """ Проверяет ответ по ключу ответов теста из контекста (answer_key), без него - по выбранному варианту. """
+        answer_key = self.context.get('answer_key')
+        if answer_key is None:
+            return instance.answer.is_correct
+        return instance.answer_id in answer_key.get(instance.question_id, ())
 
     class Meta:
         model = StudentAnswer
-        fields = ('pk', 'student', 'question', 'answer', 'is_correct')
-        read_only_fields = ('student',)
+        fields = ('pk', 'student', 'question', 'answer', 'attempt', 'is_correct')
+        read_only_fields = ('student', 'attempt')
+
+
+class SubmittedAnswerSerializer(serializers.Serializer):
+    """ Serializer ответа на один вопрос при отправке всех ответов теста. """
+
+    question = serializers.IntegerField(help_text='id вопроса')
+    answer = serializers.IntegerField(help_text='id выбранного варианта ответа')
+
+
+class TestSubmitSerializer(serializers.Serializer):
+    """ Serializer для отправки всех ответов теста одним запросом. """
+
+    answers = SubmittedAnswerSerializer(many=True, allow_empty=False, help_text='По одному ответу на вопрос')
 
 
 class TestResultSerializer(serializers.ModelSerializer):
@@ -66,10 +89,19 @@ class TestResultSerializer(serializers.ModelSerializer):
     student_answers = serializers.SerializerMethodField(read_only=True)
 
     def get_student_answers(self, instance):
-        student_answers = StudentAnswer.objects.filter(student=instance.student)
-        return StudentAnswerSerializer(student_answers, many=True).data
+        """
+        Ответы студента в попытке результата (см. tests.services.get_results_queryset). Ключи ответов тестов
+        списка загружаются заранее (answer_keys в контексте), для одного результата - здесь.
+        """
+        answer_keys = self.context.get('answer_keys') or {}
+        answer_key = answer_keys.get(instance.test_id)
+        if answer_key is None:
+            answer_key = get_answer_key(instance.test)
+        student_answers = instance.attempt.student_answers.all()
+        return StudentAnswerSerializer(student_answers, many=True, context={'answer_key': answer_key}).data
 
     class Meta:
         model = TestResult
         fields = '__all__'
-        read_only_fields = ('student', 'count_questions', 'count_right_answers', 'score', 'student_answers')
+        read_only_fields = ('student', 'attempt', 'count_questions', 'count_right_answers', 'score', 'status',
+                            'student_answers')
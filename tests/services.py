@@ -1,26 +1,197 @@
-from tests.models import Question, StudentAnswer
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import transaction
+from django.db.models import Case, CharField, Count, OuterRef, Prefetch, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual, LessThanOrEqual
+from django.utils import timezone
+from rest_framework import serializers
+
+from materials.serializers import get_nested_expand
+from tests.answer_keys import count_right_answers, get_answer_keys
+from tests.models import RESULT_GRADED, RESULT_PENDING, Answer, Question, StudentAnswer, Test, TestAttempt, TestResult
+
+
+def get_tests_queryset(queryset, expand=None):
+    """
+    Добавляет к queryset тестов предзагруженные вопросы и варианты ответов.
+
+    expand - раскрываемые связи (см. materials.serializers.get_sparse_params),
+    нераскрытые связи не загружаются.
+    """
+    if expand is None or 'questions' in expand:
+        questions = get_questions_queryset(Question.objects.all(), get_nested_expand(expand, 'questions'))
+        queryset = queryset.prefetch_related(Prefetch('questions', queryset=questions))
+    return queryset
+
+
+def get_questions_queryset(queryset, expand=None):
+    """ Добавляет к queryset вопросов предзагруженные варианты ответов, если они раскрыты (см. get_tests_queryset). """
+    if expand is None or 'answers' in expand:
+        queryset = queryset.prefetch_related('answers')
+    return queryset
+
+
+def get_student_answers_prefetch():
+    """
+    Возвращает предзагрузку ответов студента в попытке результата. Правильность ответов берется
+    из ключа ответов теста (см. tests.answer_keys), поэтому варианты ответа не загружаются.
+    """
+    return Prefetch('attempt__student_answers', queryset=StudentAnswer.objects.order_by('pk'))
+
+
+def get_results_queryset(queryset):
+    """ Добавляет к queryset результатов тест (версию ключа ответов) и попытки с ответами студента. """
+    return queryset.select_related('test', 'attempt').prefetch_related(get_student_answers_prefetch())
+
+
+def get_open_attempt(student_id, test_id):
+    """ Возвращает открытую попытку студента по тесту, при необходимости создает ее. """
+    attempt, _ = TestAttempt.objects.get_or_create(student_id=student_id, test_id=test_id, finished_at__isnull=True)
+    return attempt
+
+
+def finish_attempt(student_id, test_id):
+    """
+    Завершает открытую попытку студента по тесту и возвращает ее. Если попытку одновременно
+    завершил другой запрос, возвращается новая пустая завершенная попытка.
+    """
+    attempt = get_open_attempt(student_id, test_id)
+    attempt.finished_at = timezone.now()
+    if not TestAttempt.objects.filter(pk=attempt.pk, finished_at__isnull=True).update(finished_at=attempt.finished_at):
+        attempt = TestAttempt.objects.create(student_id=student_id, test_id=test_id, finished_at=attempt.finished_at)
+    return attempt
+
+
+def is_async_grading_enabled():
+    """ Результаты оцениваются в фоновой задаче (GRADING_MODE=async). """
+    return settings.GRADING_MODE == 'async'
+
+
+def grade_result(result):
+    """
+    Оценивает новый результат. В асинхронном режиме результат переводится в статус pending,
+    а оценка ставится в очередь grading после фиксации транзакции.
+    """
+    if not is_async_grading_enabled():
+        calculate_score(result)
+        return
+    from tests.tasks import grade_result_task
+
+    if result.status != RESULT_PENDING:
+        result.status = RESULT_PENDING
+        result.save(update_fields=['status'])
+    result_id = result.pk
+    transaction.on_commit(lambda: grade_result_task.delay(result_id))
+
+
+def submit_answers(test, student, answers):
+    """
+    Сохраняет ответы студента на вопросы теста в его попытке, завершает попытку и возвращает результат
+    (оцененный или, в асинхронном режиме, ожидающий оценки - см. grade_result).
+
+    answers - список {'question': id вопроса, 'answer': id варианта ответа}. Принадлежность всех
+    вариантов вопросам теста проверяется одним запросом; несколько ответов на один вопрос отклоняются.
+    Ответы, ранее отправленные по одному на те же вопросы, заменяются. Все выполняется в одной транзакции.
+    """
+    questions = Counter(item['question'] for item in answers)
+    duplicates = sorted(question for question, count in questions.items() if count > 1)
+    if duplicates:
+        raise serializers.ValidationError({'answers': [f'На вопросы {duplicates} дано несколько ответов.']})
+    answer_questions = dict(Answer.objects.filter(pk__in=[item['answer'] for item in answers], question__test=test)
+                            .values_list('pk', 'question_id'))
+    invalid = [item['answer'] for item in answers if answer_questions.get(item['answer']) != item['question']]
+    if invalid:
+        raise serializers.ValidationError(
+            {'answers': [f'Варианты ответа {invalid} не относятся к указанным вопросам теста.']})
+
+    with transaction.atomic():
+        attempt = finish_attempt(student.pk, test.pk)
+        StudentAnswer.objects.filter(attempt=attempt, question_id__in=questions).delete()
+        StudentAnswer.objects.bulk_create(
+            StudentAnswer(student=student, question_id=item['question'], answer_id=item['answer'], attempt=attempt)
+            for item in answers
+        )
+        result = TestResult.objects.create(student=student, test=test, attempt=attempt)
+        grade_result(result)
+    return result
+
+
+# Нижние границы оценок в процентах правильных ответов (от старшей оценки к младшей)
+SCORE_THRESHOLDS = (("a", 90), ("b", 70), ("c", 35), ("d", 0))
+
+
+def get_score(count_right_answers, count_questions):
+    """
+    Возвращает оценку по количеству правильных ответов. Проценты сравниваются в целых числах,
+    чтобы оценка совпадала с вычисленной в базе данных (get_score_expression).
+    """
+    if count_questions <= 0:
+        return "d"
+    if count_right_answers > count_questions:
+        return ""
+    for score, threshold in SCORE_THRESHOLDS:
+        if count_right_answers * 100 >= threshold * count_questions:
+            return score
+    return ""
+
+
+def get_score_expression(count_right_answers, count_questions):
+    """ Возвращает выражение для вычисления оценки в базе данных по тем же правилам, что и get_score. """
+    return Case(
+        When(LessThanOrEqual(count_questions, 0), then=Value("d")),
+        When(GreaterThan(count_right_answers, count_questions), then=Value("")),
+        *(When(GreaterThanOrEqual(count_right_answers * 100, count_questions * threshold), then=Value(score))
+          for score, threshold in SCORE_THRESHOLDS),
+        default=Value(""),
+        output_field=CharField(),
+    )
 
 
 def calculate_score(result):
-    """ Получает итоговую оценку за пройденный тест """
-    test_id = result.test.pk
-    count_questions = Question.objects.filter(test=test_id).count()
-    count_right_answers = StudentAnswer.objects.filter(student=result.student, question__test=test_id,
-                                                       answer__is_correct=True).count()
-
-    percent = (count_right_answers / count_questions * 100) if count_questions > 0 else 0
-    score = ""
-
-    if 0 <= percent < 35:
-        score = "d"
-    elif 35 <= percent < 70:
-        score = "c"
-    elif 70 <= percent < 90:
-        score = "b"
-    elif 90 <= percent <= 100:
-        score = "a"
-
-    result.count_questions = count_questions
-    result.count_right_answers = count_right_answers
-    result.score = score
-    result.save()
+    """
+    Получает итоговую оценку за пройденный тест по ответам попытки результата и отмечает результат оцененным.
+    Версия теста и ответы попытки загружаются одним запросом, правильность ответов проверяется
+    по закешированному ключу ответов теста (см. tests.answer_keys). Сохраняются только изменившиеся поля.
+    """
+    attempt_answers = StudentAnswer.objects.filter(attempt_id=result.attempt_id).order_by("pk")
+    row = Test.objects.filter(pk=result.test_id).values_list(
+        "updated_at",
+        ArraySubquery(attempt_answers.values("question_id")),
+        ArraySubquery(attempt_answers.values("answer_id")),
+    ).first()
+    if row is None:
+        return
+    version, question_ids, answer_ids = row
+    answer_key = get_answer_keys({result.test_id: version})[result.test_id]
+
+    count_questions = len(answer_key)
+    count_right = count_right_answers(answer_key, zip(question_ids, answer_ids))
+    values = {"count_questions": count_questions, "count_right_answers": count_right,
+              "score": get_score(count_right, count_questions), "status": RESULT_GRADED}
+
+    changed = [field for field, value in values.items() if getattr(result, field) != value]
+    for field in changed:
+        setattr(result, field, values[field])
+    if changed:
+        result.save(update_fields=changed)
+
+
+def calculate_scores(results):
+    """
+    Пересчитывает оценки результатов из queryset results одним запросом UPDATE и отмечает их оцененными.
+    Возвращает количество обновленных результатов.
+    """
+    count_questions = Coalesce(Subquery(
+        Question.objects.filter(test_id=OuterRef("test_id")).order_by().values("test_id")
+        .annotate(count=Count("pk")).values("count")
+    ), 0)
+    count_right_answers = Coalesce(Subquery(
+        StudentAnswer.objects.filter(attempt_id=OuterRef("attempt_id"), answer__is_correct=True)
+        .order_by().values("attempt_id")
+        .annotate(count=Count("pk")).values("count")
+    ), 0)
+    return results.update(count_questions=count_questions, count_right_answers=count_right_answers,
+                          score=get_score_expression(count_right_answers, count_questions), status=RESULT_GRADED)
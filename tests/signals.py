@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tests.answer_keys import invalidate_answer_keys
+from tests.models import Test, Question, Answer, StudentAnswer, TestResult
+from tests.services import finish_attempt, get_open_attempt
+
+
+def _touch_tests(test_ids):
+    """ Обновляет дату изменения (версию) тестов и после фиксации транзакции сбрасывает их ключи ответов. """
+    test_ids = test_ids - {None}
+    if test_ids:
+        Test.objects.filter(pk__in=test_ids).update(updated_at=timezone.now())
+        transaction.on_commit(lambda: invalidate_answer_keys(test_ids))
+
+
+@receiver(pre_save, sender=Question)
+def remember_question_test(sender, instance, **kwargs):
+    """ Запоминает тест, к которому вопрос относился до сохранения. """
+    instance._old_test_id = None
+    if instance.pk:
+        instance._old_test_id = Question.objects.filter(pk=instance.pk).values_list('test_id', flat=True).first()
+
+
+@receiver(pre_save, sender=Answer)
+def remember_answer_question(sender, instance, **kwargs):
+    """ Запоминает вопрос, к которому ответ относился до сохранения. """
+    instance._old_question_id = None
+    if instance.pk:
+        answers = Answer.objects.filter(pk=instance.pk)
+        instance._old_question_id = answers.values_list('question_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    """ Обновляет версию теста при изменении его вопросов. """
+    _touch_tests({instance.test_id, getattr(instance, '_old_test_id', None)})
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def answer_changed(sender, instance, **kwargs):
+    """ Обновляет версию теста при изменении вариантов ответа. """
+    question_ids = {instance.question_id, getattr(instance, '_old_question_id', None)} - {None}
+    _touch_tests(set(Question.objects.filter(pk__in=question_ids).values_list('test_id', flat=True)))
+
+
+@receiver(pre_save, sender=StudentAnswer)
+def assign_answer_attempt(sender, instance, **kwargs):
+    """ Относит новый ответ студента к его открытой попытке по тесту вопроса. """
+    if instance.attempt_id is None:
+        instance.attempt = get_open_attempt(instance.student_id, instance.question.test_id)
+
+
+@receiver(pre_save, sender=TestResult)
+def assign_result_attempt(sender, instance, **kwargs):
+    """ Завершает открытую попытку студента по тесту и относит к ней новый результат. """
+    if instance.attempt_id is None:
+        instance.attempt = finish_attempt(instance.student_id, instance.test_id)
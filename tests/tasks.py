@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.utils import timezone
+
+from tests.models import RESULT_PENDING, TestResult
+from tests.services import calculate_score, calculate_scores
+
+# Результаты, ожидающие оценки дольше этого времени, оцениваются периодической задачей
+# (например, если сообщение задачи потеряно при перезапуске брокера)
+PENDING_RESULT_TIMEOUT = timedelta(minutes=5)
+
+
+@shared_task
+def grade_result_task(result_id):
+    """ Оценивает результат теста, созданный в асинхронном режиме (см. tests.services.grade_result). """
+    result = TestResult.objects.filter(pk=result_id).first()
+    if result is not None:
+        calculate_score(result)
+
+
+@shared_task
+def grade_pending_results():
+    """ Оценивает одним запросом результаты, которые ожидают оценки дольше PENDING_RESULT_TIMEOUT. """
+    results = TestResult.objects.filter(status=RESULT_PENDING, completed_at__lt=timezone.now() - PENDING_RESULT_TIMEOUT)
+    return calculate_scores(results)
@@ -1,8 +1,20 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Value
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 from materials.models import Course
-from tests.models import Test, Question, Answer, StudentAnswer, TestResult
+from tests.answer_keys import count_right_answers, get_answer_key, invalidate_answer_keys, local_answer_keys
+from tests.models import Test, Question, Answer, StudentAnswer, TestAttempt, TestResult
+from tests.services import calculate_score, calculate_scores, get_score, get_score_expression
+from tests.tasks import grade_pending_results, grade_result_task
 from users.models import User
 
 
@@ -58,6 +70,29 @@ class TestTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['title'], 'Test')
 
+    def test_retrieve_test_without_questions(self):
+        """ Проверяем просмотр теста без раскрытия вопросов. """
+
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('tests:test-detail', args=(self.test.pk,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'fields': 'id,title'})
+        self.assertEqual(response.json(), {'id': self.test.pk, 'title': 'Test'})
+
+    def test_retrieve_test_modified_by_answer(self):
+        """ Проверяем смену ETag теста при изменении варианта ответа. """
+
+        self.client.force_authenticate(user=self.student)
+        url = reverse('tests:test-detail', args=(self.test.pk,))
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.answer.text = 'Test Answer Update'
+        self.answer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_test_update(self):
         """ Проверяем обновление теста преподавателем. """
 
@@ -225,7 +260,7 @@ class AnswerTestCase(APITestCase):
 
         self.client.force_authenticate(user=self.teacher)
         url = reverse('tests:answer-list')
-        data = {'text': 'Крипта', 'question': self.test.pk}
+        data = {'text': 'Крипта', 'question': self.question.pk}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.json(), {'non_field_errors': ['Использованы запрещенные слова']})
@@ -340,3 +375,387 @@ class TestResultTestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.json(), {'detail': 'У вас нет доступа к этому результату.'})
+
+    def test_result_list_cursor_pagination(self):
+        """ Проверяем, что результаты без параметра пагинации возвращаются списком, а с ним - постранично. """
+
+        TestResult.objects.create(test=self.test, student=self.student)
+        self.client.force_authenticate(user=self.student)
+        url = reverse('tests:results')
+
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get(url, {'pagination': 'cursor', 'page_size': 1})
+        data = response.json()
+        self.assertEqual(data['results'][0]['id'], self.result.pk)
+        self.assertIsNotNone(data['next'])
+
+
+class ScoreTestCase(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.student2 = User.objects.create(email='student2@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.test = Test.objects.create(title='Test', course=self.course, owner=self.teacher)
+        self.questions = []
+        for i in range(4):
+            question = Question.objects.create(text=f'Question {i}', test=self.test, owner=self.teacher)
+            right = Answer.objects.create(text='Right', is_correct=True, question=question, owner=self.teacher)
+            wrong = Answer.objects.create(text='Wrong', question=question, owner=self.teacher)
+            self.questions.append((question, right, wrong))
+        # Первый студент отвечает правильно на 3 вопроса из 4, второй - на 1
+        for i, (question, right, wrong) in enumerate(self.questions):
+            StudentAnswer.objects.create(student=self.student, question=question, answer=right if i < 3 else wrong)
+            StudentAnswer.objects.create(student=self.student2, question=question, answer=right if i < 1 else wrong)
+
+    def test_get_score(self):
+        """ Проверяем границы оценок. """
+
+        self.assertEqual(get_score(0, 0), 'd')
+        self.assertEqual(get_score(5, 15), 'd')
+        self.assertEqual(get_score(7, 20), 'c')
+        self.assertEqual(get_score(7, 10), 'b')
+        self.assertEqual(get_score(63, 70), 'a')
+        self.assertEqual(get_score(10, 10), 'a')
+        self.assertEqual(get_score(11, 10), '')
+
+    def test_calculate_score(self):
+        """ Проверяем, что оценка вычисляется одним запросом и сохраняются только изменившиеся поля. """
+
+        result = TestResult.objects.create(test=self.test, student=self.student)
+        # Первая оценка строит ключ ответов теста
+        with self.assertNumQueries(3) as context:
+            calculate_score(result)
+        update = context.captured_queries[2]['sql']
+        self.assertNotIn('completed_at', update)
+
+        result.refresh_from_db()
+        self.assertEqual((result.count_questions, result.count_right_answers, result.score), (4, 3, 'b'))
+
+        # Повторная оценка без изменений ничего не записывает
+        with self.assertNumQueries(1):
+            calculate_score(result)
+
+    def test_calculate_scores(self):
+        """ Проверяем пересчет оценок нескольких результатов одним запросом и совпадение с calculate_score. """
+
+        results = [TestResult.objects.create(test=self.test, student=student)
+                   for student in (self.student, self.student2)]
+        with self.assertNumQueries(1):
+            self.assertEqual(calculate_scores(TestResult.objects.all()), 2)
+
+        expected = {}
+        for result in results:
+            calculate_score(result)
+            expected[result.pk] = (result.count_questions, result.count_right_answers, result.score)
+        graded = {result.pk: (result.count_questions, result.count_right_answers, result.score)
+                  for result in TestResult.objects.all()}
+        self.assertEqual(graded, expected)
+        self.assertEqual(graded[results[1].pk], (4, 1, 'd'))
+
+    def test_score_expression_matches_get_score(self):
+        """ Проверяем, что оценка в базе данных совпадает с get_score для любых соотношений. """
+
+        pairs = [(right, questions) for questions in range(0, 21) for right in range(0, questions + 2)]
+        expressions = {f'score_{right}_{questions}': get_score_expression(Value(right), Value(questions))
+                       for right, questions in pairs}
+        TestResult.objects.create(test=self.test, student=self.student)
+        row = TestResult.objects.annotate(**expressions).values(*expressions).first()
+        for right, questions in pairs:
+            self.assertEqual(row[f'score_{right}_{questions}'], get_score(right, questions), (right, questions))
+
+
+class TestAttemptTestCase(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.test = Test.objects.create(title='Test', course=self.course, owner=self.teacher)
+        self.other_test = Test.objects.create(title='Other Test', course=self.course, owner=self.teacher)
+        self.questions = []
+        for test in (self.test, self.test, self.other_test):
+            question = Question.objects.create(text='Question', test=test, owner=self.teacher)
+            right = Answer.objects.create(text='Right', is_correct=True, question=question, owner=self.teacher)
+            wrong = Answer.objects.create(text='Wrong', question=question, owner=self.teacher)
+            self.questions.append((question, right, wrong))
+
+    def answer(self, question, answer):
+        url = reverse('tests:student-answer-create')
+        return self.client.post(url, {'question': question.pk, 'answer': answer.pk})
+
+    def finish(self, test):
+        return self.client.post(reverse('tests:results'), {'test': test.pk})
+
+    def test_attempts(self):
+        """ Проверяем, что ответы относятся к открытой попытке, а результат оценивает только ее ответы. """
+
+        self.client.force_authenticate(user=self.student)
+        (question, right, wrong), (question2, right2, _), (other_question, other_right, _) = self.questions
+        first = self.answer(question, right).json()['attempt']
+        self.assertEqual(self.answer(question2, right2).json()['attempt'], first)
+        self.assertNotEqual(self.answer(other_question, other_right).json()['attempt'], first)
+
+        response = self.finish(self.test)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data['attempt'], first)
+        self.assertEqual((data['count_right_answers'], data['score']), (2, 'a'))
+        self.assertEqual([answer['question'] for answer in data['student_answers']], [question.pk, question2.pk])
+
+        # Вторая попытка: правильные ответы первой попытки не учитываются
+        second = self.answer(question, wrong).json()['attempt']
+        self.assertNotEqual(second, first)
+        data = self.finish(self.test).json()
+        self.assertEqual((data['attempt'], data['count_right_answers'], data['score']), (second, 0, 'd'))
+        self.assertEqual(len(data['student_answers']), 1)
+
+        self.assertEqual(TestAttempt.objects.filter(pk__in=(first, second), finished_at__isnull=False).count(), 2)
+        self.assertTrue(TestAttempt.objects.filter(test=self.other_test, finished_at__isnull=True).exists())
+
+    def test_result_without_answers(self):
+        """ Проверяем получение результата без ответов: создается пустая завершенная попытка. """
+
+        self.client.force_authenticate(user=self.student)
+        data = self.finish(self.test).json()
+        self.assertEqual((data['count_right_answers'], data['student_answers']), (0, []))
+        self.assertIsNotNone(TestAttempt.objects.get(pk=data['attempt']).finished_at)
+
+    def test_result_queries_do_not_depend_on_history(self):
+        """ Проверяем, что просмотр результата и список результатов не зависят от количества прошлых попыток. """
+
+        self.client.force_authenticate(user=self.student)
+        question, right, _ = self.questions[0]
+
+        def query_counts():
+            self.answer(question, right)
+            result = self.finish(self.test).json()['id']
+            with CaptureQueriesContext(connection) as detail:
+                self.client.get(reverse('tests:results-detail', args=(result,)))
+            with CaptureQueriesContext(connection) as results:
+                self.client.get(reverse('tests:results'))
+            return len(detail), len(results)
+
+        counts = query_counts()
+        for _ in range(3):
+            self.assertEqual(query_counts(), counts)
+        response = self.client.get(reverse('tests:results-detail', args=(TestResult.objects.last().pk,)))
+        self.assertEqual(len(response.json()['student_answers']), 1)
+
+
+class TestSubmitTestCase(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.test = Test.objects.create(title='Test', course=self.course, owner=self.teacher)
+        self.other_test = Test.objects.create(title='Other Test', course=self.course, owner=self.teacher)
+        self.questions = [self.create_question(self.test) for _ in range(10)]
+        self.other_question = self.create_question(self.other_test)
+        self.url = reverse('tests:test-submit', args=(self.test.pk,))
+
+    def create_question(self, test):
+        question = Question.objects.create(text='Question', test=test, owner=self.teacher)
+        right = Answer.objects.create(text='Right', is_correct=True, question=question, owner=self.teacher)
+        wrong = Answer.objects.create(text='Wrong', question=question, owner=self.teacher)
+        return question, right, wrong
+
+    def get_answers(self, count, right):
+        return [{'question': question.pk, 'answer': (answers[0] if i < right else answers[1]).pk}
+                for i, (question, *answers) in enumerate(self.questions[:count])]
+
+    def test_submit(self):
+        """ Проверяем отправку всех ответов теста одним запросом: ответы сохраняются, результат оценивается. """
+
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post(self.url, {'answers': self.get_answers(10, right=8)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual((data['count_questions'], data['count_right_answers'], data['score']), (10, 8, 'b'))
+        self.assertEqual(len(data['student_answers']), 10)
+        self.assertEqual(StudentAnswer.objects.filter(attempt=data['attempt']).count(), 10)
+        self.assertIsNotNone(TestAttempt.objects.get(pk=data['attempt']).finished_at)
+
+    def test_submit_query_count(self):
+        """ Проверяем, что количество запросов не зависит от количества ответов. """
+
+        self.client.force_authenticate(user=self.student)
+        # Ключ ответов теста строится при первой оценке
+        self.client.post(self.url, {'answers': self.get_answers(1, right=1)}, format='json')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, {'answers': self.get_answers(2, right=1)}, format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, {'answers': self.get_answers(10, right=5)}, format='json')
+        self.assertEqual(len(large), len(small))
+
+    def test_submit_replaces_previous_answers(self):
+        """ Проверяем, что ответы открытой попытки на те же вопросы заменяются, а на другие - учитываются. """
+
+        self.client.force_authenticate(user=self.student)
+        (question, right, wrong), (question2, right2, _) = self.questions[:2]
+        StudentAnswer.objects.create(student=self.student, question=question, answer=wrong)
+        StudentAnswer.objects.create(student=self.student, question=question2, answer=right2)
+
+        response = self.client.post(self.url, {'answers': [{'question': question.pk, 'answer': right.pk}]},
+                                    format='json')
+        data = response.json()
+        self.assertEqual(data['count_right_answers'], 2)
+        self.assertEqual(sorted(answer['answer'] for answer in data['student_answers']), [right.pk, right2.pk])
+
+    def test_submit_invalid_answers(self):
+        """ Проверяем отклонение повторных ответов и вариантов, не относящихся к вопросам теста. """
+
+        self.client.force_authenticate(user=self.student)
+        (question, right, wrong), (question2, right2, _) = self.questions[:2]
+        other_question, other_right, _ = self.other_question
+        invalid = {
+            'duplicate': [{'question': question.pk, 'answer': right.pk}, {'question': question.pk, 'answer': wrong.pk}],
+            'other question': [{'question': question.pk, 'answer': right2.pk}],
+            'other test': [{'question': other_question.pk, 'answer': other_right.pk}],
+            'empty': [],
+        }
+        for name, answers in invalid.items():
+            with self.subTest(name):
+                response = self.client.post(self.url, {'answers': answers}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn('answers', response.json())
+        self.assertFalse(StudentAnswer.objects.exists())
+        self.assertFalse(TestResult.objects.exists())
+
+    def test_submit_teacher(self):
+        """ Проверяем, что преподаватель не может отправлять ответы. """
+
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.post(self.url, {'answers': self.get_answers(1, right=1)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AsyncGradingTestCase(APITestCase):
+
+    def setUp(self):
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.test = Test.objects.create(title='Test', course=self.course, owner=self.teacher)
+        self.question = Question.objects.create(text='Question', test=self.test, owner=self.teacher)
+        self.right = Answer.objects.create(text='Right', is_correct=True, question=self.question, owner=self.teacher)
+        self.client.force_authenticate(user=self.student)
+
+    def test_sync_grading(self):
+        """ Проверяем, что по умолчанию результат оценивается сразу. """
+
+        response = self.client.post(reverse('tests:results'), {'test': self.test.pk})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.json()['status'], response.json()['score']), ('graded', 'd'))
+
+    @override_settings(GRADING_MODE='async')
+    @patch('tests.tasks.grade_result_task.delay')
+    def test_async_grading(self, mock_delay):
+        """ Проверяем, что в асинхронном режиме результат ожидает оценки, а задача ставится после фиксации. """
+
+        url = reverse('tests:test-submit', args=(self.test.pk,))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'answers': [{'question': self.question.pk, 'answer': self.right.pk}]},
+                                        format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        data = response.json()
+        self.assertEqual((data['status'], data['score']), ('pending', ''))
+        mock_delay.assert_called_once_with(data['id'])
+
+        grade_result_task(data['id'])
+        response = self.client.get(reverse('tests:results-detail', args=(data['id'],)))
+        self.assertEqual((response.json()['status'], response.json()['score']), ('graded', 'a'))
+
+    @override_settings(GRADING_MODE='async')
+    @patch('tests.tasks.grade_result_task.delay')
+    def test_grade_pending_results(self, mock_delay):
+        """ Проверяем, что периодическая задача оценивает только давно ожидающие результаты. """
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('tests:results'), {'test': self.test.pk})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        recent = TestResult.objects.create(test=self.test, student=self.student, status='pending')
+        # Результат, созданный без grade_result (например, в админке), периодическая задача не оценивает
+        other = TestResult.objects.create(test=self.test, student=self.student)
+        stale = TestResult.objects.get(pk=response.json()['id'])
+        TestResult.objects.filter(pk__in=[stale.pk, other.pk]).update(completed_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(other.status, 'graded')
+        self.assertEqual(grade_pending_results(), 1)
+        self.assertEqual(TestResult.objects.get(pk=stale.pk).status, 'graded')
+        self.assertEqual(TestResult.objects.get(pk=recent.pk).status, 'pending')
+
+
+class AnswerKeyTestCase(APITestCase):
+
+    def setUp(self):
+        local_answer_keys.clear()
+        self.teacher = User.objects.create(email='teacher@example.com', role='teacher')
+        self.student = User.objects.create(email='student@example.com', role='student')
+        self.course = Course.objects.create(title='Test Course', description='Test Course', owner=self.teacher)
+        self.test = Test.objects.create(title='Test', course=self.course, owner=self.teacher)
+        self.question = Question.objects.create(text='Question', test=self.test, owner=self.teacher)
+        self.right = Answer.objects.create(text='Right', is_correct=True, question=self.question, owner=self.teacher)
+        self.wrong = Answer.objects.create(text='Wrong', question=self.question, owner=self.teacher)
+        self.empty_question = Question.objects.create(text='Question', test=self.test, owner=self.teacher)
+
+    def get_key(self):
+        self.test.refresh_from_db()
+        return get_answer_key(self.test)
+
+    def test_answer_key(self):
+        """ Проверяем содержимое ключа ответов и то, что повторно он берется из памяти процесса. """
+
+        # Версия теста и построение ключа
+        with self.assertNumQueries(2):
+            key = self.get_key()
+        self.assertEqual(key, {self.question.pk: frozenset({self.right.pk}), self.empty_question.pk: frozenset()})
+        self.assertEqual(count_right_answers(key, [(self.question.pk, self.right.pk),
+                                                   (self.question.pk, self.wrong.pk),
+                                                   (self.empty_question.pk, self.wrong.pk)]), 1)
+        # Только версия теста
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_key(), key)
+
+    def test_answer_change_invalidates_key(self):
+        """ Проверяем, что после изменения варианта ответа ключ строится заново (новая версия теста). """
+
+        self.get_key()
+        self.wrong.is_correct = True
+        self.wrong.save()
+        self.assertEqual(self.get_key()[self.question.pk], frozenset({self.right.pk, self.wrong.pk}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.delete()
+        self.assertNotIn(self.question.pk, self.get_key())
+
+    @override_settings(CACHE_ENABLED=True,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_cache(self):
+        """ Проверяем, что ключ, построенный другим процессом, берется из общего кеша, а сбрасывается в обоих. """
+
+        cache.clear()
+        key = self.get_key()
+        local_answer_keys.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_answer_key(self.test), key)
+
+        invalidate_answer_keys({self.test.pk})
+        with self.assertNumQueries(1):
+            get_answer_key(self.test)
+
+    def test_result_detail_without_answer_queries(self):
+        """ Проверяем, что правильность ответов в результате определяется по ключу, без загрузки вариантов. """
+
+        StudentAnswer.objects.create(student=self.student, question=self.question, answer=self.right)
+        result = TestResult.objects.create(test=self.test, student=self.student)
+        calculate_score(result)
+        self.client.force_authenticate(user=self.student)
+        url = reverse('tests:results-detail', args=(result.pk,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.json()['student_answers'][0]['is_correct'], True)
@@ -1,12 +1,27 @@
-from rest_framework import generics, viewsets
+import hashlib
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import generics, status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from materials.pagination import MyPagination
-from tests.models import Test, Question, Answer, StudentAnswer, TestResult
+from materials.pagination import SwitchablePagination, CursorOnlySwitchablePagination
+from materials.serializers import get_sparse_params
+from tests.answer_keys import get_answer_keys
+from tests.models import RESULT_PENDING, Test, Question, Answer, StudentAnswer, TestResult
 from tests.serializers import TestSerializer, QuestionSerializer, AnswerSerializer, StudentAnswerSerializer, \
-    TestResultSerializer
+    TestResultSerializer, TestSubmitSerializer
 from users.permissions import IsAdmin, IsTeacher, IsStudent
-from tests.services import calculate_score
+from tests.services import grade_result, get_questions_queryset, get_results_queryset, get_student_answers_prefetch, \
+    get_tests_queryset, submit_answers
+
+
+def get_result_status_code(result):
+    """ Код ответа на создание результата: 202, если результат еще ожидает оценки (клиент опрашивает его). """
+    return status.HTTP_202_ACCEPTED if result.status == RESULT_PENDING else status.HTTP_201_CREATED
 
 
 class CustomModelViewSet(viewsets.ModelViewSet):
@@ -15,10 +30,23 @@ class CustomModelViewSet(viewsets.ModelViewSet):
 
         При создании ресурса автоматически присваивается текущий пользователь как его владелец.
         Разрешения для различных действий зависят от роли пользователя:
-        - Для создания, обновления и удаления требуется роль администратора или учителя.
+        - Для создания, обновления, удаления и других действий из manage_actions требуется роль администратора
+          или учителя.
         - Для просмотра списка и отдельного объекта — роль администратора, студента или учителя.
     """
 
+    # Поля модели, по которым вычисляется версия объекта для условных GET-запросов (первое - дата изменения).
+    # Если не заданы, retrieve всегда возвращает объект целиком.
+    version_fields = None
+    # Отвечать ли на If-Modified-Since: отключается, если версия включает данные, не влияющие на дату изменения
+    use_last_modified = True
+    # Версия объекта, полученная в retrieve (доступна в retrieve_object)
+    object_version = None
+    # Действия, доступные администраторам и преподавателям
+    manage_actions = ('create', 'update', 'partial_update', 'destroy')
+    # Действия, доступные только студентам
+    student_actions = ()
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
@@ -29,19 +57,86 @@ class CustomModelViewSet(viewsets.ModelViewSet):
         if not self.request.user.role:
             raise PermissionDenied("У вас нет доступа к этому ресурсу.")
 
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action in self.manage_actions:
             self.permission_classes = [IsAdmin | IsTeacher]
+        elif self.action in self.student_actions:
+            self.permission_classes = [IsStudent]
         elif self.action in ['list', 'retrieve']:
             self.permission_classes = [IsAdmin | IsStudent | IsTeacher]
         return super().get_permissions()
 
+    def get_version_queryset(self):
+        """ Возвращает queryset для проверки версии объекта (без предзагрузки связанных объектов). """
+        return self.get_queryset().prefetch_related(None)
+
+    def get_object_version(self):
+        """ Возвращает версию объекта одним легким запросом или None, если объект не найден. """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_version_queryset())
+        queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset.values_list(*self.version_fields).first()
+
+    def get_version_headers(self, version):
+        """ Формирует заголовки ETag и Last-Modified по версии объекта и параметрам запроса. """
+        etag = hashlib.md5(f'{version}:{self.request.get_full_path()}'.encode()).hexdigest()
+        headers = {'ETag': f'"{etag}"'}
+        if self.use_last_modified:
+            headers['Last-Modified'] = http_date(version[0].timestamp())
+        return headers
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает объект с заголовками ETag / Last-Modified.
+        Если объект не изменился с версии, известной клиенту (If-None-Match / If-Modified-Since),
+        отвечает 304 без загрузки и сериализации объекта.
+        """
+        version = self.get_object_version() if self.version_fields else None
+        self.object_version = version
+        if version is None:
+            return self.retrieve_object(request, *args, **kwargs)
+
+        headers = self.get_version_headers(version)
+        last_modified = int(version[0].timestamp()) if self.use_last_modified else None
+        response = get_conditional_response(request, etag=headers['ETag'], last_modified=last_modified)
+        if response is None:
+            response = self.retrieve_object(request, *args, **kwargs)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def retrieve_object(self, request, *args, **kwargs):
+        """ Загружает и сериализует объект для ответа на retrieve. """
+        return super().retrieve(request, *args, **kwargs)
+
 
 class TestViewSet(CustomModelViewSet):
     """ ViewSet для модели Test. """
 
     queryset = Test.objects.all()
     serializer_class = TestSerializer
-    pagination_class = MyPagination
+    pagination_class = SwitchablePagination
+    version_fields = ('updated_at',)
+    student_actions = ('submit',)
+
+    def get_queryset(self):
+        """ Возвращает тесты с предзагруженными вопросами и ответами в объеме, запрошенном клиентом. """
+        if self.action == 'submit':
+            return Test.objects.all()
+        _, expand = get_sparse_params(self.request)
+        return get_tests_queryset(Test.objects.all(), expand)
+
+    @action(detail=True, methods=['post'], serializer_class=TestSubmitSerializer)
+    def submit(self, request, *args, **kwargs):
+        """
+        Принимает ответы студента на вопросы теста одним запросом ({"answers": [{"question": id, "answer": id}]}),
+        оценивает попытку и возвращает результат.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = submit_answers(self.get_object(), request.user, serializer.validated_data['answers'])
+        prefetch_related_objects([result], get_student_answers_prefetch())
+        return Response(TestResultSerializer(result, context=self.get_serializer_context()).data,
+                        status=get_result_status_code(result))
 
 
 class QuestionViewSet(CustomModelViewSet):
@@ -50,6 +145,11 @@ class QuestionViewSet(CustomModelViewSet):
     queryset = Question.objects.all()
     serializer_class = QuestionSerializer
 
+    def get_queryset(self):
+        """ Возвращает вопросы с предзагруженными вариантами ответов, если клиент их запросил. """
+        _, expand = get_sparse_params(self.request)
+        return get_questions_queryset(Question.objects.all(), expand)
+
 
 class AnswerViewSet(CustomModelViewSet):
     """ ViewSet для модели Answer. """
@@ -79,6 +179,7 @@ class TestResultListCreateAPIView(generics.ListCreateAPIView):
 
     queryset = TestResult.objects.all()
     serializer_class = TestResultSerializer
+    pagination_class = CursorOnlySwitchablePagination
 
     def get_permissions(self):
         if self.request.user.is_anonymous:
@@ -97,17 +198,40 @@ class TestResultListCreateAPIView(generics.ListCreateAPIView):
     def get_queryset(self):
         """ Определяет доступ к получению queryset в зависимости от роли пользователя. """
         if self.request.user.role == "admin":
-            return TestResult.objects.all()
+            queryset = TestResult.objects.all()
         elif self.request.user.role == "student":
-            return TestResult.objects.filter(student=self.request.user)
+            queryset = TestResult.objects.filter(student=self.request.user)
         elif self.request.user.role == "teacher":
-            return TestResult.objects.filter(test__owner=self.request.user)
-        return TestResult.objects.none()
-
+            queryset = TestResult.objects.filter(test__owner=self.request.user)
+        else:
+            return TestResult.objects.none()
+        return get_results_queryset(queryset)
+
+    def get_serializer(self, *args, **kwargs):
+        """ Для списка результатов ключи ответов всех тестов страницы загружаются сразу (см. tests.answer_keys). """
+        if kwargs.get('many'):
+            results = list(args[0])
+            kwargs['context'] = {**self.get_serializer_context(),
+                                 'answer_keys': get_answer_keys({result.test_id: result.test.updated_at
+                                                                 for result in results})}
+            args = (results, *args[1:])
+        return super().get_serializer(*args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = get_result_status_code(self.created_result)
+        return response
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        """ При создании результата теста вычисляется оценка. """
+        """
+        При создании результата теста завершается открытая попытка студента и вычисляется оценка
+        (в асинхронном режиме - ставится в очередь, см. tests.services.grade_result).
+        """
         result = serializer.save(student=self.request.user)
-        calculate_score(result)
+        grade_result(result)
+        prefetch_related_objects([result], get_student_answers_prefetch())
+        self.created_result = result
 
 
 class TestResultDetailAPIView(generics.RetrieveAPIView):
@@ -116,6 +240,9 @@ class TestResultDetailAPIView(generics.RetrieveAPIView):
     queryset = TestResult.objects.all()
     serializer_class = TestResultSerializer
 
+    def get_queryset(self):
+        return get_results_queryset(TestResult.objects.select_related('test'))
+
     def get_permissions(self):
         """ Определяет разрешения для GET-запроса в зависимости от роли пользователя. """
         if self.request.method == 'GET':
@@ -131,12 +258,12 @@ class TestResultDetailAPIView(generics.RetrieveAPIView):
 
         # Проверка доступа для студента
         if self.request.user.role == "student":
-            if result.student != self.request.user:
+            if result.student_id != self.request.user.pk:
                 raise PermissionDenied("У вас нет доступа к этому результату.")
 
         # Проверка доступа для преподавателя (он может смотреть только результаты тестов, которые он создал)
         elif self.request.user.role == "teacher":
-            if result.test.owner != self.request.user:
+            if result.test.owner_id != self.request.user.pk:
                 raise PermissionDenied("У вас нет доступа к этому результату.")
 
         # Администратор может просматривать все результаты
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_derivatives',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Уменьшенные копии аватара'),
+        ),
+    ]
@@ -17,6 +17,7 @@ class User(AbstractUser):
     first_name = models.CharField(max_length=50, verbose_name="Имя", **NULLABLE)
     last_name = models.CharField(max_length=50, verbose_name="Фамилия", **NULLABLE)
     avatar = models.ImageField(upload_to="users/avatars", verbose_name="Аватар", **NULLABLE)
+    avatar_derivatives = models.JSONField(editable=False, verbose_name="Уменьшенные копии аватара", **NULLABLE)
 
     role = models.CharField(choices=ROLES, verbose_name="Роль", **NULLABLE)
 
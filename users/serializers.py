@@ -2,15 +2,18 @@ from users.models import User
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import serializers
 
+from materials.serializers import ImageDerivativesField
 from users.validators import AdminRequiredValidator
 
 
 class UserSerializer(serializers.ModelSerializer):
     """ Serializer, используемый для отображения информации о пользователе. """
 
+    avatar_thumbnails = ImageDerivativesField('avatar')
+
     class Meta:
         model = User
-        fields = ('id', 'email', 'first_name', 'last_name', 'role', 'phone', 'avatar')
+        fields = ('id', 'email', 'first_name', 'last_name', 'role', 'phone', 'avatar', 'avatar_thumbnails')
         read_only_fields = ('role',)
 
 
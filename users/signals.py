@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from materials.images import schedule_derivatives
+from users.models import User
+
+
+@receiver(post_save, sender=User)
+def avatar_changed(sender, instance, **kwargs):
+    """ Ставит в очередь создание уменьшенных копий нового аватара. """
+    schedule_derivatives(instance, 'avatar')